@@ -0,0 +1,53 @@
+"""
+Compression timings of a large JSON-LD forecast per encoding, against a hit
+of the compressed response cache.
+
+Run from the repository root with `python -m benchmarks.compression`.
+"""
+
+import json
+import time
+
+from src.api.compression import ENCODERS, CompressedCache
+
+
+def linked_data(entries):
+    return {
+        "@context": {"@vocab": "https://w3id.org/ocsm/main-context.jsonld"},
+        "@graph": [
+            {
+                "@id": f"urn:openagri:weather:forecast:{i}",
+                "@type": "WeatherForecast",
+                "observedProperty": "urn:openagri:airTemperature",
+                "hasResult": {"numericValue": 20 + i % 7, "unit": "http://qudt.org/vocab/unit/DEG_C"},
+            }
+            for i in range(entries)
+        ],
+    }
+
+
+def main():
+    body = json.dumps(linked_data(entries=2000)).encode()
+    rounds = 50
+
+    timings = {}
+    for encoding, (encode, _) in ENCODERS.items():
+        started = time.perf_counter()
+        for _ in range(rounds):
+            compressed = encode(body)
+        timings[encoding] = (time.perf_counter() - started) / rounds, len(compressed)
+
+    cache = CompressedCache(size=8)
+    cache.put('"hot"', "gzip", ENCODERS["gzip"][0](body))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        cache.get('"hot"', "gzip")
+    cached = (time.perf_counter() - started) / rounds
+
+    print(f"JSON-LD response of {len(body)} bytes: " + ", ".join(
+        f"{encoding} {seconds * 1e3:.2f}ms -> {size} bytes" for encoding, (seconds, size) in timings.items()
+    ) + f", cached {cached * 1e6:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
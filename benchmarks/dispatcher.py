@@ -0,0 +1,44 @@
+"""
+Reconcile and tick timings of the parcel time wheel with 10k parcels.
+
+Run from the repository root with `python -m benchmarks.dispatcher`.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from src import scheduler
+from src.core import config
+from src.services.time_wheel import TimeWheel
+
+
+def parcels(n):
+    return [
+        {"lat": round(30 + i / 1000, 3), "lon": 21.0, "farm_name": "Farm", "identifier": f"parcel-{i}"}
+        for i in range(n)
+    ]
+
+
+def main():
+    config.PUSH_THI_TO_FARMCALENDAR = config.PUSH_SPRAY_F_TO_FARMCALENDAR = "true"
+    wheel = TimeWheel()
+
+    started = time.perf_counter()
+    wheel.reconcile(scheduler.desired_parcel_jobs(parcels(10_000)))
+    first = time.perf_counter() - started
+
+    started = time.perf_counter()
+    wheel.reconcile(scheduler.desired_parcel_jobs(parcels(10_000)))
+    second = time.perf_counter() - started
+    runs = len(wheel)
+
+    started = time.perf_counter()
+    due = wheel.pop_due(datetime.now(timezone.utc) + timedelta(minutes=1))
+    tick = time.perf_counter() - started
+
+    print(f"Reconcile {runs} parcel runs: initial {first:.3f}s, unchanged refresh {second:.3f}s, "
+          f"tick with {len(due)} due {tick * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Serialization timings of a 16-day hourly forecast, through FastAPI's
+response_model and through model_response.
+
+Run from the repository root with `python -m benchmarks.forecast`.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.api.responses import model_response
+from src.schemas.history_data import HourlyObservationOut, HourlyResponse
+
+
+LOCATION = {"lat": 38.25, "lon": 21.74}
+
+
+def hourly_observations(days, variables=10):
+    start = datetime(2025, 6, 1)
+    return [
+        HourlyObservationOut.model_construct(
+            timestamp=start + timedelta(hours=i),
+            values={f"variable_{v}": i * 0.1 + v for v in range(variables)},
+        )
+        for i in range(days * 24)
+    ]
+
+
+async def main():
+    observations = hourly_observations(days=16)
+    field = create_response_field(name="response", type_=HourlyResponse)
+    rounds = 50
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        content = HourlyResponse(location=LOCATION, data=observations, source="open-meteo")
+        JSONResponse(await serialize_response(field=field, response_content=content))
+    validated = (time.perf_counter() - started) / rounds
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        body = model_response(
+            HourlyResponse.model_construct(location=LOCATION, data=observations, source="open-meteo")
+        ).body
+    trusted = (time.perf_counter() - started) / rounds
+
+    print(f"16-day hourly response ({len(body)} bytes): "
+          f"response_model {validated * 1e3:.2f}ms, model_response {trusted * 1e3:.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
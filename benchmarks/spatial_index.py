@@ -0,0 +1,38 @@
+"""
+Build and nearest lookup timings of the in-memory spatial index.
+
+Run from the repository root with `python -m benchmarks.spatial_index`.
+"""
+
+import random
+import time
+
+from src.core.spatial_index import SpatialIndex
+
+
+def random_points(n, seed=42):
+    rng = random.Random(seed)
+    return {str(i): (rng.uniform(-89.9, 89.9), rng.uniform(-180, 180)) for i in range(n)}
+
+
+def main():
+    for size in (10_000, 100_000):
+        points = random_points(size)
+        index = SpatialIndex(cell_degrees=0.1)
+
+        started = time.perf_counter()
+        for pid, (lat, lon) in points.items():
+            index.add(pid, lat, lon)
+        build = time.perf_counter() - started
+
+        queries = list(points.values())[:1_000]
+        started = time.perf_counter()
+        for lat, lon in queries:
+            index.nearest(lat, lon, 10_000)
+        lookup = (time.perf_counter() - started) / len(queries)
+
+        print(f"{size} locations: build {build:.3f}s, nearest lookup {lookup * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
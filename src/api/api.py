@@ -1,15 +1,22 @@
 import logging
-from typing import Annotated, List
+from datetime import datetime, timedelta
+from typing import Annotated, Dict, List
 
-from fastapi import APIRouter, Depends, Query, Request, HTTPException
+from fastapi import APIRouter, Depends, Query, Request, Response, HTTPException
 
+from src.api.caching import cache_control, remaining_ttl
 from src.api.deps import authenticate_request
+from src.api.responses import model_response
+from src.core import config
+from src.core.dao import PREDICTIONS_CACHE_TIME
 
 from src.ocsm.base import JSONLDGraph
+from src.schemas.batch import BatchQuery, BatchResponse
 from src.schemas.prediction import PredictionOut
 from src.schemas.spray import SprayForecastResponse
 from src.schemas.uav import FlightStatusForecastResponse
 from src.schemas.weather_data import THIDataOut, WeatherDataOut
+from src.services import batch_forecast
 
 
 logger = logging.getLogger(__name__)
@@ -17,6 +24,16 @@ logger = logging.getLogger(__name__)
 data_router = APIRouter()
 
 
+# Cache-Control of a response built from cached documents, until the oldest of them expires
+def _cache_headers(documents, ttl: timedelta) -> Dict[str, str]:
+    created_at = [doc.created_at for doc in documents if isinstance(getattr(doc, "created_at", None), datetime)]
+    return {"Cache-Control": cache_control(remaining_ttl(created_at, ttl))}
+
+
+def _weather_cache_time() -> timedelta:
+    return timedelta(hours=float(config.CURRENT_WEATHER_DATA_CACHE_TIME))
+
+
 # Fetches the 5-day weather forecast for a given latitude and longitude.
 # If an error occurs, a 500 HTTP exception is raised.
 # Returns the forecast data if successful.
@@ -33,7 +50,10 @@ async def get_weather_forecast5days(
         logger.exception(e)
         raise HTTPException(status_code=500)
     else:
-        return result
+        return model_response(
+            result, List[PredictionOut], from_attributes=True,
+            headers=_cache_headers(result, PREDICTIONS_CACHE_TIME)
+        )
 
 
 # Fetches the 5-day weather forecast in JSON-LD format for a given latitude and longitude.
@@ -69,6 +89,7 @@ async def get_weather_forecast5days_ld(
                                 })
 async def get_weather(
     request: Request,
+    response: Response,
     lat: float,
     lon: float,
     payload: dict = Depends(authenticate_request),
@@ -79,6 +100,7 @@ async def get_weather(
         logger.exception(e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
     else:
+        response.headers.update(_cache_headers([result], _weather_cache_time()))
         return result
 
 
@@ -88,6 +110,7 @@ async def get_weather(
 @data_router.get("/api/data/thi/", response_model=THIDataOut)
 async def get_thi(
     request: Request,
+    response: Response,
     lat: float,
     lon: float,
     payload: dict = Depends(authenticate_request),
@@ -98,6 +121,7 @@ async def get_thi(
         logger.exception(e)
         raise HTTPException(status_code=500)
     else:
+        response.headers.update(_cache_headers([result], _weather_cache_time()))
         return result
 
 
@@ -124,6 +148,7 @@ async def get_thi_ld(
 @data_router.get("/api/data/flight-forecast5/", response_model=List[FlightStatusForecastResponse])
 async def get_flight_forecast_for_all_uavs(
     request: Request,
+    response: Response,
     lat: float,
     lon: float,
     uavmodels: Annotated[list[str] | None, Query()] = None,
@@ -136,6 +161,7 @@ async def get_flight_forecast_for_all_uavs(
         logger.exception(e)
         raise e
     else:
+        response.headers.update(_cache_headers(result, _weather_cache_time()))
         return result
 
 # Forecasts suitable UAV flight conditions for all drones
@@ -160,7 +186,8 @@ async def get_flight_forecast_for_all_uavs_ld(
 
 # Get flight forecast for a specifiv UAV model
 @data_router.get("/api/data/flight-forecast5/{uavmodel}/", response_model=List[FlightStatusForecastResponse])
-async def get_flight_forecast_for_uav(request: Request, lat: float, lon: float, uavmodel: str, payload: dict = Depends(authenticate_request),
+async def get_flight_forecast_for_uav(request: Request, response: Response, lat: float, lon: float, uavmodel: str,
+                                      payload: dict = Depends(authenticate_request),
 ):
     try:
         result = await request.app.weather_app.get_flight_forecast_for_uav(lat, lon, uavmodel)
@@ -168,6 +195,7 @@ async def get_flight_forecast_for_uav(request: Request, lat: float, lon: float,
         logger.exception(e)
         raise e
     else:
+        response.headers.update(_cache_headers(result, _weather_cache_time()))
         return result
 
 
@@ -187,13 +215,15 @@ async def get_flight_forecast_for_uav_ld(request: Request, lat: float, lon: floa
 
 # Forecast suitability of spray conditions
 @data_router.get("/api/data/spray-forecast/", response_model=List[SprayForecastResponse])
-async def get_spray_forecast(request: Request, lat: float, lon: float, payload: dict = Depends(authenticate_request)):
+async def get_spray_forecast(request: Request, response: Response, lat: float, lon: float,
+                             payload: dict = Depends(authenticate_request)):
     try:
         result = await request.app.weather_app.get_spray_forecast(lat, lon)
     except Exception as e:
         logger.exception(e)
         raise e
     else:
+        response.headers.update(_cache_headers(result, _weather_cache_time()))
         return result
 
 
@@ -207,4 +237,16 @@ async def get_spray_forecast_ld(request: Request, lat: float, lon: float, payloa
         logger.exception(e)
         raise e
     else:
-        return result
\ No newline at end of file
+        return result
+
+
+# Resolves a forecast product for many points at once, one computation per grid cell.
+# Failures of single cells are reported in the results of their points.
+@data_router.post("/api/data/batch/", response_model=BatchResponse)
+async def get_batch_forecast(
+    request: Request,
+    q: BatchQuery,
+    payload: dict = Depends(authenticate_request),
+):
+    result = await batch_forecast.batch_forecast(request.app.weather_app, q)
+    return model_response(result)
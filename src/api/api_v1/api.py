@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from .endpoints import auth, locations, history, forecast
+from .endpoints import auth, locations, history, forecast, indicators, scheduler
 
 
 api_router = APIRouter()
@@ -7,4 +7,5 @@ api_router.include_router(locations.router, prefix="/locations", tags=["location
 api_router.include_router(auth.router, prefix="/auth", tags=["authentication"])
 api_router.include_router(history.router, prefix="/history", tags=["history"])
 api_router.include_router(forecast.router, prefix="/forecast", tags=["forecast-hourly"])
-
+api_router.include_router(indicators.router, prefix="/indicators", tags=["indicators"])
+api_router.include_router(scheduler.router, prefix="/scheduler", tags=["scheduler"])
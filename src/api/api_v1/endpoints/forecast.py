@@ -20,6 +20,7 @@ from typing import Dict, List
 
 from fastapi import APIRouter, Query, HTTPException
 
+from src.api.responses import model_response
 from src.external_services.openmeteo import WeatherClientFactory
 from src.schemas.point import GeoJSONOut
 from src.schemas.history_data import DailyResponse, HourlyObservationOut, HourlyResponse
@@ -71,11 +72,11 @@ async def get_hourly_forecast(
             detail="Could not retrieve hourly forecast from Open-Meteo",
         ) from e
 
-    return HourlyResponse(
+    return model_response(HourlyResponse.model_construct(
         location={"lat": lat, "lon": lon},
         data=results,
         source="open-meteo",
-    )
+    ))
 
 
 # ---------------------------------------------------------------------------
@@ -164,7 +165,7 @@ async def get_hourly_spray_forecast(
             )
         )
 
-    return results
+    return model_response(results, List[SprayForecastResponse])
 
 
 # ---------------------------------------------------------------------------
@@ -207,8 +208,8 @@ async def get_daily_irrigation_forecast(
             detail="Could not retrieve daily forecast from Open-Meteo",
         ) from e
 
-    return DailyResponse(
+    return model_response(DailyResponse.model_construct(
         location={"lat": lat, "lon": lon},
         data=results,
         source="open-meteo",
-    )
+    ))
@@ -1,58 +1,123 @@
 import logging
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
 
+from beanie import PydanticObjectId
+from beanie.operators import In
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from src.api.caching import make_etag, not_modified
 from src.api.deps import authenticate_request
-from src.models.history_data import DailyHistory, HourlyHistory
+from src.api.responses import model_response
+from src.api.streaming import STREAMING_RESPONSES, iterate_rows, negotiate_format, stream_rows
+from src.core import config
+from src.core import metrics
+from src.core.spatial_index import location_index
+from src.models.history_data import CachedLocation, DailyHistory, HistoryRollup, HourlyHistory
 from src.schemas.history_data import DailyObservationOut, DailyQuery, \
-    DailyResponse, HourlyObservationOut, HourlyQuery, HourlyResponse
+    DailyResponse, ExportQuery, HistoryFormat, HourlyObservationOut, HourlyQuery, HourlyResponse, \
+    RollupObservationOut, RollupQuery, RollupResponse
 from src.external_services.openmeteo import WeatherClientFactory
+from src.services import history_export, rollups
 
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.post("/hourly/", response_model=HourlyResponse)
-async def get_hourly_history(q: HourlyQuery, payload: dict = Depends(authenticate_request)):
-    point = {"type": "Point", "coordinates": [q.lon, q.lat]}
+FORMAT_QUERY = Query(None, description="Response format. Overrides the `Accept` header (json, ndjson, csv)")
+
+
+# Coordinates [lon, lat] of the nearest cached location within the radius
+async def _nearest_cached(lat: float, lon: float, radius_km: float) -> Optional[List[float]]:
+    location_id = location_index.nearest(lat, lon, radius_km * 1000)
+    # Another process may have cached it since the index was last rebuilt
+    if location_id is None:
+        location_id = await location_index.nearest_stored(lat, lon, radius_km * 1000)
+    if location_id is None:
+        return None
+    nearest_lat, nearest_lon = location_index.coordinates(location_id)
+    return [nearest_lon, nearest_lat]
+
 
+# ETag of a history response read from the cached documents matched by `query`, derived
+# from the query and the time each document was last fetched. It is known after one
+# projection of the matching documents, before any observation is read or serialized.
+async def _history_etag(query, q: BaseModel, fmt: HistoryFormat) -> str:
+    cursor = query.document_model.get_motor_collection().find(query.get_filter_query(), {"fetched_at": 1})
+    versions = sorted([f"{doc['_id']}@{doc.get('fetched_at')}" async for doc in cursor])
+    return make_etag(query.document_model.__name__, q.model_dump_json(), fmt.value, *versions)
+
+
+@router.post("/hourly/", response_model=HourlyResponse, responses=STREAMING_RESPONSES)
+async def get_hourly_history(
+    q: HourlyQuery,
+    request: Request,
+    format: Optional[HistoryFormat] = FORMAT_QUERY,
+    payload: dict = Depends(authenticate_request)
+):
+    fmt = negotiate_format(request, format)
     # Find the nearest location first
-    nearest_doc = await HourlyHistory.find_one(
-        HourlyHistory.location == {
-            "$near": {
-                "$geometry": point,
-                "$maxDistance": q.radius_km * 1000
-            }
-        }
-    )
+    coordinates = await _nearest_cached(q.lat, q.lon, q.radius_km)
+    nearest_doc = await HourlyHistory.find_one({"location.coordinates": coordinates}) if coordinates else None
+    metrics.record_cache("history", nearest_doc is not None)
 
     if not nearest_doc:
         # Fetch data from Open Meteo
         provider = WeatherClientFactory.get_provider()
         data = await provider.get_hourly_history(q.lat, q.lon, q.start, q.end, q.variables)
         logger.debug("Fetching data from Open-Meteo...")
-        return HourlyResponse(
+        if fmt != HistoryFormat.JSON:
+            rows = iterate_rows((obs.timestamp, obs.values) for obs in data)
+            return stream_rows(rows, fmt, q.variables, {"lat": q.lat, "lon": q.lon}, "openmeteo")
+        return model_response(HourlyResponse.model_construct(
             location={"lat": q.lat, "lon": q.lon},
             data=data,
             source="openmeteo"
-        )
+        ))
+
+    location = {
+        "lat": nearest_doc.location["coordinates"][1],
+        "lon": nearest_doc.location["coordinates"][0]
+    }
+    dt_start = datetime.combine(q.start, datetime.min.time())
+    dt_end = datetime.combine(q.end, datetime.min.time())
 
     # Then get all docs for that exact location in the date range
-    docs = await HourlyHistory.find_many(
+    query = HourlyHistory.find_many(
         HourlyHistory.location == nearest_doc.location,
         HourlyHistory.date >= q.start,
         HourlyHistory.date <= q.end
-    ).to_list()
+    )
+
+    etag = await _history_etag(query, q, fmt)
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    if fmt != HistoryFormat.JSON:
+        # Iterate the cursor sorted by day, one document (24 observations) at a time
+        async def rows():
+            async for doc in query.sort(+HourlyHistory.date):
+                for obs in sorted(doc.observations, key=lambda o: o.timestamp):
+                    if dt_start <= obs.timestamp <= dt_end:
+                        yield obs.timestamp, {v: obs.values.get(v) for v in q.variables}
+
+        response = stream_rows(rows(), fmt, q.variables, location, nearest_doc.source)
+        response.headers["ETag"] = etag
+        return response
+
+    docs = await query.to_list()
 
     observations = []
-    dt_start = datetime.combine(q.start, datetime.min.time())
-    dt_end = datetime.combine(q.end, datetime.min.time())
     for doc in docs:
         for obs in doc.observations:
             if dt_start <= obs.timestamp <= dt_end:
                 observations.append(
-                    HourlyObservationOut(
+                    HourlyObservationOut.model_construct(
                         timestamp=obs.timestamp,
                         values={v: obs.values.get(v) for v in q.variables}
                     )
@@ -60,54 +125,76 @@ async def get_hourly_history(q: HourlyQuery, payload: dict = Depends(authenticat
 
     observations.sort(key=lambda o: o.timestamp)
 
-    return HourlyResponse(
-        location={
-            "lat": nearest_doc.location["coordinates"][1],
-            "lon": nearest_doc.location["coordinates"][0]
-        },
+    return model_response(HourlyResponse.model_construct(
+        location=location,
         data=observations,
         source=nearest_doc.source
-    )
+    ), headers={"ETag": etag})
 
 
-@router.post("/daily/", response_model=DailyResponse)
-async def get_daily_history(q: DailyQuery, payload: dict = Depends(authenticate_request)):
-    point = {"type": "Point", "coordinates": [q.lon, q.lat]}
-
+@router.post("/daily/", response_model=DailyResponse, responses=STREAMING_RESPONSES)
+async def get_daily_history(
+    q: DailyQuery,
+    request: Request,
+    format: Optional[HistoryFormat] = FORMAT_QUERY,
+    payload: dict = Depends(authenticate_request)
+):
+    fmt = negotiate_format(request, format)
     # Find the nearest location first
-    nearest_doc = await DailyHistory.find_one(
-        DailyHistory.location == {
-            "$near": {
-                "$geometry": point,
-                "$maxDistance": q.radius_km * 1000
-            }
-        }
-    )
+    coordinates = await _nearest_cached(q.lat, q.lon, q.radius_km)
+    nearest_doc = await DailyHistory.find_one({"location.coordinates": coordinates}) if coordinates else None
+    metrics.record_cache("history", nearest_doc is not None)
 
     if not nearest_doc:
         # Fetch data from Open Meteo
         provider = WeatherClientFactory.get_provider()
         data = await provider.get_daily_history(q.lat, q.lon, q.start, q.end, q.variables)
         logger.debug("Fetching data from Open-Meteo...")
-        return DailyResponse(
+        if fmt != HistoryFormat.JSON:
+            rows = iterate_rows((obs.date, obs.values) for obs in data)
+            return stream_rows(rows, fmt, q.variables, {"lat": q.lat, "lon": q.lon}, "openmeteo", time_field="date")
+        return model_response(DailyResponse.model_construct(
             location={"lat": q.lat, "lon": q.lon},
             data=data,
             source="openmeteo"
-        )
+        ))
+
+    location = {
+        "lat": nearest_doc.location["coordinates"][1],
+        "lon": nearest_doc.location["coordinates"][0]
+    }
 
     # Then get all docs for that exact location in the date range
-    docs = await DailyHistory.find_many(
+    query = DailyHistory.find_many(
         DailyHistory.location == nearest_doc.location,
         DailyHistory.date_range["start"] <= q.end,
         DailyHistory.date_range["end"] >= q.start
-    ).to_list()
+    )
+
+    etag = await _history_etag(query, q, fmt)
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    if fmt != HistoryFormat.JSON:
+        async def rows():
+            async for doc in query.sort(+DailyHistory.date_range["start"]):
+                for obs in sorted(doc.observations, key=lambda o: o.date):
+                    if q.start <= obs.date <= q.end:
+                        yield obs.date, {v: obs.values.get(v) for v in q.variables}
+
+        response = stream_rows(rows(), fmt, q.variables, location, nearest_doc.source, time_field="date")
+        response.headers["ETag"] = etag
+        return response
+
+    docs = await query.to_list()
 
     observations = []
     for doc in docs:
         for obs in doc.observations:
             if q.start <= obs.date <= q.end:
                 observations.append(
-                    DailyObservationOut(
+                    DailyObservationOut.model_construct(
                         date=obs.date,
                         values={v: obs.values.get(v) for v in q.variables}
                     )
@@ -115,11 +202,89 @@ async def get_daily_history(q: DailyQuery, payload: dict = Depends(authenticate_
 
     observations.sort(key=lambda o: o.date)
 
-    return DailyResponse(
+    return model_response(DailyResponse.model_construct(
+        location=location,
+        data=observations,
+        source=nearest_doc.source
+    ), headers={"ETag": etag})
+
+
+@router.post("/rollup/", response_model=RollupResponse)
+async def get_history_rollup(q: RollupQuery, payload: dict = Depends(authenticate_request)):
+    # Find the nearest location with rollups first
+    coordinates = await _nearest_cached(q.lat, q.lon, q.radius_km)
+    nearest_doc = await HistoryRollup.find_one(
+        HistoryRollup.lon == coordinates[0], HistoryRollup.lat == coordinates[1]
+    ) if coordinates else None
+    metrics.record_cache("history", nearest_doc is not None)
+
+    if not nearest_doc:
+        # Summarize hourly data from Open Meteo on the fly
+        provider = WeatherClientFactory.get_provider()
+        data = await provider.get_hourly_history(q.lat, q.lon, q.start, q.end, q.variables)
+        logger.debug("Fetching data from Open-Meteo...")
+        return model_response(RollupResponse.model_construct(
+            location={"lat": q.lat, "lon": q.lon},
+            resolution=q.resolution,
+            data=rollups.rollup_observations(data, q.resolution, q.variables),
+            source="openmeteo"
+        ))
+
+    # Periods overlapping the requested range, in chronological order
+    docs = await HistoryRollup.find(
+        HistoryRollup.lon == nearest_doc.lon,
+        HistoryRollup.lat == nearest_doc.lat,
+        HistoryRollup.resolution == q.resolution.value,
+        HistoryRollup.period_start <= q.end,
+        HistoryRollup.period_end >= q.start
+    ).sort(+HistoryRollup.period_start).to_list()
+
+    return model_response(RollupResponse.model_construct(
         location={
             "lat": nearest_doc.location["coordinates"][1],
             "lon": nearest_doc.location["coordinates"][0]
         },
-        data=observations,
+        resolution=q.resolution,
+        data=[
+            RollupObservationOut.model_construct(
+                period_start=doc.period_start,
+                period_end=doc.period_end,
+                values={v: doc.values[v] for v in q.variables if v in doc.values}
+            )
+            for doc in docs
+        ],
         source=nearest_doc.source
+    ))
+
+
+@router.post(
+    "/export/",
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type in history_export.MEDIA_TYPES.values()}}},
+)
+async def export_history(q: ExportQuery, payload: dict = Depends(authenticate_request)):
+    error = history_export.compression_error(q.format, q.compression, q.compression_level)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
+
+    if q.location_ids:
+        invalid = [i for i in q.location_ids if not ObjectId.is_valid(i)]
+        if invalid:
+            raise HTTPException(status_code=422, detail=f"Invalid location ids: {', '.join(invalid)}")
+
+        locations = CachedLocation.find(In(CachedLocation.id, [PydanticObjectId(i) for i in q.location_ids]))
+        if await locations.count() != len(set(q.location_ids)):
+            raise HTTPException(status_code=404, detail="Location not found")
+    else:
+        locations = CachedLocation.find_all()
+
+    variables = q.variables or config.OM_CACHE_VARIABLES[q.granularity.value]
+    schema = history_export.export_schema(q.granularity, variables)
+    batches = history_export.record_batches(locations, q.granularity, q.start, q.end, variables, schema)
+    extension = history_export.FILE_EXTENSIONS[q.format]
+
+    return StreamingResponse(
+        history_export.write_batches(batches, schema, q.format, q.compression, q.compression_level),
+        media_type=history_export.MEDIA_TYPES[q.format],
+        headers={"Content-Disposition": f'attachment; filename="history_{q.granularity.value}.{extension}"'},
     )
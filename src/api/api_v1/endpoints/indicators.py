@@ -0,0 +1,36 @@
+import logging
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from src.api.deps import authenticate_request
+from src.schemas.indicators import IndicatorOut, IndicatorQuery, IndicatorResponse
+from src.services import indicators
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[IndicatorOut])
+async def list_indicators(payload: dict = Depends(authenticate_request)):
+    return indicators.list_indicators()
+
+
+@router.post("/{indicator}/", response_model=IndicatorResponse)
+async def get_indicator(indicator: str, q: IndicatorQuery, payload: dict = Depends(authenticate_request)):
+    if indicator not in indicators.INDICATORS:
+        raise HTTPException(status_code=404, detail=f"Unknown indicator '{indicator}'")
+    if q.start > q.end:
+        raise HTTPException(status_code=422, detail="start must not be after end")
+
+    try:
+        return await indicators.compute_indicator(
+            indicator, q.lat, q.lon, q.start, q.end, q.params, q.forecast_days, q.radius_km
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    except Exception as e:
+        logger.error(f"Error computing {indicator} for ({q.lat}, {q.lon}): {e}")
+        raise HTTPException(status_code=502, detail="Could not retrieve weather data for the indicator") from e
@@ -1,36 +1,110 @@
-from datetime import datetime, timezone
 import logging
-from typing import List
+import re
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from bson import ObjectId
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
 
-# from src.scheduler import scheduler
 from src.api.deps import authenticate_request
-from src.scheduler import scheduler
 from src.core import config
 from src.core import dao
-from src.models.history_data import CachedLocation, DailyHistory, HourlyHistory
-from src.schemas.history_data import CachedLocationIn, CachedLocationOut, CachedLocationsIn
-from src.services.cache_loader import fetch_and_cache_last_month
-from src.services.jobs import update_sliding_window
+from src.core.spatial_index import location_index
+from src.models.history_data import CachedLocation, DailyHistory, HistoryRollup, HourlyHistory
+from src.models.onboarding import OnboardingJob, OnboardingResultStatus
+from src.schemas.history_data import CachedLocationFieldsOut, CachedLocationOut, CachedLocationsIn, \
+    OnboardingJobOut, OnboardingResultOut
+from src.services import onboarding
 
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.get("/locations/", response_model=List[CachedLocationOut])
-async def list_locations(payload: dict = Depends(authenticate_request)):
-    docs = await CachedLocation.find_all().to_list()
-    return [
-        CachedLocationOut(
-            id=str(doc.id),
-            name=doc.name,
-            lat=doc.location["coordinates"][1],
-            lon=doc.location["coordinates"][0],
-            created_at=str(doc.created_at)
-        ) for doc in docs
-    ]
+# Mongo fields to project for each field of the location listing
+LOCATION_FIELDS = {
+    "id": "_id",
+    "name": "name",
+    "lat": "location.coordinates",
+    "lon": "location.coordinates",
+    "created_at": "created_at",
+}
+# Page size of the listing when no limit is sent
+DEFAULT_PAGE_SIZE = 100
+
+
+def _parse_bbox(bbox: str) -> List[float]:
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    if min_lat > max_lat:
+        raise HTTPException(status_code=422, detail="bbox min_lat must not be greater than max_lat")
+    return [min_lon, min_lat, max_lon, max_lat]
+
+
+def _location_filter(cursor: Optional[str], bbox: Optional[str], name_prefix: Optional[str]) -> dict:
+    query = {}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=422, detail="Invalid cursor")
+        query["_id"] = {"$gt": ObjectId(cursor)}
+
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = _parse_bbox(bbox)
+        query["location.coordinates.1"] = {"$gte": min_lat, "$lte": max_lat}
+        if min_lon <= max_lon:
+            query["location.coordinates.0"] = {"$gte": min_lon, "$lte": max_lon}
+        else:
+            # Box crossing the antimeridian
+            query["$or"] = [
+                {"location.coordinates.0": {"$gte": min_lon}},
+                {"location.coordinates.0": {"$lte": max_lon}},
+            ]
+
+    if name_prefix:
+        # Anchored, case sensitive prefix so the name index can be used
+        query["name"] = {"$regex": f"^{re.escape(name_prefix)}"}
+    return query
+
+
+# Lists cached locations a page at a time, ordered by id. The id of the last
+# location of the page is returned in the X-Next-Cursor header when more follow.
+@router.get(
+    "/locations/",
+    response_model=List[CachedLocationFieldsOut],
+    response_model_exclude_unset=True
+)
+async def list_locations(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=1000, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    bbox: Optional[str] = Query(None, description="Bounding box: min_lon,min_lat,max_lon,max_lat"),
+    name_prefix: Optional[str] = Query(None, description="Only locations whose name starts with this prefix"),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return (id, name, lat, lon, created_at)"),
+    payload: dict = Depends(authenticate_request)
+):
+    selected = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(LOCATION_FIELDS)
+    unknown = set(selected) - set(LOCATION_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    projection = {LOCATION_FIELDS[f]: 1 for f in selected}
+    docs = await CachedLocation.get_motor_collection().find(
+        _location_filter(cursor, bbox, name_prefix), projection
+    ).sort("_id", 1).limit(limit + 1).to_list(None)
+
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = str(docs[-1]["_id"])
+
+    getters = {
+        "id": lambda doc: str(doc["_id"]),
+        "name": lambda doc: doc.get("name"),
+        "lat": lambda doc: doc["location"]["coordinates"][1],
+        "lon": lambda doc: doc["location"]["coordinates"][0],
+        "created_at": lambda doc: str(doc["created_at"]),
+    }
+    return [CachedLocationFieldsOut(**{f: getters[f](doc) for f in selected}) for doc in docs]
 
 @router.get("/locations/by-coordinates/", response_model=CachedLocationOut)
 async def get_location_by_coordinates(
@@ -72,95 +146,54 @@ async def check_location_exists(
     )
 
 
-@router.post("/locations/", response_model=List[CachedLocationOut])
-async def add_locations(data: CachedLocationsIn, payload: dict = Depends(authenticate_request)):
-    result = []
-
-    for loc in data.locations:
-        geo = {"type": "Point", "coordinates": [loc.lon, loc.lat]}
-        existing = await CachedLocation.find_one(CachedLocation.location == geo)
-        if not existing:
-            doc = CachedLocation(name=loc.name, location=geo)
-            await doc.insert()
-            result.append(doc)
-
-            try:
-                # Fetch & cache
-                await fetch_and_cache_last_month(loc.lat, loc.lon, config.OM_CACHE_VARIABLES)
-
-                # 👉 schedule daily update task
-                # scheduler.add_job(
-                #     lambda: update_sliding_window(loc.lat, loc.lon),
-                #     trigger="cron", hour=0, minute=1, id=f"update_{loc.lat}_{loc.lon}"
-                # )
-
-                result.append(doc)
-
-            except Exception as e:
-                await doc.delete()  # Rollback location insert
-                # Optional: log error
-                logger.exception(f"❌ Failed to cache location {loc.lat},{loc.lon}: {e}")
-
-    return [
-        CachedLocationOut(
-            id=str(l.id),
-            name=l.name,
-            lat=l.location["coordinates"][1],
-            lon=l.location["coordinates"][0],
-            created_at=str(l.created_at)
-        ) for l in result
-    ]
-
-@router.post("/locations/unique/", response_model=List[CachedLocationOut])
-async def add_unique_locations(data: CachedLocationsIn, payload: dict = Depends(authenticate_request)):
-    added = []
-
-    for loc in data.locations:
-        existing = await dao.find_location_nearby(loc.lat, loc.lon, config.LOCATION_RADIUS_METERS)
-        if existing:
-            continue  # Skip nearby duplicates
-
-        geo = {"type": "Point", "coordinates": [loc.lon, loc.lat]}
-        doc = CachedLocation(name=loc.name, location=geo)
-        await doc.insert()
-
-        try:
-            # Fetch & cache
-            await fetch_and_cache_last_month(loc.lat, loc.lon, config.OM_CACHE_VARIABLES)
-
-            # 👉 schedule daily update task
-            scheduler.add_job(
-                update_sliding_window,
-                trigger="cron",
-                hour=23,
-                args=[loc.lat, loc.lon, config.OM_CACHE_VARIABLES],
-                id=f"update_sliding_{loc.lat}_{loc.lon}",
-                replace_existing=True,
-            )
-            logging.debug("Scheduled sliding window update for %s, %s", loc.lat, loc.lon)
-
-            added.append(doc)
-
-        except Exception as e:
-            # Rollback location insert
-            await doc.delete()
-             # Delete related history documents if they exist
-            await HourlyHistory.find(HourlyHistory.location == geo).delete()
-            await DailyHistory.find(DailyHistory.location == geo).delete()
-            logger.exception(f"❌ Failed to cache location {loc.lat},{loc.lon}: {e}")
-
-    if not added:
-        raise HTTPException(status_code=409, detail="All locations already exist nearby")
-
-    return [
-        CachedLocationOut(
-            id=str(d.id),
-            name=d.name,
-            lat=d.location["coordinates"][1],
-            lon=d.location["coordinates"][0],
-            created_at=str(d.created_at)
-        ) for d in added
-    ]
+# Registers the locations in a background onboarding job and returns its status
+async def _enqueue_onboarding(data: CachedLocationsIn, unique: bool, background_tasks: BackgroundTasks):
+    job = await onboarding.create_job(data.locations, unique=unique)
+    background_tasks.add_task(onboarding.run_job, job.id)
+    return _job_out(job)
+
+
+def _job_out(job: OnboardingJob, with_results: bool = False) -> OnboardingJobOut:
+    counts = {status.value: 0 for status in OnboardingResultStatus}
+    for result in job.results:
+        counts[result.status.value] += 1
+
+    return OnboardingJobOut(
+        job_id=str(job.id),
+        status=job.status.value,
+        total=len(job.results),
+        counts=counts,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        results=[
+            OnboardingResultOut(**result.model_dump(mode="json")) for result in job.results
+        ] if with_results else None
+    )
+
+
+@router.post("/locations/", response_model=OnboardingJobOut, status_code=202)
+async def add_locations(
+    data: CachedLocationsIn,
+    background_tasks: BackgroundTasks,
+    payload: dict = Depends(authenticate_request)
+):
+    return await _enqueue_onboarding(data, False, background_tasks)
+
+@router.post("/locations/unique/", response_model=OnboardingJobOut, status_code=202)
+async def add_unique_locations(
+    data: CachedLocationsIn,
+    background_tasks: BackgroundTasks,
+    payload: dict = Depends(authenticate_request)
+):
+    return await _enqueue_onboarding(data, True, background_tasks)
+
+@router.get("/locations/jobs/{job_id}/", response_model=OnboardingJobOut)
+async def get_onboarding_job(job_id: str, payload: dict = Depends(authenticate_request)):
+    job = await OnboardingJob.get(job_id) if ObjectId.is_valid(job_id) else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Onboarding job not found")
+    return _job_out(job, with_results=True)
 
 @router.delete("/locations/{location_id}/")
 async def delete_location(location_id: str, payload: dict = Depends(authenticate_request)):
@@ -168,22 +201,13 @@ async def delete_location(location_id: str, payload: dict = Depends(authenticate
     if not loc:
         raise HTTPException(status_code=404, detail="Location not found")
 
-    lon, lat = loc.location["coordinates"]
     geo = loc.location
 
     # Delete related history documents
     await HourlyHistory.find(HourlyHistory.location == geo).delete()
     await DailyHistory.find(DailyHistory.location == geo).delete()
-
-    # remove background task
-    try:
-        # Remove related scheduled job
-        for job_prefix in ["update_sliding"]:
-            job_id = f"{job_prefix}_{lat}_{lon}"
-            if scheduler.get_job(job_id):
-                scheduler.remove_job(job_id)
-    except Exception:
-        pass
+    await HistoryRollup.find(HistoryRollup.location == geo).delete()
 
     await loc.delete()
+    location_index.remove(str(loc.id))
     return {"detail": "Location and history removed"}
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends
+
+from src.api.deps import authenticate_request
+from src.schemas.scheduler import SchedulerStatsOut
+from src.scheduler import parcel_wheel, scheduler
+from src.services.dispatcher import dispatcher
+from src.services.outbox import outbox_stats
+
+
+router = APIRouter()
+
+
+@router.get("/stats/", response_model=SchedulerStatsOut)
+async def get_scheduler_stats(payload: dict = Depends(authenticate_request)):
+    return SchedulerStatsOut(
+        running=scheduler.running,
+        scheduled_jobs=len(scheduler.get_jobs()),
+        parcel_runs=len(parcel_wheel),
+        next_parcel_run=parcel_wheel.next_run(),
+        job_classes=dispatcher.stats(),
+        outbox=await outbox_stats()
+    )
@@ -0,0 +1,131 @@
+"""
+HTTP conditional caching of the forecast and history endpoints.
+
+ConditionalMiddleware gives the JSON responses of the data endpoints a strong
+ETag and a Cache-Control max-age. The ETag is the hash of the body unless the
+endpoint set one derived from the version of the data it read. The max-age is
+HTTP_CACHE_MAX_AGE_SECONDS unless the endpoint set the remaining lifetime of
+its cached data. A request whose If-None-Match matches gets a 304 Not Modified
+without a body. Endpoints that know the version of their data before building
+the response check it with not_modified(), skipping the read and serialization
+of unchanged data altogether.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core import config
+
+
+CONDITIONAL_PREFIXES = ("/api/data/", "/api/linkeddata/", "/api/v1/forecast/", "/api/v1/history/")
+JSON_MEDIA_TYPES = ("application/json", "application/ld+json")
+# Headers a 304 repeats from the response it stands for
+NOT_MODIFIED_HEADERS = {"etag", "cache-control", "vary", "content-location", "date", "expires"}
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+# Weak comparison of If-None-Match, as specified for GET
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+def cache_control(max_age: Optional[float] = None) -> str:
+    max_age = config.HTTP_CACHE_MAX_AGE_SECONDS if max_age is None else max(0, int(max_age))
+    return f"{config.HTTP_CACHE_VISIBILITY}, max-age={max_age}"
+
+
+# Seconds until the oldest of the documents, created at `created_at`, expires from the cache
+def remaining_ttl(created_at: Iterable[datetime], ttl: timedelta) -> Optional[int]:
+    oldest = min(created_at, default=None)
+    if oldest is None:
+        return None
+    now = datetime.now(oldest.tzinfo)
+    return max(0, int((oldest + ttl - now).total_seconds()))
+
+
+# 304 Not Modified when the client already holds the version `etag`
+def not_modified(request: Request, etag: str, max_age: Optional[float] = None) -> Optional[Response]:
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control(max_age)})
+    return None
+
+
+class ConditionalMiddleware:
+
+    def __init__(self, app: ASGIApp, prefixes: Iterable[str] = CONDITIONAL_PREFIXES):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "POST") \
+                or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start: Optional[Message] = None
+        # Buffer the body to hash it, or drop it once a 304 was sent
+        buffered = dropped = False
+        chunks = []
+
+        async def send_not_modified(headers: MutableHeaders):
+            kept = [(k, v) for k, v in headers.raw if k.decode("latin-1").lower() in NOT_MODIFIED_HEADERS]
+            await send({"type": "http.response.start", "status": 304, "headers": kept})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def conditional_send(message: Message):
+            nonlocal start, buffered, dropped
+            if message["type"] == "http.response.start":
+                start = message
+                headers = MutableHeaders(raw=message["headers"])
+                if message["status"] == 200:
+                    if "cache-control" not in headers:
+                        headers["Cache-Control"] = cache_control()
+                    media_type = headers.get("content-type", "").split(";")[0].strip()
+                    # Other formats are streamed, hashing them would need the whole body
+                    buffered = "etag" not in headers and media_type in JSON_MEDIA_TYPES
+                    if not buffered and etag_matches(if_none_match, headers.get("etag", "")):
+                        dropped = True
+                        await send_not_modified(headers)
+                        return
+                if not buffered:
+                    await send(message)
+                return
+
+            if dropped:
+                return
+            if not buffered:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["ETag"] = make_etag(body)
+            if etag_matches(if_none_match, headers["etag"]):
+                await send_not_modified(headers)
+                return
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, conditional_send)
+
@@ -0,0 +1,244 @@
+"""
+Negotiated compression of the text responses of the API.
+
+CompressionMiddleware encodes JSON, JSON-LD, NDJSON and CSV responses with the
+best encoding accepted by the client: zstd and brotli when their packages are
+installed, gzip otherwise. Bodies smaller than COMPRESSION_MIN_SIZE are sent
+as they are, since the framing overhead outweighs the saving. Streamed bodies
+are compressed chunk by chunk and flushed after each chunk so rows keep
+reaching the client as they are produced.
+
+Responses carrying an ETag are the same bytes for every client holding that
+version, so their compressed bodies are kept in an LRU of
+COMPRESSION_CACHE_SIZE entries keyed by (ETag, encoding) and repeated hits of
+hot forecasts skip the compression. The ETag of an encoded response is made
+weak, which still matches If-None-Match under the weak comparison used by
+ConditionalMiddleware, and every compressible response varies on
+Accept-Encoding.
+"""
+
+import gzip
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core import config
+from src.core import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+COMPRESSIBLE_MEDIA_TYPES = (
+    "application/json", "application/ld+json", "application/x-ndjson", "text/csv", "text/plain",
+)
+# Levels trading ratio for speed, responses are compressed on the request path
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+class _GzipStream:
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Available encodings in order of preference, with their one-shot and streaming encoders
+ENCODERS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[], object]]] = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = (
+        lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), _ZstdStream
+    )
+if brotli is not None:
+    ENCODERS["br"] = (lambda body: brotli.compress(body, quality=BROTLI_QUALITY), _BrotliStream)
+ENCODERS["gzip"] = (lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0), _GzipStream)
+
+
+# Preferred available encoding accepted by `accept_encoding`, honouring q-values
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODERS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+# LRU of compressed bodies keyed by (ETag, encoding)
+class CompressedCache:
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = config.COMPRESSION_CACHE_SIZE if size is None else size
+        self._bodies: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+    def clear(self):
+        self._bodies.clear()
+
+    def get(self, etag: str, encoding: str) -> Optional[bytes]:
+        body = self._bodies.get((etag, encoding))
+        if body is not None:
+            self._bodies.move_to_end((etag, encoding))
+        return body
+
+    def put(self, etag: str, encoding: str, body: bytes):
+        if self.size <= 0:
+            return
+        self._bodies[(etag, encoding)] = body
+        self._bodies.move_to_end((etag, encoding))
+        while len(self._bodies) > self.size:
+            self._bodies.popitem(last=False)
+
+
+# Compressed bodies shared by the whole process
+compressed_cache = CompressedCache()
+
+
+def _weak(etag: str) -> str:
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+class CompressionMiddleware:
+
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None, cache: Optional[CompressedCache] = None):
+        self.app = app
+        self.minimum_size = config.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+        self.cache = compressed_cache if cache is None else cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        start: Optional[Message] = None
+        stream = None
+        # Whether the response is encoded at all, decided on its first body chunk
+        compressible = False
+        started = False
+
+        async def compressing_send(message: Message):
+            nonlocal start, stream, compressible, started
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+                compressible = media_type in COMPRESSIBLE_MEDIA_TYPES and "content-encoding" not in headers \
+                    and message["status"] not in (204, 304)
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+                compressible = compressible and encoding is not None
+                if not compressible:
+                    await send(message)
+                    return
+                start = message
+                return
+
+            if not compressible:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(raw=start["headers"])
+
+            if not started:
+                started = True
+                if not more_body:
+                    await self._send_whole(send, start, headers, body, encoding)
+                    return
+                # Streamed body, encoded on the fly
+                del headers["content-length"]
+                headers["Content-Encoding"] = encoding
+                if "etag" in headers:
+                    headers["ETag"] = _weak(headers["etag"])
+                stream = ENCODERS[encoding][1]()
+                await send(start)
+
+            chunk = stream.compress(body) if body else b""
+            if not more_body:
+                chunk += stream.finish()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+    async def _send_whole(self, send: Send, start: Message, headers: MutableHeaders, body: bytes, encoding: str):
+        if len(body) < self.minimum_size:
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        etag = headers.get("etag")
+        compressed = self.cache.get(etag, encoding) if etag else None
+        if etag:
+            metrics.record_cache("compression", compressed is not None)
+        if compressed is None:
+            compressed = ENCODERS[encoding][0](body)
+            if etag:
+                self.cache.put(etag, encoding, compressed)
+
+        headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(compressed))
+        if etag:
+            headers["ETag"] = _weak(etag)
+        await send(start)
+        await send({"type": "http.response.body", "body": compressed})
@@ -1,3 +1,8 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Depends, HTTPException, status
 import jwt
@@ -5,17 +10,50 @@ from pydantic import ValidationError
 
 
 from src.core import config
+from src.core import metrics
 
 
 security_scheme = HTTPBearer()
 
+# LRU of verified tokens, (claims, exp) by sha256 of the token, so a token sent
+# again skips the signature verification until it expires. Tokens are trusted
+# until their exp as without the cache, there is no revocation.
+_verified: "OrderedDict[str, Tuple[dict, Optional[float]]]" = OrderedDict()
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def clear_verified_tokens():
+    _verified.clear()
+
+
+def _verify(token: str) -> dict:
+    key = _token_hash(token)
+    cached = _verified.get(key)
+    if cached:
+        claims, exp = cached
+        if exp is None or time.time() < exp:
+            _verified.move_to_end(key)
+            metrics.record_cache("auth_tokens", True)
+            return dict(claims)
+        del _verified[key]
+        raise jwt.ExpiredSignatureError("Signature has expired")
+
+    metrics.record_cache("auth_tokens", False)
+    claims = jwt.decode(token, config.KEY, algorithms=[config.ALGORITHM])
+    exp = claims.get("exp")
+    _verified[key] = (claims, float(exp) if exp is not None else None)
+    while len(_verified) > config.AUTH_CACHE_SIZE:
+        _verified.popitem(last=False)
+    return dict(claims)
+
 
 async def authenticate_request(credentials: HTTPAuthorizationCredentials = Depends(security_scheme)) -> str: # type: ignore
     try:
         token = credentials.credentials
-        decoded_jwt_token = jwt.decode(
-            token, config.KEY, algorithms=[config.ALGORITHM]
-        )
+        decoded_jwt_token = _verify(token)
     except (jwt.PyJWTError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,62 @@
+"""
+Request metrics and the /metrics endpoint.
+
+MetricsMiddleware times every HTTP request and records it under the path
+template of the route that served it, so /api/v1/history/hourly/ stays one
+series whatever its query. Requests matching no route share the `unmatched`
+label. The label children are looked up once per (method, route, status) and
+reused, keeping the cost per request to a clock read and a histogram update.
+"""
+
+import time
+from typing import Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core.metrics import HTTP_REQUEST_DURATION
+
+
+METRICS_PATH = "/metrics"
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._children: Dict[Tuple[str, str, int], object] = {}
+
+    def _child(self, method: str, route: str, status: int):
+        key = (method, route, status)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = HTTP_REQUEST_DURATION.labels(method, route, str(status))
+        return child
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def timed_send(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            self._child(scope["method"], route.path if route is not None else "unmatched", status) \
+                .observe(time.perf_counter() - started)
@@ -0,0 +1,45 @@
+"""
+Fast JSON responses.
+
+ORJSONResponse is the default response class of the application. Endpoints
+returning large lists of objects they built from already validated data, like
+forecast and history observations, return them through model_response(). It
+serializes them in one pass with the pydantic-core serializer of the route's
+response model. FastAPI would dump, validate and encode them again and then
+run json.dumps. The response_model of the route still documents the payload.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+@lru_cache(maxsize=None)
+def _adapter(model_type: Any) -> TypeAdapter:
+    return TypeAdapter(model_type)
+
+
+def dump_json(content: Any, model_type: Any = None) -> bytes:
+    return _adapter(model_type or type(content)).dump_json(content)
+
+
+# Serializes `content` as `model_type`, its own type by default. Objects of
+# another type, like documents returned as a narrower schema, are converted
+# first with `from_attributes`.
+def model_response(
+    content: Any,
+    model_type: Any = None,
+    from_attributes: bool = False,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    if from_attributes:
+        content = _adapter(model_type).validate_python(content, from_attributes=True)
+    return Response(
+        dump_json(content, model_type), status_code=status_code, headers=headers, media_type=JSON_MEDIA_TYPE
+    )
@@ -0,0 +1,101 @@
+"""
+Streaming serializers for large history responses.
+
+Rows are written to the client as they are read from the Mongo cursor, so
+memory use stays constant regardless of the requested date range.
+"""
+
+import csv
+import io
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+import orjson
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from src.schemas.history_data import HistoryFormat
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+
+# Media types accepted in the `Accept` header for each streaming format
+ACCEPT_FORMATS = {
+    "application/x-ndjson": HistoryFormat.NDJSON,
+    "application/ndjson": HistoryFormat.NDJSON,
+    "text/csv": HistoryFormat.CSV,
+}
+
+# OpenAPI description of the additional media types of the history endpoints
+STREAMING_RESPONSES = {
+    200: {
+        "content": {
+            NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}},
+            CSV_MEDIA_TYPE: {"schema": {"type": "string"}},
+        }
+    }
+}
+
+Row = Tuple[Union[datetime, date], Dict[str, Optional[float]]]
+
+
+# Select the response format from the `format` query param or, when it is
+# not given, from the `Accept` header. Defaults to plain JSON.
+def negotiate_format(request: Request, fmt: Optional[HistoryFormat] = None) -> HistoryFormat:
+    if fmt:
+        return fmt
+
+    accept = request.headers.get("accept", "")
+    for media_type in accept.split(","):
+        media_type = media_type.split(";")[0].strip().lower()
+        if media_type in ACCEPT_FORMATS:
+            return ACCEPT_FORMATS[media_type]
+    return HistoryFormat.JSON
+
+
+async def iterate_rows(rows: Iterable[Row]) -> AsyncIterator[Row]:
+    for row in rows:
+        yield row
+
+
+async def _ndjson_lines(rows: AsyncIterator[Row], time_field: str) -> AsyncIterator[bytes]:
+    async for ts, values in rows:
+        yield orjson.dumps({time_field: ts, "values": values}) + b"\n"
+
+
+async def _csv_lines(rows: AsyncIterator[Row], time_field: str, variables: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        line = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return line
+
+    writer.writerow([time_field, *variables])
+    yield flush()
+    async for ts, values in rows:
+        writer.writerow([ts.isoformat(), *("" if values.get(v) is None else values.get(v) for v in variables)])
+        yield flush()
+
+
+# Wrap an async iterator of (timestamp, values) rows in a StreamingResponse.
+# Location and source are returned as headers since NDJSON/CSV rows carry no envelope.
+def stream_rows(
+    rows: AsyncIterator[Row],
+    fmt: HistoryFormat,
+    variables: List[str],
+    location: Dict[str, float],
+    source: str,
+    time_field: str = "timestamp",
+) -> StreamingResponse:
+    headers = {
+        "X-Location-Lat": str(location["lat"]),
+        "X-Location-Lon": str(location["lon"]),
+        "X-Data-Source": source,
+    }
+    if fmt == HistoryFormat.CSV:
+        return StreamingResponse(_csv_lines(rows, time_field, variables), media_type=CSV_MEDIA_TYPE, headers=headers)
+    return StreamingResponse(_ndjson_lines(rows, time_field), media_type=NDJSON_MEDIA_TYPE, headers=headers)
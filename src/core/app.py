@@ -1,3 +1,4 @@
+import asyncio
 from functools import partial
 import logging
 import os
@@ -5,6 +6,7 @@ import os
 
 import fastapi
 from fastapi.openapi.utils import get_openapi
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.routing import APIRoute
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -14,11 +16,17 @@ from src.core import config
 from src.core.security import create_gk_jwt_tokens
 from src import utils
 from src.core.dao import Dao
+from src.core.metrics import MongoCommandMetrics
+from src.core.spatial_index import location_index
 from src.api.api import data_router
 from src.api.api_v1.api import api_router
+from src.api.caching import ConditionalMiddleware
+from src.api.compression import CompressionMiddleware
+from src.api.metrics import METRICS_PATH, MetricsMiddleware, metrics_endpoint
 from src.external_services.openweathermap import OpenWeatherMap
 from src.openagri_services.gatekeeper_service import GatekeeperServiceClient
 from src.openagri_services.farmcalendar_service import FarmCalendarServiceClient
+from src.openagri_services.token_manager import TokenManager
 import src.scheduler as scheduler
 
 
@@ -27,8 +35,10 @@ logger = logging.getLogger(__name__)
 class Application(fastapi.FastAPI):
 
     def __init__(self, *args, **kwargs):
+        kwargs.setdefault("default_response_class", ORJSONResponse)
         super().__init__(*args, **kwargs)
         self.dao = self.setup_dao()
+        self.state.token_manager = self.setup_token_manager()
         self.weather_app = self.setup_weather_app()
         self.setup_uavs()
         self.setup_routes()
@@ -47,14 +57,23 @@ class Application(fastapi.FastAPI):
                 database=app.dao.db.get_database(config.DATABASE_NAME),
                 document_models=utils.load_classes('**/models/**.py', (Document,))
             )
+            await location_index.rebuild()
+            if config.SPATIAL_INDEX_REFRESH_SECONDS > 0:
+                app.state.spatial_index_refresh = asyncio.create_task(
+                    location_index.refresh_periodically(config.SPATIAL_INDEX_REFRESH_SECONDS)
+                )
 
         async def db_down(app: Application):
+            refresh = getattr(app.state, "spatial_index_refresh", None)
+            if refresh is not None:
+                refresh.cancel()
             app.dao.db.close()
             logger.debug("Database closed!")
 
         self.add_event_handler(event_type="startup", func=partial(db_up, app=self))
         self.add_event_handler(event_type='shutdown', func=partial(db_down, app=self))
-        return Dao(AsyncIOMotorClient(config.DATABASE_URI))
+        event_listeners = [MongoCommandMetrics()] if config.METRICS_ENABLED else []
+        return Dao(AsyncIOMotorClient(config.DATABASE_URI, event_listeners=event_listeners))
 
     def setup_routes(self):
 
@@ -91,6 +110,8 @@ class Application(fastapi.FastAPI):
                     logging.info("Registered new service: %s", response)
 
             await gk_client.gk_logout(app.state.refresh_token)
+            # The login is shared with the service clients, which must log in again
+            app.state.token_manager.invalidate(app.state.access_token)
 
 
         self.add_event_handler(event_type="startup", func=partial(add_router, app=self))
@@ -138,6 +159,13 @@ class Application(fastapi.FastAPI):
 
     def setup_middlewares(self):
 
+        self.add_middleware(ConditionalMiddleware)
+        # Outside of ConditionalMiddleware, ETags and 304s are decided on the uncompressed body
+        self.add_middleware(CompressionMiddleware)
+        if config.METRICS_ENABLED:
+            # Outermost but for TrustedHost, the duration covers the other middlewares
+            self.add_middleware(MetricsMiddleware)
+            self.add_route(METRICS_PATH, metrics_endpoint, include_in_schema=False)
         self.add_middleware(TrustedHostMiddleware, allowed_hosts=config.EXTRA_ALLOWED_HOSTS)
         return
 
@@ -160,5 +188,14 @@ class Application(fastapi.FastAPI):
         self.add_event_handler(event_type="startup", func=partial(start_scheduler, app=self))
         return
 
+    # Gatekeeper login shared by the service clients, mirrored on app.state
+    def setup_token_manager(self) -> TokenManager:
+
+        async def login():
+            self.state.access_token, self.state.refresh_token = await create_gk_jwt_tokens()
+            return self.state.access_token, self.state.refresh_token
+
+        return TokenManager(login)
+
     async def setup_authentication_tokens(self):
-        self.state.access_token, self.state.refresh_token = await create_gk_jwt_tokens()
+        await self.state.token_manager.refresh()
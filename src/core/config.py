@@ -18,6 +18,17 @@ DATABASE_NAME = os.environ.get('WEATHER_SRV_DATABASE_NAME', 'openagridb')
 # Weather providers
 OPENWEATHERMAP_API_KEY = os.environ.get('WEATHER_SRV_OPENWEATHERMAP_API_KEY', '')
 HISTORY_WEATHER_PROVIDER = os.environ.get('HISTORY_WEATHER_PROVIDER', 'openmeteo')
+HISTORY_WINDOW_DAYS = int(os.environ.get('HISTORY_WINDOW_DAYS', 31))
+# Number of locations fetched with a single Open-Meteo archive request
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 50))
+# Number of location batches onboarded concurrently by a registration job
+ONBOARDING_CONCURRENCY = int(os.environ.get('ONBOARDING_CONCURRENCY', 4))
+# Seconds without progress after which a pending or running onboarding job is resumed by the leader
+ONBOARDING_STALE_SECONDS = int(os.environ.get('ONBOARDING_STALE_SECONDS', 900))
+# Grid cell size in degrees of the in-memory spatial index of cached locations
+SPATIAL_INDEX_CELL_DEGREES = float(os.environ.get('SPATIAL_INDEX_CELL_DEGREES', 0.1))
+# Seconds between rebuilds of the spatial index from MongoDB, dropping locations deleted by other processes
+SPATIAL_INDEX_REFRESH_SECONDS = int(os.environ.get('SPATIAL_INDEX_REFRESH_SECONDS', 300))
 OM_CACHE_VARIABLES = {
     "daily": [
         "temperature_2m_min",
@@ -27,7 +38,8 @@ OM_CACHE_VARIABLES = {
         "rain_sum",
         "wind_speed_10m_max",
         "wind_gusts_10m_max",
-        "wind_direction_10m_dominant"
+        "wind_direction_10m_dominant",
+        "et0_fao_evapotranspiration"
     ],
     "hourly": [
         "temperature_2m",
@@ -63,18 +75,59 @@ WEATHER_SRV_GATEKEEPER_PASSWORD = os.environ.get('WEATHER_SRV_GATEKEEPER_PASSWOR
 # APP
 CURRENT_WEATHER_DATA_CACHE_TIME = os.environ.get('CURRENT_WEATHER_DATA_CACHE_TIME', 1)
 LOCATION_RADIUS_METERS = int(os.environ.get('LOCATION_RADIUS_METERS', 10000))
+# Number of (location, indicator, params) series kept in memory by the indicator engine
+INDICATOR_CACHE_SIZE = int(os.environ.get('INDICATOR_CACHE_SIZE', 1024))
+# Cache-Control max-age of forecast and history responses whose data has no known lifetime
+HTTP_CACHE_MAX_AGE_SECONDS = int(os.environ.get('HTTP_CACHE_MAX_AGE_SECONDS', 300))
+# Cache-Control visibility of forecast and history responses, `public` lets shared proxies store them
+HTTP_CACHE_VISIBILITY = os.environ.get('HTTP_CACHE_VISIBILITY', 'private')
+# Smallest response body, in bytes, compressed for clients accepting gzip, brotli or zstd
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+# Number of compressed responses, keyed by ETag and encoding, kept in memory
+COMPRESSION_CACHE_SIZE = int(os.environ.get('COMPRESSION_CACHE_SIZE', 256))
+# Maximum number of points of a batch forecast request
+BATCH_MAX_POINTS = int(os.environ.get('BATCH_MAX_POINTS', 500))
+# Maximum number of grid cells of a batch forecast request fetched concurrently from OpenWeatherMap
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+# Expose Prometheus metrics at /metrics, disabled by any value but 1, true or yes
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
 
 # FARM CALENDAR
 PUSH_THI_TO_FARMCALENDAR=os.environ.get('PUSH_THI_TO_FARMCALENDAR', '')
 PUSH_FLIGHT_FORECAST_TO_FARMCALENDAR=os.environ.get('PUSH_FLIGHT_FORECAST_TO_FARMCALENDAR', '')
 PUSH_SPRAY_F_TO_FARMCALENDAR=os.environ.get('PUSH_SPRAY_F_TO_FARMCALENDAR', '')
 GATEKEEPER_FARM_CALENDAR_API = os.environ.get('GATEKEEPER_FARM_CALENDAR_API', 'http://farmcalendar:8002/api/v1/').rstrip('/')
+# Seconds a farm name is reused before it is revalidated with Farm Calendar
+FARM_NAME_CACHE_SECONDS = int(os.environ.get('FARM_NAME_CACHE_SECONDS', 3600))
+# Maximum number of concurrent lookup and push requests to Farm Calendar
+FARM_CALENDAR_CONCURRENCY = int(os.environ.get('FARM_CALENDAR_CONCURRENCY', 8))
+# Endpoint accepting a list of observations in one request, observations are posted one by one when empty
+FARM_CALENDAR_BATCH_ENDPOINT = os.environ.get('FARM_CALENDAR_BATCH_ENDPOINT', '')
+# Update the earlier Farm Calendar observation when a forecast status changes instead of adding one
+FARM_CALENDAR_PATCH_CHANGED = os.environ.get('FARM_CALENDAR_PATCH_CHANGED', '')
+# Observations are kept in an outbox until delivered, retried with exponential backoff
+OUTBOX_DRAIN_SECONDS = int(os.environ.get('OUTBOX_DRAIN_SECONDS', 15))
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 10))
+OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get('OUTBOX_RETRY_BASE_SECONDS', 30))
 
 # TASKS
-INTERVAL_THI_TO_FARMCALENDAR = os.environ.get('INTERVAL_HOURS_THI_TO_FARMCALENDAR', 8)
+INTERVAL_THI_TO_FARMCALENDAR = int(os.environ.get('INTERVAL_HOURS_THI_TO_FARMCALENDAR', 8))
+# Maximum number of concurrently running push jobs of each class (THI, flight, spray)
+SCHEDULER_MAX_CONCURRENT_JOBS = int(os.environ.get('SCHEDULER_MAX_CONCURRENT_JOBS', 10))
+# Resolution of the time wheel of the parcel pushes, due parcels are started once per tick
+TIME_WHEEL_TICK_SECONDS = int(os.environ.get('TIME_WHEEL_TICK_SECONDS', 60))
+# Parcels of the same cell of this size are pushed in one batch sharing their weather data
+FORECAST_GRID_DEGREES = float(os.environ.get('FORECAST_GRID_DEGREES', 0.1))
+# Lifetime of the lease of the instance running the scheduled jobs, renewed every third of it
+LEADER_LEASE_SECONDS = int(os.environ.get('LEADER_LEASE_SECONDS', 30))
 
 # JWT
+# Seconds before its expiry the Gatekeeper token used by the service clients is renewed
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get('TOKEN_REFRESH_MARGIN_SECONDS', 60))
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', '240'))
 KEY = os.environ.get('JWT_KEY', 'some-key')
 ALGORITHM = os.environ.get('ALGORITHM', 'HS256')
+# Verified request tokens kept to skip their signature check on the next requests
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
 CRYPT_CONTEXT_SCHEME = os.environ.get('CRYPT_CONTEXT_SCHEME', 'bcrypt')
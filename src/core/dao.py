@@ -1,11 +1,13 @@
 from datetime import datetime, timedelta, timezone
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from uuid import uuid4
 
+from beanie import BulkWriter
 from beanie.odm.operators.find.logical import And
 
 from src.core import config
+from src.core.spatial_index import location_index
 from src.models.point import Point, GeoJSON, PointTypeEnum, GeoJSONTypeEnum
 from src.models.prediction import Prediction
 from src.models.weather_data import WeatherData
@@ -14,6 +16,14 @@ from src.models.history_data import CachedLocation, DailyHistory
 
 logger = logging.getLogger(__name__)
 
+# Lifetime of cached OpenWeatherMap predictions
+PREDICTIONS_CACHE_TIME = timedelta(hours=3)
+
+# Matches documents whose `field` equals one of the coordinate pairs
+def coordinates_filter(field: str, coordinates: List[List[float]]) -> dict:
+    return {field: {"$in": coordinates}}
+
+
 class Dao():
 
     def __init__(self, db_client):
@@ -54,9 +64,24 @@ class Dao():
             return []
 
         logger.debug("Location was cached")
-        three_hours_ago = datetime.utcnow() - timedelta(hours=3)
+        three_hours_ago = datetime.utcnow() - PREDICTIONS_CACHE_TIME
         return await Prediction.find(Prediction.spatial_entity == point, Prediction.created_at >= three_hours_ago).to_list()
 
+    # Fresh Prediction objects of several locations, read with a single query and
+    # grouped by their [lat, lon] coordinates. Locations without any are left out.
+    async def find_predictions_for_points(self, coordinates: List[List[float]]) -> Dict[Tuple[float, float], List[Prediction]]:
+        three_hours_ago = datetime.utcnow() - PREDICTIONS_CACHE_TIME
+        predictions = await Prediction.find(
+            coordinates_filter("spatial_entity.location.coordinates", coordinates),
+            {"spatial_entity.location.type": GeoJSONTypeEnum.POINT.value},
+            Prediction.created_at >= three_hours_ago
+        ).to_list()
+
+        by_point: Dict[Tuple[float, float], List[Prediction]] = {}
+        for prediction in predictions:
+            by_point.setdefault(tuple(prediction.spatial_entity.location.coordinates), []).append(prediction)
+        return by_point
+
     # Finds and returns a list of Prediction objects for a specific location within a radius.
     async def find_prediction_for_radius(self, lat: float, lon: float) -> List[Prediction]:
         ...
@@ -72,47 +97,95 @@ class Dao():
         three_hours_ago = datetime.utcnow() - timedelta(hours=config.CURRENT_WEATHER_DATA_CACHE_TIME)
         return await WeatherData.find_one(WeatherData.spatial_entity == point, WeatherData.created_at >= three_hours_ago)
 
+    # Latest fresh WeatherData of several locations, read with a single query, by [lat, lon] coordinates
+    async def find_weather_data_for_points(self, coordinates: List[List[float]]) -> Dict[Tuple[float, float], WeatherData]:
+        three_hours_ago = datetime.utcnow() - timedelta(hours=config.CURRENT_WEATHER_DATA_CACHE_TIME)
+        weather_data = await WeatherData.find(
+            coordinates_filter("spatial_entity.location.coordinates", coordinates),
+            {"spatial_entity.location.type": GeoJSONTypeEnum.POINT.value},
+            WeatherData.created_at >= three_hours_ago
+        ).sort(-WeatherData.created_at).to_list()
+
+        by_point: Dict[Tuple[float, float], WeatherData] = {}
+        for data in weather_data:
+            by_point.setdefault(tuple(data.spatial_entity.location.coordinates), data)
+        return by_point
+
     # Saves the given weather data for a specific point.
     # Creates and returns the WeatherData object.
     async def save_weather_data_for_point(self, point: Point, **kwargs) -> WeatherData:
         return await WeatherData(spatial_entity=point, **kwargs).create()
 
 
-# Find cached location within the defined radius
+# Find the nearest cached location within the defined radius, looked up in the
+# in-memory spatial index and in MongoDB when it finds nothing. Entries of
+# locations deleted by another process are dropped.
 async def find_location_nearby(lat: float, lon: float, radius_m: int):
-    point = {"type": "Point", "coordinates": [lon, lat]}
-    return await CachedLocation.find_one({
-        "location": {
-            "$near": {
-                "$geometry": point,
-                "$maxDistance": radius_m
-            }
-        }
-    })
+    for _, location_id in location_index.within(lat, lon, radius_m):
+        location = await CachedLocation.get(location_id)
+        if location:
+            return location
+        location_index.remove(location_id)
+    # Another process may have created it since the index was last rebuilt
+    location_id = await location_index.nearest_stored(lat, lon, radius_m)
+    return await CachedLocation.get(location_id) if location_id else None
 
 # Sliding window history updates
-async def update_sliding_window(lon, lat, oldest, yesterday, daily):
-        # 1. Pull the old observation
-        await DailyHistory.find(
-            {
-                "location.coordinates": [lon, lat],
-                "observations.date": oldest
-            }
-        ).update_many(
-            {"$pull": {"observations": {"date": oldest}}}
-        )
-
-        # 2. Push the new observation and update other fields
-        await DailyHistory.find(
-            {
-                "location.coordinates": [lon, lat]
+# Pushes yesterday's observation, keeps observations sorted by date and trims the
+# window to HISTORY_WINDOW_DAYS in a single update. The `$ne` guard turns a rerun
+# for the same day into a no-op instead of duplicating it.
+async def update_sliding_window(lon, lat, oldest, yesterday, daily, bulk_writer: Optional[BulkWriter] = None):
+    await DailyHistory.find(
+        {
+            "location.coordinates": [lon, lat],
+            "observations.date": {"$ne": yesterday}
+        }
+    ).update_many(
+        {
+            "$push": {
+                "observations": {
+                    "$each": [obs.model_dump() for obs in daily],
+                    "$sort": {"date": 1},
+                    "$slice": -config.HISTORY_WINDOW_DAYS
+                }
+            },
+            "$set": {
+                "date_range.start": oldest,
+                "date_range.end": yesterday,
+                "fetched_at": datetime.now(timezone.utc)
             }
-        ).update_many(
-            {
-                "$push": {"observations": daily[0].model_dump()},
-                "$set": {
-                    "date_range.end": yesterday,
-                    "fetched_at": datetime.now(timezone.utc)
+        },
+        bulk_writer=bulk_writer
+    )
+
+
+# Adds missing daily observations of a location in a single upsert, creating the
+# history document when it does not exist. Observations stay sorted by date and
+# the window is trimmed to HISTORY_WINDOW_DAYS.
+async def fill_daily_history(lon, lat, daily, bulk_writer: Optional[BulkWriter] = None):
+    geo = {"type": "Point", "coordinates": [lon, lat]}
+    dates = [obs.date for obs in daily]
+    await DailyHistory.find(
+        DailyHistory.location == geo
+    ).update_many(
+        {
+            "$push": {
+                "observations": {
+                    "$each": [obs.model_dump() for obs in daily],
+                    "$sort": {"date": 1},
+                    "$slice": -config.HISTORY_WINDOW_DAYS
                 }
+            },
+            "$min": {"date_range.start": min(dates)},
+            "$max": {"date_range.end": max(dates)},
+            "$set": {"fetched_at": datetime.now(timezone.utc)},
+            "$setOnInsert": {
+                "type": "historical",
+                "granularity": "daily",
+                "source": "open-meteo",
+                "location": geo
             }
-        )
+        },
+        upsert=True,
+        bulk_writer=bulk_writer
+    )
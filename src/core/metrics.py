@@ -0,0 +1,138 @@
+"""
+Prometheus metrics of the service.
+
+The metrics are registered on the default prometheus_client registry and
+exposed at /metrics. Upstream calls are timed by httpx event hooks of the
+clients, MongoDB commands by a pymongo CommandListener and scheduler jobs by
+an APScheduler listener, so none of them wraps the instrumented code.
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+import httpx
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from prometheus_client import Counter, Histogram
+from pymongo import monitoring
+
+
+# Latency buckets, in seconds, from fast cache hits to slow upstream calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Job buckets, in seconds, from a wheel tick to a full history update
+JOB_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Duration of the HTTP requests served, by route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Duration of the requests to upstream providers",
+    ["provider", "method", "status"], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_RESPONSE_BYTES = Counter(
+    "upstream_response_bytes", "Bytes received from upstream providers", ["provider"]
+)
+MONGODB_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds", "Duration of the MongoDB commands, by collection",
+    ["command", "collection", "outcome"], buckets=LATENCY_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests", "Lookups of the service caches", ["cache", "result"]
+)
+SCHEDULER_JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds", "Duration of the scheduler jobs",
+    ["job", "outcome"], buckets=JOB_BUCKETS
+)
+SCHEDULER_JOB_LAG = Histogram(
+    "scheduler_job_lag_seconds", "Delay between the scheduled and the actual start of the scheduler jobs",
+    ["job"], buckets=LATENCY_BUCKETS
+)
+SCHEDULER_JOBS_MISSED = Counter(
+    "scheduler_jobs_missed", "Scheduler job runs missed past their grace time", ["job"]
+)
+FARMCALENDAR_OBSERVATIONS = Counter(
+    "farmcalendar_observations", "Observations pushed to Farm Calendar, by outcome", ["result"]
+)
+
+
+def record_cache(cache: str, hit: bool, count: int = 1):
+    if count:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc(count)
+
+
+# httpx event hooks timing the requests of a client to `provider`
+def http_event_hooks(provider: str) -> dict:
+
+    async def on_request(request: httpx.Request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    async def on_response(response: httpx.Response):
+        # Read here so the duration and size cover the body, callers read it anyway
+        await response.aread()
+        started = response.request.extensions.get("metrics_started")
+        if started is not None:
+            UPSTREAM_REQUEST_DURATION.labels(provider, response.request.method, str(response.status_code)) \
+                .observe(time.perf_counter() - started)
+        UPSTREAM_RESPONSE_BYTES.labels(provider).inc(len(response.content))
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+# Times MongoDB commands per collection, registered on the MongoDB client
+class MongoCommandMetrics(monitoring.CommandListener):
+
+    # Commands outstanding longer than this are dropped, e.g. of a closed connection
+    MAX_PENDING = 10000
+
+    def __init__(self):
+        # Collection of the outstanding commands, by request id
+        self._pending: Dict[int, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        # getMore names the collection apart from the cursor id
+        field = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(field)
+        if not isinstance(collection, str):
+            collection = ""
+        if len(self._pending) >= self.MAX_PENDING:
+            self._pending.clear()
+        self._pending[event.request_id] = collection
+
+    def _observe(self, event, outcome: str):
+        collection = self._pending.pop(event.request_id, None)
+        if collection is None:
+            return
+        MONGODB_COMMAND_DURATION.labels(event.command_name, collection, outcome) \
+            .observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._observe(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._observe(event, "failure")
+
+
+SCHEDULER_EVENTS = EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED
+
+
+# Times scheduler jobs from their submission to their completion, added to the scheduler
+class SchedulerMetrics:
+
+    def __init__(self):
+        # Start of the running instance of each job, jobs run one instance at a time
+        self._started: Dict[str, float] = {}
+
+    def __call__(self, event):
+        if event.code == EVENT_JOB_SUBMITTED:
+            self._started[event.job_id] = time.perf_counter()
+            if event.scheduled_run_times:
+                lag = datetime.now(timezone.utc) - max(event.scheduled_run_times)
+                SCHEDULER_JOB_LAG.labels(event.job_id).observe(max(0.0, lag.total_seconds()))
+        elif event.code == EVENT_JOB_MISSED:
+            SCHEDULER_JOBS_MISSED.labels(event.job_id).inc()
+        else:
+            started = self._started.pop(event.job_id, None)
+            if started is not None:
+                outcome = "error" if event.code == EVENT_JOB_ERROR else "success"
+                SCHEDULER_JOB_DURATION.labels(event.job_id, outcome).observe(time.perf_counter() - started)
@@ -0,0 +1,148 @@
+"""
+In-process spatial index of the cached locations.
+
+Locations are bucketed in a lat/lon grid of SPATIAL_INDEX_CELL_DEGREES cells.
+A radius lookup only visits the cells overlapping the bounding box of the
+circle, widened towards the poles and wrapped around the antimeridian, and
+checks the candidates with the haversine distance. The index is rebuilt from
+MongoDB on startup and kept up to date by the code inserting and deleting
+cached locations of this process. Lookups the index misses are answered by a
+$geoWithin query served by the 2dsphere index, which also picks up locations
+created by other workers or replicas. Their deletions are dropped by the
+rebuild repeated every SPATIAL_INDEX_REFRESH_SECONDS.
+"""
+
+import asyncio
+import logging
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.core import config
+from src.models.history_data import CachedLocation
+
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+
+Cell = Tuple[int, int]
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+
+    def __init__(self, cell_degrees: Optional[float] = None):
+        self.cell_degrees = cell_degrees or config.SPATIAL_INDEX_CELL_DEGREES
+        self._lon_cells = math.ceil(360 / self.cell_degrees)
+        self._cells: Dict[Cell, Dict[str, Tuple[float, float]]] = {}
+        self._entries: Dict[str, Tuple[float, float, Cell]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, location_id: str) -> bool:
+        return location_id in self._entries
+
+    def _cell(self, lat: float, lon: float) -> Cell:
+        return (
+            math.floor((lat + 90) / self.cell_degrees),
+            math.floor((lon + 180) / self.cell_degrees) % self._lon_cells,
+        )
+
+    def clear(self):
+        self._cells.clear()
+        self._entries.clear()
+
+    def add(self, location_id: str, lat: float, lon: float):
+        self.remove(location_id)
+        cell = self._cell(lat, lon)
+        self._cells.setdefault(cell, {})[location_id] = (lat, lon)
+        self._entries[location_id] = (lat, lon, cell)
+
+    def remove(self, location_id: str):
+        entry = self._entries.pop(location_id, None)
+        if entry is None:
+            return
+        bucket = self._cells[entry[2]]
+        del bucket[location_id]
+        if not bucket:
+            del self._cells[entry[2]]
+
+    def _candidate_cells(self, lat: float, lon: float, radius_m: float) -> Iterable[Cell]:
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        lat_min, lat_max = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+        rows = range(self._cell(lat_min, 0)[0], self._cell(lat_max, 0)[0] + 1)
+
+        # Longitude span of the circle grows with the latitude, all cells near the poles
+        cos_lat = min(math.cos(math.radians(lat_min)), math.cos(math.radians(lat_max)))
+        if lat_min <= -90 or lat_max >= 90 or cos_lat <= 0 or dlat / cos_lat >= 180:
+            columns = range(self._lon_cells)
+        else:
+            dlon = dlat / cos_lat
+            first, last = self._cell(lat, lon - dlon)[1], self._cell(lat, lon + dlon)[1]
+            span = (last - first) % self._lon_cells
+            columns = [(first + i) % self._lon_cells for i in range(span + 1)]
+
+        for row in rows:
+            for column in columns:
+                yield row, column
+
+    # (distance in meters, id) of every location within `radius_m`, nearest first
+    def within(self, lat: float, lon: float, radius_m: float) -> List[Tuple[float, str]]:
+        found = []
+        for cell in self._candidate_cells(lat, lon, radius_m):
+            for location_id, (plat, plon) in self._cells.get(cell, {}).items():
+                distance = haversine_m(lat, lon, plat, plon)
+                if distance <= radius_m:
+                    found.append((distance, location_id))
+        found.sort()
+        return found
+
+    def nearest(self, lat: float, lon: float, radius_m: float) -> Optional[str]:
+        found = self.within(lat, lon, radius_m)
+        return found[0][1] if found else None
+
+    def coordinates(self, location_id: str) -> Optional[Tuple[float, float]]:
+        entry = self._entries.get(location_id)
+        return (entry[0], entry[1]) if entry else None
+
+    # Rebuilt aside and swapped in, lookups never see a partial index
+    async def rebuild(self):
+        fresh = SpatialIndex(self.cell_degrees)
+        cursor = CachedLocation.get_motor_collection().find({}, {"_id": 1, "location.coordinates": 1})
+        async for doc in cursor:
+            lon, lat = doc["location"]["coordinates"]
+            fresh.add(str(doc["_id"]), lat, lon)
+        self._cells, self._entries = fresh._cells, fresh._entries
+        logger.info("Spatial index rebuilt with %d cached locations", len(self))
+
+    # Nearest location within `radius_m` stored in MongoDB, for lookups the index
+    # missed. The locations found, e.g. created by another process, are indexed.
+    async def nearest_stored(self, lat: float, lon: float, radius_m: float) -> Optional[str]:
+        query = {"location": {"$geoWithin": {"$centerSphere": [[lon, lat], radius_m / EARTH_RADIUS_M]}}}
+        cursor = CachedLocation.get_motor_collection().find(query, {"_id": 1, "location.coordinates": 1})
+        found = []
+        async for doc in cursor:
+            plon, plat = doc["location"]["coordinates"]
+            self.add(str(doc["_id"]), plat, plon)
+            found.append((haversine_m(lat, lon, plat, plon), str(doc["_id"])))
+        return min(found)[1] if found else None
+
+    async def refresh_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.warning("Spatial index refresh failed: %s", e)
+
+
+# Index of the cached locations shared by the whole process
+location_index = SpatialIndex()
@@ -2,10 +2,11 @@ import logging
 from fastapi import HTTPException
 import httpx
 from datetime import date, datetime, timezone
-from typing import Dict, List, Optional, Protocol, Union
+from typing import Dict, List, Optional, Protocol, Tuple, Union
 import os
 
 from src.core import config
+from src.core import metrics
 from src.schemas.history_data import DailyObservationOut, HourlyObservationOut
 
 
@@ -22,6 +23,16 @@ class WeatherProvider(Protocol):
     ) -> List[DailyObservationOut]:
         ...
 
+    async def get_hourly_history_batch(
+            self, coords: List[Tuple[float, float]], start: date, end: date, variables: List[str]
+    ) -> List[List[HourlyObservationOut]]:
+        ...
+
+    async def get_daily_history_batch(
+            self, coords: List[Tuple[float, float]], start: date, end: date, variables: List[str]
+    ) -> List[List[DailyObservationOut]]:
+        ...
+
     async def get_hourly_forecast(
             self, lat: float, lon: float, days: int = 5
     ) -> List[HourlyObservationOut]:
@@ -41,7 +52,7 @@ class OpenMeteoClient:
         """Fetch data from Open-Meteo API with error handling."""
         target_url = url or self.BASE_URL
         try:
-            async with httpx.AsyncClient() as client:
+            async with httpx.AsyncClient(event_hooks=metrics.http_event_hooks("open-meteo")) as client:
                 response = await client.get(target_url, params=params, timeout=10.0)
                 response.raise_for_status()
                 return response.json()
@@ -66,14 +77,7 @@ class OpenMeteoClient:
         }
 
         data = await self._fetch_data(params)
-        timestamps = data["hourly"]["time"]
-        results = []
-
-        for i, t in enumerate(timestamps):
-            values = {v: data["hourly"][v][i] for v in variables if v in data["hourly"]}
-            results.append(HourlyObservationOut(timestamp=datetime.fromisoformat(t), values=values))
-
-        return results
+        return self._parse_hourly(data, variables)
 
     async def get_daily_history(self, lat: float, lon: float, start: date, end: date, variables: List[str]) -> List[DailyObservationOut]:
         params = {
@@ -86,15 +90,67 @@ class OpenMeteoClient:
         }
 
         data = await self._fetch_data(params)
+        return self._parse_daily(data, variables)
+
+    def _parse_hourly(self, data: dict, variables: List[str]) -> List[HourlyObservationOut]:
+        timestamps = data["hourly"]["time"]
+        results = []
+
+        for i, t in enumerate(timestamps):
+            values = {v: data["hourly"][v][i] for v in variables if v in data["hourly"]}
+            results.append(HourlyObservationOut.model_construct(timestamp=datetime.fromisoformat(t), values=values))
+
+        return results
+
+    def _parse_daily(self, data: dict, variables: List[str]) -> List[DailyObservationOut]:
         timestamps = data["daily"]["time"]
         results = []
 
         for i, t in enumerate(timestamps):
             values = {v: data["daily"][v][i] for v in variables if v in data["daily"]}
-            results.append(DailyObservationOut(date=date.fromisoformat(t), values=values))
+            results.append(DailyObservationOut.model_construct(date=date.fromisoformat(t), values=values))
 
         return results
 
+    # ---- Batched history (one archive call for many coordinates) ----
+
+    async def _fetch_batch(
+        self, coords: List[Tuple[float, float]], granularity: str, start: date, end: date, variables: List[str]
+    ) -> List[dict]:
+        params = {
+            "latitude": ",".join(str(lat) for lat, _ in coords),
+            "longitude": ",".join(str(lon) for _, lon in coords),
+            granularity: ",".join(variables),
+            "timezone": "auto",
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat()
+        }
+
+        data = await self._fetch_data(params)
+        # Open-Meteo returns a list (in request order) for multiple coordinates
+        # and a single object for one coordinate
+        return data if isinstance(data, list) else [data]
+
+    async def get_hourly_history_batch(
+        self, coords: List[Tuple[float, float]], start: date, end: date, variables: List[str]
+    ) -> List[List[HourlyObservationOut]]:
+        """
+        Fetch hourly history for many ``(lat, lon)`` pairs with a single
+        archive request. Results are returned in the order of ``coords``.
+        """
+        batch = await self._fetch_batch(coords, "hourly", start, end, variables)
+        return [self._parse_hourly(data, variables) for data in batch]
+
+    async def get_daily_history_batch(
+        self, coords: List[Tuple[float, float]], start: date, end: date, variables: List[str]
+    ) -> List[List[DailyObservationOut]]:
+        """
+        Fetch daily history for many ``(lat, lon)`` pairs with a single
+        archive request. Results are returned in the order of ``coords``.
+        """
+        batch = await self._fetch_batch(coords, "daily", start, end, variables)
+        return [self._parse_daily(data, variables) for data in batch]
+
     async def get_single_day_history(self, lat: float, lon: float, day: date, variables: dict[str, List[str]]) -> tuple[List[HourlyObservationOut], List[DailyObservationOut]]:
         hourly = await self.get_hourly_history(lat, lon, day, day, variables.get("hourly", []))
         daily = await self.get_daily_history(lat, lon, day, day, variables.get("daily", []))
@@ -157,7 +213,7 @@ class OpenMeteoClient:
                 if var in data["hourly"]:
                     values[var] = data["hourly"][var][i]
             results.append(
-                HourlyObservationOut(
+                HourlyObservationOut.model_construct(
                     timestamp=datetime.fromisoformat(t),
                     values=values,
                 )
@@ -224,7 +280,7 @@ class OpenMeteoClient:
                 if var in data["daily"]:
                     values[var] = data["daily"][var][i]
             results.append(
-                DailyObservationOut(
+                DailyObservationOut.model_construct(
                     date=date.fromisoformat(t),
                     values=values,
                 )
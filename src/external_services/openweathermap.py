@@ -7,6 +7,7 @@ from fastapi import HTTPException
 from beanie.operators import In, And
 
 from src.core import config
+from src.core import metrics
 from src import utils
 from src.core.dao import Dao
 from src.models.point import Point
@@ -62,6 +63,7 @@ class OpenWeatherMap():
     async def get_predictions(self, lat: float, lon: float) -> List[Prediction]:
         try:
             predictions = await self.dao.find_predictions_for_point(lat, lon)
+            metrics.record_cache("forecast", bool(predictions))
             if predictions:
                 return predictions
 
@@ -198,6 +200,7 @@ class OpenWeatherMap():
     async def save_weather_data_thi(self, lat: float, lon: float) -> WeatherData:
         try:
             weather_data = await self.dao.find_weather_data_for_point(lat, lon)
+            metrics.record_cache("weather", bool(weather_data))
             if weather_data:
                 return weather_data
 
@@ -263,6 +266,9 @@ class OpenWeatherMap():
             else:
                 results.extend(existing)
 
+        metrics.record_cache("flight", True, len(uav_model_names) - len(models_to_fetch))
+        metrics.record_cache("flight", False, len(models_to_fetch))
+
         # If no models need data, return what we found
         if not models_to_fetch:
             return results if return_existing else []
@@ -316,6 +322,7 @@ class OpenWeatherMap():
             SprayForecast.created_at >= hours_ago,
         )).to_list()
 
+        metrics.record_cache("spray", bool(results))
         if results:
             return results if return_existing else []
 
@@ -1,5 +1,5 @@
 from beanie import Document
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Dict, List, Optional, Union
 from datetime import datetime, timezone, date
 
@@ -18,7 +18,8 @@ class CachedLocation(Document):
     class Settings:
         name = "cached_locations"
         indexes = [
-            IndexModel([("location", GEOSPHERE)])
+            IndexModel([("location", GEOSPHERE)]),
+            IndexModel([("name", 1)])
         ]
 
 class HourlyObservation(BaseModel):
@@ -59,3 +60,36 @@ class DailyHistory(Document):
         indexes = [
             IndexModel([("location", GEOSPHERE)])
         ]
+
+
+# Unique key of a rollup, scalar fields only
+ROLLUP_KEY = [("lon", 1), ("lat", 1), ("resolution", 1), ("period_start", 1)]
+
+
+class HistoryRollup(Document):
+    location: Dict = Field(..., description="GeoJSON Point")
+    # Scalar copies of the coordinates keying the rollup, `location.coordinates` is
+    # an array and a unique index on it would be multikey, one entry per value
+    lon: Optional[float] = None
+    lat: Optional[float] = None
+    resolution: str = Field(..., description="daily, weekly or monthly")
+    period_start: date
+    period_end: date
+    values: Dict[str, Dict[str, Optional[float]]] = Field(
+        default_factory=dict, description="Per variable min, max, mean, sum and count"
+    )
+    updated_at: datetime = Field(default_factory=get_utc_now)
+    source: str = "open-meteo"
+
+    @model_validator(mode="after")
+    def _set_key(self):
+        if self.lon is None or self.lat is None:
+            self.lon, self.lat = self.location["coordinates"]
+        return self
+
+    class Settings:
+        name = "weather_history_rollups"
+        indexes = [
+            IndexModel([("location", GEOSPHERE)]),
+            IndexModel(ROLLUP_KEY, unique=True, name="rollup_period_unique")
+        ]
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+
+
+class SchedulerLease(Document):
+    name: str = Field(..., description="Name of the leased role, e.g. scheduler")
+    holder: str = Field(..., description="Id of the instance holding the lease")
+    expires_at: datetime
+    renewed_at: datetime
+
+    class Settings:
+        name = "scheduler_leases"
+        indexes = [
+            IndexModel([("name", 1)], unique=True)
+        ]
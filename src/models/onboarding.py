@@ -0,0 +1,45 @@
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
+
+from beanie import Document
+from pydantic import BaseModel, Field
+
+from src.models.history_data import get_utc_now
+
+
+class OnboardingStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class OnboardingResultStatus(str, Enum):
+    PENDING = "pending"
+    CACHED = "cached"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+class OnboardingResult(BaseModel):
+    name: Optional[str] = None
+    lat: float
+    lon: float
+    status: OnboardingResultStatus = OnboardingResultStatus.PENDING
+    location_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class OnboardingJob(Document):
+    status: OnboardingStatus = OnboardingStatus.PENDING
+    unique: bool = Field(default=False, description="Skip locations with a cached location nearby")
+    results: List[OnboardingResult]
+    created_at: datetime = Field(default_factory=get_utc_now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Stamped on every save while the job runs, jobs not saved for long were left by a stopped instance
+    updated_at: datetime = Field(default_factory=get_utc_now)
+
+    class Settings:
+        name = "onboarding_jobs"
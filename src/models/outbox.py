@@ -0,0 +1,37 @@
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+
+from src.models.history_data import get_utc_now
+
+
+class OutboxStatus(str, Enum):
+    PENDING = "pending"
+    DELIVERED = "delivered"
+    DEAD = "dead"
+
+
+class OutboxMessage(Document):
+    key: str = Field(..., description="Idempotency key of the observation")
+    payload: dict = Field(..., description="JSON-LD observation to post to Farm Calendar")
+    content_hash: Optional[str] = Field(default=None, description="Hash of the observed status, unchanged ones are not pushed again")
+    remote_id: Optional[str] = Field(default=None, description="@id of the observation created in Farm Calendar")
+    status: OutboxStatus = OutboxStatus.PENDING
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=get_utc_now)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=get_utc_now)
+    delivered_at: Optional[datetime] = None
+
+    class Settings:
+        name = "farmcalendar_outbox"
+        indexes = [
+            IndexModel([("key", 1)], unique=True),
+            IndexModel([("status", 1), ("next_attempt_at", 1)]),
+            # Delivered messages are only kept for a week
+            IndexModel([("delivered_at", 1)], expireAfterSeconds=7 * 24 * 3600),
+        ]
@@ -0,0 +1,24 @@
+from datetime import datetime
+from typing import Optional
+
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+
+from src.models.history_data import get_utc_now
+
+
+class ParcelSchedule(Document):
+    key: str = Field(..., description="Id of the recurring push, e.g. thi_task_<lat>_<lon>")
+    kind: str
+    interval_s: float
+    payload: dict = Field(..., description="Parcel info passed to the push")
+    next_run: datetime
+    last_run: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=get_utc_now)
+
+    class Settings:
+        name = "parcel_schedules"
+        indexes = [
+            IndexModel([("key", 1)], unique=True)
+        ]
@@ -1,11 +1,18 @@
 import httpx
-from typing import Dict, Any, Optional
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 
 from fastapi import FastAPI, HTTPException
 
+from src.core import metrics
 from src.core.exceptions import RefreshJWTTokenError
 
 
+# Number of responses kept for conditional GET requests per client
+CONDITIONAL_CACHE_SIZE = 1024
+
+
 class MicroserviceClient:
     def __init__(
         self, base_url: str, service_name: str, app: FastAPI, timeout: float = 5.0
@@ -14,11 +21,24 @@ class MicroserviceClient:
         self.service_name = service_name
         self.app = app
         self.timeout = timeout
-        self.client = httpx.AsyncClient(timeout=timeout)
+        self.client = httpx.AsyncClient(timeout=timeout, event_hooks=metrics.http_event_hooks(service_name))
+        # (ETag, Last-Modified, body) of conditional GET responses, by url
+        self._conditional: "OrderedDict[str, Tuple[Optional[str], Optional[str], Any]]" = OrderedDict()
+
+    # Token of the app's TokenManager, renewed ahead of its expiry by a single login
+    # shared by all clients, or the plain app.state token of apps without one
+    async def _get_token(self) -> Optional[str]:
+        manager = getattr(self.app.state, "token_manager", None)
+        if manager is None:
+            return getattr(self.app.state, "access_token", None)
+        try:
+            return await manager.get_token()
+        except Exception as e:
+            logging.warning("Could not obtain a JWT token for %s: %s", self.service_name, e)
+            return None
 
-    def _get_auth_header(self) -> Dict[str, str]:
-        # Get token from app.state
-        token = self.app.state.access_token
+    async def _get_auth_header(self) -> Dict[str, str]:
+        token = await self._get_token()
 
         if not token:
             raise HTTPException(
@@ -27,11 +47,18 @@ class MicroserviceClient:
 
         return {"Authorization": f"Bearer {token}"}
 
+    def _invalidate_token(self, authorization: Optional[str]):
+        manager = getattr(self.app.state, "token_manager", None)
+        if manager is not None and authorization:
+            manager.invalidate(authorization.removeprefix("Bearer "))
+
     async def close(self):
         await self.client.aclose()
 
+    # With `conditional`, a GET revalidates the previous response of the url with
+    # If-None-Match / If-Modified-Since and reuses its body on 304 Not Modified
     async def request(
-        self, method: str, endpoint: str, auth_required: bool = True, **kwargs
+        self, method: str, endpoint: str, auth_required: bool = True, conditional: bool = False, **kwargs
     ) -> Dict[str, Any]:
 
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
@@ -39,7 +66,7 @@ class MicroserviceClient:
         # Add auth headers if required
         headers = kwargs.get("headers", {})
         if auth_required:
-            headers.update(self._get_auth_header())
+            headers.update(await self._get_auth_header())
 
         # Add common headers
         headers.update(
@@ -49,6 +76,17 @@ class MicroserviceClient:
             }
         )
 
+        cache_key, cached = None, None
+        if conditional and method == "GET":
+            cache_key = str(httpx.URL(url, params=kwargs.get("params")))
+            cached = self._conditional.get(cache_key)
+            if cached:
+                etag, last_modified, _ = cached
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+
         kwargs["headers"] = headers
 
         try:
@@ -56,17 +94,27 @@ class MicroserviceClient:
 
             # Handle authentication errors
             if response.status_code == 401:
-                # TODO: Remove unused code
-                # await self.app.setup_authentication_tokens()
+                # The retry logs in again, once for all requests rejected with this token
+                self._invalidate_token(headers.get("Authorization"))
                 raise RefreshJWTTokenError(self.service_name)
 
+            # Not modified since the cached response, httpx would raise on the 3xx
+            if response.status_code == 304 and cached:
+                metrics.record_cache("upstream_conditional", True)
+                self._conditional.move_to_end(cache_key)
+                return cached[2]
+
             # Raise exception for other error responses
             response.raise_for_status()
 
             # Return JSON response or empty dict for 204 No Content
             if response.status_code == 204:
                 return {}
-            return response.json()
+            body = response.json()
+            if cache_key:
+                metrics.record_cache("upstream_conditional", False)
+                self._remember(cache_key, response, body)
+            return body
 
         except httpx.HTTPStatusError as e:
             # Convert to FastAPI HTTPException with appropriate status code
@@ -88,6 +136,16 @@ class MicroserviceClient:
                 detail=f"Service unavailable ({self.service_name}): {str(e)}",
             )
 
+    def _remember(self, cache_key: str, response: httpx.Response, body: Any):
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self._conditional.pop(cache_key, None)
+            return
+        self._conditional[cache_key] = (etag, last_modified, body)
+        self._conditional.move_to_end(cache_key)
+        while len(self._conditional) > CONDITIONAL_CACHE_SIZE:
+            self._conditional.popitem(last=False)
+
     async def get(
         self, endpoint: str, params: Optional[Dict[str, Any]] = None, **kwargs
     ):
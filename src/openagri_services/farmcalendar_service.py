@@ -1,10 +1,11 @@
 import logging
 import asyncio
+import hashlib
 import json
 import re
 import time
-from typing import Optional, Tuple
-from uuid import uuid4
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID, uuid5
 
 from fastapi import FastAPI, HTTPException
 import backoff
@@ -14,21 +15,28 @@ from src import utils
 from src.core.exceptions import RefreshJWTTokenError
 from src.openagri_services.base import MicroserviceClient
 from src.openagri_services.interoperability import MadeBySensorSchema, ObservationSchema, QuantityValueSchema
+from src.services import outbox
 
 
 logger = logging.getLogger(__name__)
 
+# Namespace of the deterministic observation ids
+OBSERVATION_NAMESPACE = UUID("5d0c1f0e-8b1a-4f7e-9a53-2f1c6e0b7a41")
+# Number of observations per request to the batch endpoint
+OBSERVATION_BATCH_SIZE = 100
+
 class FarmCalendarServiceClient(MicroserviceClient):
 
     def __init__(self, app: FastAPI):
         super().__init__(base_url=config.GATEKEEPER_FARM_CALENDAR_API, service_name="Farm Calendar", app=app)
+        # (name, monotonic fetch time) by farm UUID
+        self._farm_names: Dict[str, Tuple[str, float]] = {}
+        # Bounds the lookup and push requests in flight to Farm Calendar
+        self._semaphore = asyncio.Semaphore(config.FARM_CALENDAR_CONCURRENCY)
 
     @backoff.on_exception(
         backoff.expo,
         (HTTPException, RefreshJWTTokenError),
-        # The following lambda uses `self.app` instance from `details` argument to run
-        # the `setup_authentication_tokens` method in an async contenxt using the running event loop
-        on_backoff=lambda details: asyncio.create_task(details['args'][0].app.setup_authentication_tokens()),
         max_tries=3
     )
     async def fetch_or_create_activity_type(self, activity_type: str, description: str, category="observation") -> str:
@@ -76,39 +84,23 @@ class FarmCalendarServiceClient(MicroserviceClient):
     @backoff.on_exception(
         backoff.expo,
         (HTTPException,RefreshJWTTokenError),
-        on_backoff=lambda details: asyncio.create_task(details['args'][0].app.setup_authentication_tokens()),
         max_tries=3
     )
     async def fetch_locations(self):
         response = await self.get('/FarmParcels/')
+        parcels = response.get("@graph", [])
+
+        # Farm names of all parcels, each farm looked up once
+        farm_ids = {self._farm_uuid(parcel) for parcel in parcels} - {""}
+        farm_names = await self._fetch_farm_names(farm_ids)
 
         locations = []
-        for parcel in response.get("@graph", []):
+        for parcel in parcels:
             lat = parcel.get("location", {}).get("lat")
             lon = parcel.get("location", {}).get("long")
             identifier = parcel.get("identifier", "Unknown")
+            farm_name = farm_names.get(self._farm_uuid(parcel), "Unknown Farm")
 
-            # Extract farm name from farm URN reference
-            farm_ref = parcel.get("farm", {})
-            farm_id = farm_ref.get("@id", "")
-
-            # Fetch farm details to get the farm name
-            farm_name = "Unknown Farm"
-            if farm_id:
-                try:
-                    # Extract UUID from URN (format: urn:farmcalendar:Farm:uuid)
-                    farm_uuid = farm_id.split(":")[-1] if ":" in farm_id else farm_id
-                    farm_response = await self.get(f'/Farm/{farm_uuid}/')
-                    farm_graph = farm_response.get("@graph", [{}])
-                    if farm_graph:
-                        farm_name = farm_graph[0].get("name", "Unknown Farm")
-                except Exception as e:
-                     # Re-raise auth/HTTP-related exceptions so backoff can handle retries/token refresh.
-                    if isinstance(e, (HTTPException, RefreshJWTTokenError)):
-                        raise
-                    logger.warning(f"Could not fetch farm name for {farm_id}: {e}")
-
-            
             if lat is not None and lon is not None:
                 locations.append({
                     "lat": lat,
@@ -130,6 +122,42 @@ class FarmCalendarServiceClient(MicroserviceClient):
             logger.debug(f"Processing parcel {identifier} at lat: {lat}, lon: {lon}")
         return locations
 
+    # Extract farm UUID from the farm URN reference of a parcel (format: urn:farmcalendar:Farm:uuid)
+    def _farm_uuid(self, parcel: dict) -> str:
+        farm_id = parcel.get("farm", {}).get("@id", "")
+        return farm_id.split(":")[-1] if ":" in farm_id else farm_id
+
+    # Names of the given farms, from the TTL cache or fetched with bounded concurrency
+    async def _fetch_farm_names(self, farm_uuids: Set[str]) -> Dict[str, str]:
+        now = time.monotonic()
+        names = {}
+        missing = []
+        for farm_uuid in farm_uuids:
+            cached = self._farm_names.get(farm_uuid)
+            if cached and now - cached[1] < config.FARM_NAME_CACHE_SECONDS:
+                names[farm_uuid] = cached[0]
+            else:
+                missing.append(farm_uuid)
+
+        async def fetch(farm_uuid: str):
+            async with self._semaphore:
+                try:
+                    # Expired entries are revalidated, unchanged farms answer 304 when supported
+                    farm_response = await self.get(f'/Farm/{farm_uuid}/', conditional=True)
+                except (HTTPException, RefreshJWTTokenError):
+                    # Re-raise auth/HTTP-related exceptions so backoff can handle retries/token refresh.
+                    raise
+                except Exception as e:
+                    logger.warning(f"Could not fetch farm name for {farm_uuid}: {e}")
+                    return
+            farm_graph = farm_response.get("@graph", [{}])
+            name = farm_graph[0].get("name", "Unknown Farm") if farm_graph else "Unknown Farm"
+            self._farm_names[farm_uuid] = (name, time.monotonic())
+            names[farm_uuid] = name
+
+        await asyncio.gather(*(fetch(farm_uuid) for farm_uuid in missing))
+        return names
+
     # Extract first coordinate pair (lat, lon) from WKT POLYGON
     def _parse_wkt(self, wkt: str) -> Optional[Tuple[float, float]]:
         match = re.search(r"POLYGON\(\(\s*([\d\.\-]+) ([\d\.\-]+)", wkt)
@@ -147,7 +175,6 @@ class FarmCalendarServiceClient(MicroserviceClient):
     @backoff.on_exception(
         backoff.expo,
         (HTTPException, RefreshJWTTokenError),
-        on_backoff=lambda details: asyncio.create_task(details['args'][0].app.setup_authentication_tokens()),
         max_tries=3
     )
     async def fetch_uavs(self):
@@ -160,13 +187,86 @@ class FarmCalendarServiceClient(MicroserviceClient):
         self.app.state.uavmodels = await self.fetch_uavs()
         logging.info(f"Cached {len(self.app.state.uavmodels)} UAV machines.")
 
-    # Async function to post THI data with JWT authentication
+    # Deterministic id of an observation, the same for every attempt to push it
+    def _observation_uuid(self, kind: str, location_info: dict, phenomenon_time: str, sensor: str = "") -> UUID:
+        parts = [kind, str(location_info["lat"]), str(location_info["lon"]),
+                 location_info.get("identifier", "Unknown"), phenomenon_time, sensor]
+        return uuid5(OBSERVATION_NAMESPACE, "|".join(parts))
+
+    # Hash of what an observation reports, its title and result; the details of
+    # flight forecasts carry raw weather values that change on every refresh
+    def _status_hash(self, observation: ObservationSchema) -> str:
+        content = json.dumps([observation.title, observation.hasResult.hasValue])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    # Idempotency key of one version of an observation, retries of the version share it
+    def _idempotency_key(self, message: dict) -> str:
+        return f"{message['key']}:{(message.get('content_hash') or '')[:16]}"
+
+    # Post a single observation, or update the observation it replaces when Farm
+    # Calendar returned its id and updates are enabled, retried on its own.
+    # Returns the @id of the observation in Farm Calendar when known.
+    @backoff.on_exception(
+        backoff.expo,
+        (HTTPException, RefreshJWTTokenError),
+        max_tries=3
+    )
+    async def _post_observation(self, message: dict) -> Optional[str]:
+        headers = {"Idempotency-Key": self._idempotency_key(message)}
+        async with self._semaphore:
+            remote_id = message.get("remote_id")
+            if remote_id and config.FARM_CALENDAR_PATCH_CHANGED:
+                await self.patch(f'/Observations/{remote_id.split(":")[-1]}/', json=message["payload"], headers=headers)
+                return remote_id
+            response = await self.post('/Observations/', json=message["payload"], headers=headers)
+        return response.get("@id") if isinstance(response, dict) else None
+
     @backoff.on_exception(
         backoff.expo,
         (HTTPException, RefreshJWTTokenError),
-        on_backoff=lambda details: asyncio.create_task(details['args'][0].app.setup_authentication_tokens()),
         max_tries=3
     )
+    async def _post_observation_batch(self, messages: List[dict]):
+        key = str(uuid5(OBSERVATION_NAMESPACE, "|".join(self._idempotency_key(m) for m in messages)))
+        async with self._semaphore:
+            await self.post(
+                config.FARM_CALENDAR_BATCH_ENDPOINT,
+                json=[message["payload"] for message in messages],
+                headers={"Idempotency-Key": key}
+            )
+
+    # Write observations to the outbox, they are delivered by the outbox drainer.
+    # Observations whose status did not change since they were queued are dropped.
+    async def push_observations(self, observations: List[Tuple[UUID, ObservationSchema]]):
+        messages = []
+        for observation_uuid, observation in observations:
+            json_payload = observation.model_dump(by_alias=True, exclude_none=True)
+            logger.debug(json_payload)
+            messages.append((str(observation_uuid), json_payload, self._status_hash(observation)))
+        report = await outbox.enqueue(messages)
+        logger.debug(f"Observations queued: {report}")
+
+    # Post outbox messages concurrently, bounded by the requests in flight to Farm
+    # Calendar, or in batches when a batch endpoint is configured. Returns the errors
+    # of the undelivered messages and the Farm Calendar ids of the delivered ones by key.
+    async def deliver_observations(self, messages: List[dict]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        if config.FARM_CALENDAR_BATCH_ENDPOINT:
+            groups = utils.chunked(messages, OBSERVATION_BATCH_SIZE)
+            requests = [self._post_observation_batch(group) for group in groups]
+        else:
+            groups = [[message] for message in messages]
+            requests = [self._post_observation(message) for message in messages]
+
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        errors, remote_ids = {}, {}
+        for group, result in zip(groups, results):
+            if isinstance(result, Exception):
+                errors.update({message["key"]: str(result) or type(result).__name__ for message in group})
+            elif result:
+                remote_ids[group[0]["key"]] = result
+        return errors, remote_ids
+
+    # Async function to post THI data with JWT authentication
     async def send_thi(self, location_info):
         lat = location_info["lat"]
         lon = location_info["lon"]
@@ -177,6 +277,8 @@ class FarmCalendarServiceClient(MicroserviceClient):
         # Get current unix timestamp
         current_timestamp = int(time.time())
         timezone = weather_data.data['timezone']
+        phenomenon_time = utils.convert_timestamp_to_string(current_timestamp, timezone, iso=True)
+        observation_uuid = self._observation_uuid("thi", location_info, phenomenon_time)
         observation = ObservationSchema(
             activityType=self.thi_activity_type,
             title=f"{farm_name}: {parcel_identifier} - THI: {str(round(weather_data.thi, 2))}",
@@ -186,26 +288,18 @@ class FarmCalendarServiceClient(MicroserviceClient):
                 f"Parcel Identifier: {parcel_identifier}\n"
                 f"Location: lat {lat}, lon {lon}"
             ),
-            phenomenonTime=utils.convert_timestamp_to_string(current_timestamp, timezone, iso=True),
+            phenomenonTime=phenomenon_time,
             hasResult=QuantityValueSchema(
                 **{
-                    "@id": f"urn:farmcalendar:QuantityValue:{uuid4()}",
+                    "@id": f"urn:farmcalendar:QuantityValue:{observation_uuid}",
                     "hasValue": str(round(weather_data.thi, 2))
                 }
             ),
             observedProperty="temperature_humidity_index"
         )
-        json_payload = observation.model_dump(by_alias=True, exclude_none=True)
-        logger.debug(json_payload)
-        await self.post('/Observations/', json=json_payload)
+        await self.push_observations([(observation_uuid, observation)])
 
     # Async function to post Flight Forecast data with JWT authentication
-    @backoff.on_exception(
-        backoff.expo,
-        (HTTPException, RefreshJWTTokenError),
-        on_backoff=lambda details: asyncio.create_task(details['args'][0].app.setup_authentication_tokens()),
-        max_tries=3
-    )
     async def send_flight_forecast(self, location_info, uavmodels):
         lat = location_info["lat"]
         lon = location_info["lon"]
@@ -213,9 +307,13 @@ class FarmCalendarServiceClient(MicroserviceClient):
         parcel_identifier = location_info.get("identifier", "Unknown")
 
         fly_statuses = await self.app.weather_app.ensure_forecast_for_uavs_and_location(lat, lon, uavmodels, return_existing=False)
+        observations = []
         for fly_status in fly_statuses:
             phenomenon_time = fly_status.timestamp.isoformat()
             weather_str = f"Weather params: {json.dumps(fly_status.weather_params)}"
+            observation_uuid = self._observation_uuid(
+                "flight_forecast", location_info, phenomenon_time, fly_status.uav_model
+            )
             observation = ObservationSchema(
                 activityType=self.ff_activity_type,
                 title=f"Farm: {farm_name}, Parcel: {parcel_identifier} - {fly_status.uav_model}: {fly_status.status}",
@@ -230,23 +328,16 @@ class FarmCalendarServiceClient(MicroserviceClient):
                 madeBySensor=MadeBySensorSchema(name=fly_status.uav_model),
                 hasResult=QuantityValueSchema(
                     **{
-                        "@id": f"urn:farmcalendar:QuantityValue:{uuid4()}",
+                        "@id": f"urn:farmcalendar:QuantityValue:{observation_uuid}",
                         "hasValue": fly_status.status
                     }
                 ),
                 observedProperty="flight_forecast_observation"
             )
-            json_payload = observation.model_dump(by_alias=True, exclude_none=True)
-            logger.debug(json_payload)
-            await self.post('/Observations/', json=json_payload)
+            observations.append((observation_uuid, observation))
+        await self.push_observations(observations)
 
     # Async function to post spray conditions Forecast data with JWT authentication
-    @backoff.on_exception(
-        backoff.expo,
-        (HTTPException, RefreshJWTTokenError),
-        on_backoff=lambda details: asyncio.create_task(details['args'][0].app.setup_authentication_tokens()),
-        max_tries=3
-    )
     async def send_spray_forecast(self, location_info):
         lat = location_info["lat"]
         lon = location_info["lon"]
@@ -255,8 +346,10 @@ class FarmCalendarServiceClient(MicroserviceClient):
         
         spray_forecasts = await self.app.weather_app.ensure_spray_forecast_for_location(lat, lon, return_existing=False)
 
+        observations = []
         for sf in spray_forecasts:
             phenomenon_time = sf.timestamp.isoformat()
+            observation_uuid = self._observation_uuid("spray_forecast", location_info, phenomenon_time)
 
             observation = ObservationSchema(
                 activityType=self.sp_activity_type,
@@ -271,13 +364,11 @@ class FarmCalendarServiceClient(MicroserviceClient):
                 phenomenonTime=phenomenon_time,
                 hasResult=QuantityValueSchema(
                     **{
-                        "@id": f"urn:farmcalendar:QuantityValue:{uuid4()}",
+                        "@id": f"urn:farmcalendar:QuantityValue:{observation_uuid}",
                         "hasValue": sf.spray_conditions
                     }
                 ),
                 observedProperty="spray_forecast_observation"
             )
-
-            json_payload = observation.model_dump(by_alias=True, exclude_none=True)
-            logger.debug(json_payload)
-            await self.post('/Observations/', json=json_payload)
+            observations.append((observation_uuid, observation))
+        await self.push_observations(observations)
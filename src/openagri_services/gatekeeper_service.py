@@ -2,6 +2,7 @@ from fastapi import FastAPI
 import httpx
 
 from src.core import config
+from src.core import metrics
 from src.openagri_services.base import MicroserviceClient
 
 class GatekeeperServiceClient(MicroserviceClient):
@@ -18,7 +19,7 @@ class GatekeeperServiceClient(MicroserviceClient):
             'password': config.WEATHER_SRV_GATEKEEPER_PASSWORD
         }
 
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(event_hooks=metrics.http_event_hooks("Gatekeeper")) as client:
             url = f'{config.GATEKEEPER_URL}/api/login/'
             r = await client.post(url, data=login_credentials)
             r.raise_for_status()
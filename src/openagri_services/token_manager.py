@@ -0,0 +1,87 @@
+"""
+Gatekeeper JWT shared by the service clients.
+
+The manager reads the expiry of the access token from its `exp` claim and logs
+in again shortly before it, TOKEN_REFRESH_MARGIN_SECONDS ahead, when a client
+asks for the token. Concurrent callers needing a new token all wait on the
+same login instead of each starting their own, and a token rejected with 401
+is invalidated once, so a burst of failing requests during token rotation
+causes a single login.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+import jwt
+
+from src.core import config
+
+
+logger = logging.getLogger(__name__)
+
+Login = Callable[[], Awaitable[Tuple[str, str]]]
+
+
+def token_expiry(token: str) -> Optional[float]:
+    # The signature is checked by the services receiving the token, only the claim is needed here
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError:
+        return None
+    return float(exp) if exp is not None else None
+
+
+class TokenManager:
+
+    def __init__(self, login: Login, refresh_margin_seconds: Optional[int] = None):
+        self._login = login
+        self.refresh_margin = (
+            config.TOKEN_REFRESH_MARGIN_SECONDS if refresh_margin_seconds is None else refresh_margin_seconds
+        )
+        self.access_token: Optional[str] = None
+        self.refresh_token: Optional[str] = None
+        self.expires_at: Optional[float] = None
+        self.logins = 0
+        self._inflight: Optional[asyncio.Future] = None
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        if not self.access_token:
+            return False
+        if self.expires_at is None:
+            return True
+        return (now or time.time()) < self.expires_at - self.refresh_margin
+
+    async def _do_login(self) -> str:
+        self.access_token, self.refresh_token = await self._login()
+        self.expires_at = token_expiry(self.access_token)
+        self.logins += 1
+        logger.debug("Obtained a new Gatekeeper token, expiring at %s", self.expires_at)
+        return self.access_token
+
+    # Logs in again, joining the login already in flight if there is one
+    async def refresh(self) -> str:
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._do_login())
+
+            def done(future: asyncio.Future):
+                self._inflight = None
+                # Retrieved by the waiters, marked here so a login nobody waits for is not reported
+                if not future.cancelled():
+                    future.exception()
+
+            self._inflight.add_done_callback(done)
+        # A cancelled caller must not cancel the login the others wait for
+        return await asyncio.shield(self._inflight)
+
+    # Current access token, renewed first when it is missing, expired or about to expire
+    async def get_token(self) -> str:
+        if self.is_fresh():
+            return self.access_token
+        return await self.refresh()
+
+    # Marks a token rejected by a service as unusable, unless it was replaced already
+    def invalidate(self, token: Optional[str]):
+        if token and token == self.access_token:
+            self.expires_at = 0.0
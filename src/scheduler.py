@@ -1,69 +1,151 @@
-from datetime import datetime, timezone
+import asyncio
+from datetime import datetime, timedelta
+import functools
 import logging
+import time
+from typing import Dict, List, Set
 
 from fastapi import FastAPI
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from src.core import config
-from src.models.history_data import CachedLocation
-from src.services.jobs import update_sliding_window
+from src.core import metrics
+from src.services.dispatcher import dispatcher
+from src.services.jobs import repair_history_gaps, update_sliding_windows
+from src.services import onboarding
+from src.services import outbox
+from src.services.leader import LeaderElection
+from src.services.time_wheel import TimeWheel
+from src.services.wheel_store import load_wheel, save_wheel
 
 scheduler = AsyncIOScheduler()
+# Duration, start lag and misses of the scheduled jobs
+if config.METRICS_ENABLED:
+    scheduler.add_listener(metrics.SchedulerMetrics(), metrics.SCHEDULER_EVENTS)
 
+# Only the instance holding the scheduler lease runs the scheduled work
+election = LeaderElection("scheduler")
+
+# Recurring per-parcel pushes, driven by the single "parcel_wheel_tick" job
+parcel_wheel = TimeWheel()
+
+# Batches started by the wheel tick, kept referenced until they finish
+_running_batches: Set[asyncio.Task] = set()
 
-# Schedule THI tasks for each location
-async def schedule_tasks(app: FastAPI):
-    scheduler.remove_all_jobs()  # Clear old jobs
 
-    for location_info in (await app.state.fc_client.fetch_locations()):
+# Push runs wanted for the given parcels: {key: {"kind", "interval", "payload"}}
+def desired_parcel_jobs(locations: List[dict]) -> Dict[str, dict]:
+    thi_interval = timedelta(hours=config.INTERVAL_THI_TO_FARMCALENDAR)
+    forecast_interval = timedelta(days=5)
+
+    desired = {}
+    for location_info in locations:
         lat, lon = location_info["lat"], location_info["lon"]
-        farm, parcel = location_info["farm_name"], location_info["identifier"]
         if config.PUSH_THI_TO_FARMCALENDAR:
-            scheduler.add_job(
-                post_thi_task,
-                "interval",
-                hours=config.INTERVAL_THI_TO_FARMCALENDAR,
-                next_run_time=datetime.now(timezone.utc),
-                id=f"thi_task_{lat}_{lon}",
-                replace_existing=True,
-                args=[app, location_info]
-            )
-            logging.debug(f"THI scheduling for farm: {farm}, parcel: {parcel}")
+            desired[f"thi_task_{lat}_{lon}"] = {
+                "kind": "thi", "interval": thi_interval, "payload": location_info
+            }
         if config.PUSH_FLIGHT_FORECAST_TO_FARMCALENDAR:
-            scheduler.add_job(
-                post_flight_forecast,
-                "interval",
-                days=5,
-                next_run_time=datetime.now(timezone.utc),
-                id=f"flight_forecast_task_{lat}_{lon}",
-                replace_existing=True,
-                args=[app, location_info, app.state.uavmodels]
-            )
-            logging.debug(f"Scheduled UAV forecast task for farm: {farm}, parcel: {parcel}")
+            desired[f"flight_forecast_task_{lat}_{lon}"] = {
+                "kind": "flight_forecast", "interval": forecast_interval, "payload": location_info
+            }
         if config.PUSH_SPRAY_F_TO_FARMCALENDAR:
-            scheduler.add_job(
-                post_spray_forecast,
-                "interval",
-                days=5,
-                next_run_time=datetime.now(timezone.utc),
-                id=f"spray_forecast_task_{lat}_{lon}",
-                replace_existing=True,
-                args=[app, location_info]
-            )
-            logging.debug(f"Scheduled spray conditions forecast task for farm: {farm}, parcel: {parcel}"    )
-
-    locations = await CachedLocation.find_all().to_list()
-    for loc in locations:
-        lat, lon = loc.location["coordinates"][1], loc.location["coordinates"][0]
+            desired[f"spray_forecast_task_{lat}_{lon}"] = {
+                "kind": "spray_forecast", "interval": forecast_interval, "payload": location_info
+            }
+    return desired
+
+
+# Posts one kind of data for the parcels of a grid cell one after the other, so
+# the weather data fetched for the first parcel is reused by the others
+async def post_parcel_batch(app: FastAPI, kind: str, locations: List[dict]):
+    failed = 0
+    for location_info in locations:
+        try:
+            if kind == "thi":
+                await post_thi_task(app, location_info)
+            elif kind == "flight_forecast":
+                await post_flight_forecast(app, location_info, app.state.uavmodels)
+            else:
+                await post_spray_forecast(app, location_info)
+        except Exception as e:
+            failed += 1
+            logging.exception(f"Posting {kind} for {location_info.get('identifier')} failed: {e}")
+    if failed:
+        raise RuntimeError(f"{failed} of {len(locations)} {kind} posts failed")
+
+
+async def _run_batch(app: FastAPI, kind: str, locations: List[dict]):
+    started = time.perf_counter()
+    outcome = "success"
+    try:
+        await dispatcher.run(kind, post_parcel_batch, app, kind, locations)
+    except Exception as e:
+        outcome = "error"
+        logging.error(f"{kind} batch of {len(locations)} parcels: {e}")
+    metrics.SCHEDULER_JOB_DURATION.labels(f"parcel_batch_{kind}", outcome).observe(time.perf_counter() - started)
+
+
+# Starts a batch per kind and grid cell of the parcels due now. Their next runs
+# are saved before the batches finish, a crash mid-batch does not repeat them.
+async def run_due_parcels(app: FastAPI, now: datetime = None) -> List[asyncio.Task]:
+    tasks = []
+    for (kind, *_), entries in parcel_wheel.due_batches(now).items():
+        task = asyncio.create_task(_run_batch(app, kind, [entry.payload for entry in entries]))
+        _running_batches.add(task)
+        task.add_done_callback(_running_batches.discard)
+        tasks.append(task)
+    if tasks:
+        await save_wheel(parcel_wheel)
+    return tasks
+
+
+# Runs the wrapped job only while this instance holds the scheduler lease
+def leader_only(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not election.is_leader:
+            logging.debug(f"Skipping {func.__name__}, instance {election.instance_id} is not the leader")
+            return None
+        return await func(*args, **kwargs)
+    return wrapper
+
+
+# Schedule THI, flight and spray tasks for each location
+async def schedule_tasks(app: FastAPI):
+    locations = await app.state.fc_client.fetch_locations()
+    report = parcel_wheel.reconcile(desired_parcel_jobs(locations))
+    await save_wheel(parcel_wheel)
+    logging.info(f"Parcel jobs reconciled for {len(locations)} locations: {report}")
+
+    if not scheduler.get_job("parcel_wheel_tick"):
         scheduler.add_job(
-            update_sliding_window,
+            leader_only(run_due_parcels),
+            trigger="interval",
+            seconds=config.TIME_WHEEL_TICK_SECONDS,
+            args=[app],
+            id="parcel_wheel_tick",
+        )
+
+    # A single run updates the history window of all cached locations
+    if not scheduler.get_job("update_sliding_windows"):
+        scheduler.add_job(
+            leader_only(update_sliding_windows),
             trigger="cron",
             hour=23,
-            args=[lat, lon, config.OM_CACHE_VARIABLES],
-            id=f"update_sliding_{lat}_{lon}",
-            replace_existing=True,
+            args=[config.OM_CACHE_VARIABLES],
+            id="update_sliding_windows",
+        )
+    # Refill days missed by the sliding window update, e.g. after downtime
+    if not scheduler.get_job("repair_history_gaps"):
+        scheduler.add_job(
+            leader_only(repair_history_gaps),
+            trigger="cron",
+            hour=23,
+            minute=30,
+            args=[config.OM_CACHE_VARIABLES],
+            id="repair_history_gaps",
         )
-        logging.debug("Scheduled sliding window update for %s, %s", lat, lon)
 
 
 # Post THI for a single location
@@ -100,14 +182,62 @@ async def refresh_machines_and_schedule(app):
 
 
 
-async def start_scheduler(app: FastAPI):
+# Deliver the observations waiting in the outbox to Farm Calendar
+async def drain_outbox(app):
+    await outbox.drain(app.state.fc_client.deliver_observations)
+
 
+# Starts the scheduled work on the instance that just took the scheduler lease
+async def start_leader_jobs(app: FastAPI):
+
+    # Resume the parcel timeline where the previous leader left it
+    parcel_wheel.clear()
+    await load_wheel(parcel_wheel)
     await schedule_tasks(app)
 
-    # Refresh locations and reschedule every 24 hours
-    scheduler.add_job(refresh_locations_and_schedule, "interval", minutes=5, args=[app])
-    # Refresh machines and reschedule every 24 hours
-    scheduler.add_job(refresh_machines_and_schedule, "interval", minutes=5, args=[app])
+    # Catch up on history missed while the service was down
+    scheduler.add_job(
+        leader_only(repair_history_gaps), args=[config.OM_CACHE_VARIABLES],
+        id="repair_history_gaps_startup", replace_existing=True
+    )
+    # Finish onboarding jobs of instances stopped while running them
+    scheduler.add_job(
+        leader_only(onboarding.resume_stale_jobs), id="resume_onboarding_jobs", replace_existing=True
+    )
+
+    # Refresh locations and reschedule every 5 minutes
+    scheduler.add_job(
+        leader_only(refresh_locations_and_schedule), "interval", minutes=5, args=[app],
+        id="refresh_locations", replace_existing=True
+    )
+    # Refresh machines and reschedule every 5 minutes
+    scheduler.add_job(
+        leader_only(refresh_machines_and_schedule), "interval", minutes=5, args=[app],
+        id="refresh_machines", replace_existing=True
+    )
+    # Deliver queued observations, missed while Farm Calendar was down too
+    scheduler.add_job(
+        leader_only(drain_outbox), "interval", seconds=config.OUTBOX_DRAIN_SECONDS, args=[app],
+        id="drain_outbox", replace_existing=True
+    )
+
+
+# Takes or renews the scheduler lease, starting the leader jobs on takeover and
+# retrying them on the next renewal if they could not be started
+async def maintain_leadership(app: FastAPI):
+    was_leader = election.is_leader
+    if await election.acquire_or_renew():
+        if not was_leader or not scheduler.get_job("drain_outbox"):
+            await start_leader_jobs(app)
+
+
+async def start_scheduler(app: FastAPI):
 
+    # Every instance competes for the lease, followers stay idle until they get it
+    await maintain_leadership(app)
+    scheduler.add_job(
+        maintain_leadership, "interval", seconds=max(1, config.LEADER_LEASE_SECONDS // 3), args=[app],
+        id="scheduler_lease", replace_existing=True
+    )
 
     scheduler.start()
@@ -0,0 +1,43 @@
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from src.core import config
+
+
+class BatchProduct(str, Enum):
+    FORECAST = "forecast"
+    THI = "thi"
+    SPRAY = "spray"
+    FLIGHT = "flight"
+
+
+class BatchPointIn(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+    id: Optional[str] = Field(default=None, description="Key of the point in the results, `lat,lon` by default")
+
+
+class BatchQuery(BaseModel):
+    product: BatchProduct = BatchProduct.FORECAST
+    points: List[BatchPointIn] = Field(min_length=1, max_length=config.BATCH_MAX_POINTS)
+    uavmodels: Optional[List[str]] = Field(default=None, description="Flight product only, all UAV models if omitted")
+
+
+class BatchResultOut(BaseModel):
+    lat: float
+    lon: float
+    # Center of the grid cell the data was computed for, shared by the points of the cell
+    grid: Dict[str, float]
+    source: Optional[str] = None
+    data: Optional[Any] = None
+    error: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    product: BatchProduct
+    results: Dict[str, BatchResultOut]
+    cells: int
+    cache_hits: int
+    failed: int
@@ -1,8 +1,15 @@
 from datetime import date, datetime
-from pydantic import BaseModel
+from enum import Enum
+from pydantic import BaseModel, Field
 from typing import Dict, List, Optional, Union
 
 
+class HistoryFormat(str, Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
 class CachedLocationIn(BaseModel):
     name: Optional[str]
     lat: float
@@ -20,6 +27,15 @@ class CachedLocationOut(BaseModel):
     lon: float
     created_at: str
 
+
+# Location listing item, only the requested fields are set
+class CachedLocationFieldsOut(BaseModel):
+    id: Optional[str] = None
+    name: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    created_at: Optional[str] = None
+
 class HourlyQuery(BaseModel):
     lat: float
     lon: float
@@ -56,3 +72,73 @@ class DailyResponse(BaseModel):
     location: Dict[str, float]
     data: List[DailyObservationOut]
     source: str
+
+
+class RollupResolution(str, Enum):
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+
+
+class RollupQuery(BaseModel):
+    lat: float
+    lon: float
+    start: date
+    end: date
+    variables: List[str]
+    resolution: RollupResolution = RollupResolution.DAILY
+    radius_km: float = 10.0
+
+
+class RollupObservationOut(BaseModel):
+    period_start: date
+    period_end: date
+    values: Dict[str, Dict[str, Optional[float]]]
+
+
+class RollupResponse(BaseModel):
+    location: Dict[str, float]
+    resolution: RollupResolution
+    data: List[RollupObservationOut]
+    source: str
+
+
+class ExportFormat(str, Enum):
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+class ExportGranularity(str, Enum):
+    HOURLY = "hourly"
+    DAILY = "daily"
+
+
+class ExportQuery(BaseModel):
+    location_ids: List[str] = Field(default_factory=list, description="Cached location ids, all cached locations if empty")
+    start: date
+    end: date
+    granularity: ExportGranularity = ExportGranularity.HOURLY
+    variables: Optional[List[str]] = Field(default=None, description="Variables to export, all cached variables if omitted")
+    format: ExportFormat = ExportFormat.ARROW
+    compression: Optional[str] = Field(default=None, description="Arrow: lz4, zstd. Parquet: none, snappy, gzip, brotli, zstd, lz4")
+    compression_level: Optional[int] = None
+
+
+class OnboardingResultOut(BaseModel):
+    name: Optional[str]
+    lat: float
+    lon: float
+    status: str
+    location_id: Optional[str]
+    error: Optional[str]
+
+
+class OnboardingJobOut(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    counts: Dict[str, int]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    results: Optional[List[OnboardingResultOut]] = None
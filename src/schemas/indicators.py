@@ -0,0 +1,37 @@
+from datetime import date
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+
+class IndicatorOut(BaseModel):
+    name: str
+    description: str
+    unit: str
+    params: Dict[str, float]
+
+
+class IndicatorQuery(BaseModel):
+    lat: float
+    lon: float
+    start: date
+    end: date
+    params: Dict[str, float] = Field(default_factory=dict, description="Overrides of the indicator default params")
+    forecast_days: int = Field(default=0, ge=0, le=16, description="Extend the series with this many forecast days")
+    radius_km: float = 10.0
+
+
+class IndicatorValueOut(BaseModel):
+    date: date
+    value: Optional[float]
+    cumulative: float
+    forecast: bool = False
+
+
+class IndicatorResponse(BaseModel):
+    location: Dict[str, float]
+    indicator: str
+    unit: str
+    params: Dict[str, float]
+    data: List[IndicatorValueOut]
+    total: float
+    source: str
@@ -0,0 +1,37 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Dict, Optional
+
+
+class JobClassStatsOut(BaseModel):
+    queued: int
+    running: int
+    completed: int
+    failed: int
+    max_concurrency: int
+    last_lag_s: float
+    max_lag_s: float
+    mean_lag_s: float
+
+
+class OutboxStatsOut(BaseModel):
+    pending: int
+    dead: int
+    oldest_pending_age_s: float
+    enqueued: int
+    changed: int
+    suppressed: int
+    delivered: int
+    failed: int
+    dead_lettered: int
+    last_drain_at: Optional[datetime] = None
+    last_drain_per_s: float
+
+
+class SchedulerStatsOut(BaseModel):
+    running: bool
+    scheduled_jobs: int
+    parcel_runs: int
+    next_parcel_run: Optional[datetime] = None
+    job_classes: Dict[str, JobClassStatsOut]
+    outbox: OutboxStatsOut
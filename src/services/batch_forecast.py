@@ -0,0 +1,165 @@
+"""
+Forecast products of many points in one request.
+
+Points are snapped to the center of their FORECAST_GRID_DEGREES grid cell, so
+every cell is resolved once for all the points in it and cells are shared with
+other clients asking for nearby points. Cells with a fresh cached product are
+read with a single query, the others are computed by the weather app with at
+most BATCH_CONCURRENCY cells in flight. A failing cell only fails its own
+points, each reported with the error in its result.
+"""
+
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from beanie.operators import In
+from fastapi import HTTPException
+from pydantic import TypeAdapter
+
+from src.core import config
+from src.core import metrics
+from src.core.dao import coordinates_filter
+from src.models.spray import SprayForecast
+from src.models.uav import FlyStatus, UAVModel
+from src.schemas.batch import BatchProduct, BatchQuery, BatchResponse, BatchResultOut
+from src.schemas.prediction import PredictionOut
+from src.schemas.spray import SprayForecastResponse
+from src.schemas.uav import FlightStatusForecastResponse
+from src.schemas.weather_data import THIDataOut
+
+
+logger = logging.getLogger(__name__)
+
+Cell = Tuple[float, float]
+
+# Schema of the data of each product, the same as its single point endpoint
+PRODUCT_ADAPTERS = {
+    BatchProduct.FORECAST: TypeAdapter(List[PredictionOut]),
+    BatchProduct.THI: TypeAdapter(THIDataOut),
+    BatchProduct.SPRAY: TypeAdapter(List[SprayForecastResponse]),
+    BatchProduct.FLIGHT: TypeAdapter(List[FlightStatusForecastResponse]),
+}
+
+
+def grid_center(lat: float, lon: float, degrees: Optional[float] = None) -> Cell:
+    degrees = degrees or config.FORECAST_GRID_DEGREES
+    return (
+        round((math.floor(lat / degrees) + 0.5) * degrees, 6),
+        round((math.floor(lon / degrees) + 0.5) * degrees, 6),
+    )
+
+
+def _group(documents, coordinates) -> Dict[Cell, list]:
+    grouped: Dict[Cell, list] = {}
+    for doc in documents:
+        grouped.setdefault(tuple(coordinates(doc)), []).append(doc)
+    return grouped
+
+
+async def _uav_models(uavmodels: Optional[List[str]]) -> List[str]:
+    if uavmodels:
+        return uavmodels
+    return [uav.model for uav in await UAVModel.find_all().to_list()]
+
+
+# Fresh cached products of the cells, one query for all of them
+async def _cached(weather_app, product: BatchProduct, cells: List[Cell], uavmodels: List[str]) -> Dict[Cell, Any]:
+    coordinates = [list(cell) for cell in cells]
+
+    if product == BatchProduct.FORECAST:
+        return await weather_app.dao.find_predictions_for_points(coordinates)
+
+    if product == BatchProduct.THI:
+        return await weather_app.dao.find_weather_data_for_points(coordinates)
+
+    hours_ago = datetime.utcnow() - timedelta(hours=config.CURRENT_WEATHER_DATA_CACHE_TIME)
+    if product == BatchProduct.SPRAY:
+        forecasts = await SprayForecast.find(
+            coordinates_filter("location.coordinates", coordinates),
+            SprayForecast.timestamp > datetime.now(),
+            SprayForecast.created_at >= hours_ago,
+        ).to_list()
+        return _group(forecasts, lambda f: f.location.coordinates)
+
+    if not uavmodels:
+        return {}
+    statuses = await FlyStatus.find(
+        coordinates_filter("location.coordinates", coordinates),
+        In(FlyStatus.uav_model, uavmodels),
+        FlyStatus.timestamp > datetime.now(timezone.utc),
+        FlyStatus.created_at >= hours_ago,
+    ).to_list()
+    # A cell is cached only when it has statuses of every requested model
+    return {
+        cell: found for cell, found in _group(statuses, lambda s: s.location.coordinates).items()
+        if {s.uav_model for s in found} >= set(uavmodels)
+    }
+
+
+async def _compute(weather_app, product: BatchProduct, cell: Cell, uavmodels: Optional[List[str]]) -> Any:
+    lat, lon = cell
+    if product == BatchProduct.FORECAST:
+        return await weather_app.get_weather_forecast5days(lat, lon)
+    if product == BatchProduct.THI:
+        return await weather_app.get_thi(lat, lon)
+    if product == BatchProduct.SPRAY:
+        return await weather_app.ensure_spray_forecast_for_location(lat, lon)
+    return await weather_app.ensure_forecast_for_uavs_and_location(lat, lon, uav_model_names=uavmodels)
+
+
+def _error(e: Exception) -> str:
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    return str(e) or type(e).__name__
+
+
+async def batch_forecast(weather_app, query: BatchQuery) -> BatchResponse:
+    adapter = PRODUCT_ADAPTERS[query.product]
+
+    # Input keys of each cell
+    cells: Dict[Cell, List[Tuple[str, Any]]] = {}
+    for point in query.points:
+        key = point.id or f"{point.lat},{point.lon}"
+        cells.setdefault(grid_center(point.lat, point.lon), []).append((key, point))
+
+    uavmodels = await _uav_models(query.uavmodels) if query.product == BatchProduct.FLIGHT else []
+    cached = await _cached(weather_app, query.product, list(cells), uavmodels)
+    semaphore = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+
+    async def resolve(cell: Cell) -> Tuple[str, Any]:
+        if cell in cached:
+            return "cache", adapter.validate_python(cached[cell], from_attributes=True)
+        async with semaphore:
+            value = await _compute(weather_app, query.product, cell, query.uavmodels)
+        return "openweathermap", adapter.validate_python(value, from_attributes=True)
+
+    outcomes = await asyncio.gather(*(resolve(cell) for cell in cells), return_exceptions=True)
+
+    hits = len(cells.keys() & cached.keys())
+    metrics.record_cache(f"batch_{query.product.value}", True, hits)
+    metrics.record_cache(f"batch_{query.product.value}", False, len(cells) - hits)
+
+    results: Dict[str, BatchResultOut] = {}
+    failed = 0
+    for (cell, points), outcome in zip(cells.items(), outcomes):
+        grid = {"lat": cell[0], "lon": cell[1]}
+        if isinstance(outcome, BaseException):
+            logger.warning("Batch %s forecast of cell %s failed: %s", query.product.value, cell, outcome)
+            failed += len(points)
+            for key, point in points:
+                results[key] = BatchResultOut(lat=point.lat, lon=point.lon, grid=grid, error=_error(outcome))
+            continue
+        source, data = outcome
+        for key, point in points:
+            results[key] = BatchResultOut(lat=point.lat, lon=point.lon, grid=grid, source=source, data=data)
+
+    return BatchResponse(
+        product=query.product,
+        results=results,
+        cells=len(cells),
+        cache_hits=hits,
+        failed=failed,
+    )
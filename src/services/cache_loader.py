@@ -1,16 +1,35 @@
 from datetime import date, timedelta, datetime, timezone
+from typing import List
 
+from src.core import config
 from src.models.history_data import HourlyHistory, HourlyObservation
 from src.models.history_data import DailyHistory, DailyObservation
 from src.external_services.openmeteo import WeatherClientFactory
+from src.schemas.history_data import DailyObservationOut, HourlyObservationOut
+from src.services import rollups
+
+
+# Last day the archive reliably has data for, it lags a couple of days behind
+def archive_end(today: date) -> date:
+    return today - timedelta(days=2)
 
-async def fetch_and_cache_last_month(lat: float, lon: float, variables: dict[str, list[str]]):
-    start = date.today() - timedelta(days=32)
-    end = date.today() - timedelta(days=2)
-    provider = WeatherClientFactory.get_provider()
 
+# First and last day of the history loaded for a newly cached location
+def initial_history_bounds() -> tuple[date, date]:
+    end = archive_end(date.today())
+    return end - timedelta(days=config.HISTORY_WINDOW_DAYS - 1), end
+
+
+# Stores fetched daily and hourly history of a newly cached location
+async def cache_history(
+    lat: float,
+    lon: float,
+    start: date,
+    end: date,
+    daily_data: List[DailyObservationOut],
+    hourly_data: List[HourlyObservationOut]
+):
     # DAILY
-    daily_data = await provider.get_daily_history(lat, lon, start, end, variables["daily"])
     daily_doc = DailyHistory(
         location={"type": "Point", "coordinates": [lon, lat]},
         date_range={"start": start, "end": end},
@@ -21,7 +40,6 @@ async def fetch_and_cache_last_month(lat: float, lon: float, variables: dict[str
     await daily_doc.insert()
 
     # HOURLY
-    hourly_data = await provider.get_hourly_history(lat, lon, start, end, variables["hourly"])
     by_day = {}
     for obs in hourly_data:
         d = obs.timestamp.date()
@@ -38,4 +56,15 @@ async def fetch_and_cache_last_month(lat: float, lon: float, variables: dict[str
         for day, obs_list in by_day.items()
     ]
 
-    await HourlyHistory.insert_many(documents)
+    if documents:
+        await HourlyHistory.insert_many(documents)
+    await rollups.update_rollups({(lon, lat): by_day.keys()})
+
+
+async def fetch_and_cache_last_month(lat: float, lon: float, variables: dict[str, list[str]]):
+    start, end = initial_history_bounds()
+    provider = WeatherClientFactory.get_provider()
+
+    daily_data = await provider.get_daily_history(lat, lon, start, end, variables["daily"])
+    hourly_data = await provider.get_hourly_history(lat, lon, start, end, variables["hourly"])
+    await cache_history(lat, lon, start, end, daily_data, hourly_data)
@@ -0,0 +1,108 @@
+"""
+Staggered, concurrency-limited dispatch of the per-parcel push jobs.
+
+Each job runs at a fixed phase of its interval derived from a hash of its id,
+so the jobs of one class are spread evenly over the interval and keep the
+same timeline across refreshes and restarts. Runs of each job class go
+through a semaphore that caps how many of them talk to OWM, Mongo and Farm
+Calendar at once. Runs waiting for a free slot are counted as queued and the
+time they waited is reported as lag.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict
+
+from src.core import config
+
+
+logger = logging.getLogger(__name__)
+
+# Phase origin of all staggered interval jobs
+STAGGER_ANCHOR = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+# Deterministic offset of a job within its interval, uniform in [0, interval).
+# Whole seconds so that run times survive the millisecond precision of Mongo.
+def stagger_offset(key: str, interval: timedelta) -> timedelta:
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    fraction = int.from_bytes(digest[:8], "big") / 2 ** 64
+    return timedelta(seconds=int(fraction * interval.total_seconds()))
+
+
+# Start date of an interval job, its runs fall on STAGGER_ANCHOR + offset + k * interval
+def staggered_start(key: str, interval: timedelta) -> datetime:
+    return STAGGER_ANCHOR + stagger_offset(key, interval)
+
+
+class Dispatcher:
+
+    def __init__(self, max_concurrency: int = None):
+        self.max_concurrency = max_concurrency or config.SCHEDULER_MAX_CONCURRENT_JOBS
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, dict] = {}
+
+    def _job_class(self, job_class: str):
+        if job_class not in self._semaphores:
+            self._semaphores[job_class] = asyncio.Semaphore(self.max_concurrency)
+            self._stats[job_class] = {
+                "queued": 0,
+                "running": 0,
+                "completed": 0,
+                "failed": 0,
+                "last_lag_s": 0.0,
+                "max_lag_s": 0.0,
+                "total_lag_s": 0.0,
+            }
+        return self._semaphores[job_class], self._stats[job_class]
+
+    # Runs `func(*args)` once a slot of its job class is free
+    async def run(self, job_class: str, func: Callable[..., Awaitable], *args):
+        semaphore, stats = self._job_class(job_class)
+        enqueued = time.monotonic()
+
+        stats["queued"] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            stats["queued"] -= 1
+
+        lag = time.monotonic() - enqueued
+        stats["last_lag_s"] = lag
+        stats["max_lag_s"] = max(stats["max_lag_s"], lag)
+        stats["total_lag_s"] += lag
+        stats["running"] += 1
+        try:
+            result = await func(*args)
+            stats["completed"] += 1
+            return result
+        except Exception:
+            stats["failed"] += 1
+            raise
+        finally:
+            stats["running"] -= 1
+            semaphore.release()
+
+    # Queue depth, running jobs and lag of every job class
+    def stats(self) -> Dict[str, dict]:
+        report = {}
+        for job_class, stats in self._stats.items():
+            runs = stats["completed"] + stats["failed"] + stats["running"]
+            report[job_class] = {
+                "queued": stats["queued"],
+                "running": stats["running"],
+                "completed": stats["completed"],
+                "failed": stats["failed"],
+                "max_concurrency": self.max_concurrency,
+                "last_lag_s": round(stats["last_lag_s"], 3),
+                "max_lag_s": round(stats["max_lag_s"], 3),
+                "mean_lag_s": round(stats["total_lag_s"] / runs, 3) if runs else 0.0,
+            }
+        return report
+
+
+# Dispatcher shared by all scheduled push jobs
+dispatcher = Dispatcher()
@@ -0,0 +1,177 @@
+"""
+Column-wise export of cached history to Apache Arrow IPC stream or Parquet.
+
+Documents are read as raw dicts from the Mongo cursors and appended straight
+into per-column lists, so no pydantic object is created per observation.
+Each cached location becomes one record batch (one row group for Parquet)
+that is written to the client as soon as it is built.
+"""
+
+import io
+from datetime import date, datetime, time
+from typing import AsyncIterator, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.models.history_data import CachedLocation, DailyHistory, HourlyHistory
+from src.schemas.history_data import ExportFormat, ExportGranularity
+
+
+MEDIA_TYPES = {
+    ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+FILE_EXTENSIONS = {
+    ExportFormat.ARROW: "arrows",
+    ExportFormat.PARQUET: "parquet",
+}
+
+# Compression codecs supported by each writer
+COMPRESSIONS = {
+    ExportFormat.ARROW: {"lz4", "zstd"},
+    ExportFormat.PARQUET: {"none", "snappy", "gzip", "brotli", "zstd", "lz4"},
+}
+# Codec written when none is requested
+DEFAULT_COMPRESSION = {
+    ExportFormat.ARROW: None,
+    ExportFormat.PARQUET: "snappy",
+}
+
+
+# Why a codec and level cannot be written in `fmt`, checked before the response
+# starts since the writers only fail once the first batch is written
+def compression_error(fmt: ExportFormat, compression: Optional[str], level: Optional[int]) -> Optional[str]:
+    if compression and compression not in COMPRESSIONS[fmt]:
+        return f"Compression '{compression}' is not supported for {fmt.value}"
+    if level is None:
+        return None
+
+    codec = compression or DEFAULT_COMPRESSION[fmt]
+    if codec in (None, "none") or not pa.Codec.supports_compression_level(codec):
+        return f"Compression '{codec or 'none'}' does not support a compression level"
+    low, high = pa.Codec.minimum_compression_level(codec), pa.Codec.maximum_compression_level(codec)
+    if not low <= level <= high:
+        return f"Compression level of '{codec}' must be between {low} and {high}"
+    return None
+
+
+def export_schema(granularity: ExportGranularity, variables: List[str]) -> pa.Schema:
+    time_field = (
+        pa.field("timestamp", pa.timestamp("s"))
+        if granularity == ExportGranularity.HOURLY
+        else pa.field("date", pa.date32())
+    )
+    return pa.schema(
+        [
+            pa.field("location_id", pa.string()),
+            pa.field("lat", pa.float64()),
+            pa.field("lon", pa.float64()),
+            time_field,
+            *(pa.field(v, pa.float64()) for v in variables),
+        ]
+    )
+
+
+def _as_datetime(d: date) -> datetime:
+    # Dates are stored as datetimes by the beanie encoder
+    return datetime.combine(d, time.min)
+
+
+async def _hourly_columns(location: CachedLocation, start: date, end: date, variables: List[str]) -> Dict[str, list]:
+    projection = {"_id": 0, "observations.timestamp": 1}
+    projection.update({f"observations.values.{v}": 1 for v in variables})
+    cursor = HourlyHistory.get_motor_collection().find(
+        {
+            "location": location.location,
+            "date": {"$gte": _as_datetime(start), "$lte": _as_datetime(end)},
+        },
+        projection,
+    ).sort("date", 1)
+
+    columns: Dict[str, list] = {"timestamp": [], **{v: [] for v in variables}}
+    async for doc in cursor:
+        observations = sorted(doc.get("observations", []), key=lambda o: o["timestamp"])
+        columns["timestamp"].extend(o["timestamp"] for o in observations)
+        for v in variables:
+            columns[v].extend(o.get("values", {}).get(v) for o in observations)
+    return columns
+
+
+async def _daily_columns(location: CachedLocation, start: date, end: date, variables: List[str]) -> Dict[str, list]:
+    projection = {"_id": 0, "observations.date": 1}
+    projection.update({f"observations.values.{v}": 1 for v in variables})
+    cursor = DailyHistory.get_motor_collection().find(
+        {
+            "location": location.location,
+            "date_range.start": {"$lte": _as_datetime(end)},
+            "date_range.end": {"$gte": _as_datetime(start)},
+        },
+        projection,
+    )
+
+    dt_start, dt_end = _as_datetime(start), _as_datetime(end)
+    observations = []
+    async for doc in cursor:
+        observations.extend(o for o in doc.get("observations", []) if dt_start <= o["date"] <= dt_end)
+    observations.sort(key=lambda o: o["date"])
+
+    columns: Dict[str, list] = {"date": [o["date"].date() for o in observations]}
+    for v in variables:
+        columns[v] = [o.get("values", {}).get(v) for o in observations]
+    return columns
+
+
+async def record_batches(
+    locations: AsyncIterator[CachedLocation],
+    granularity: ExportGranularity,
+    start: date,
+    end: date,
+    variables: List[str],
+    schema: pa.Schema,
+) -> AsyncIterator[pa.RecordBatch]:
+    build_columns = _hourly_columns if granularity == ExportGranularity.HOURLY else _daily_columns
+    async for location in locations:
+        columns = await build_columns(location, start, end, variables)
+        rows = len(next(iter(columns.values())))
+        if not rows:
+            continue
+
+        lon, lat = location.location["coordinates"]
+        columns.update({"location_id": [str(location.id)] * rows, "lat": [lat] * rows, "lon": [lon] * rows})
+        yield pa.RecordBatch.from_pydict({name: columns[name] for name in schema.names}, schema=schema)
+
+
+# Serialize record batches to the requested format, yielding the bytes
+# produced by the writer after every batch
+async def write_batches(
+    batches: AsyncIterator[pa.RecordBatch],
+    schema: pa.Schema,
+    fmt: ExportFormat,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate(0)
+        return data
+
+    if fmt == ExportFormat.PARQUET:
+        writer = pq.ParquetWriter(
+            sink, schema, compression=compression or DEFAULT_COMPRESSION[fmt], compression_level=compression_level
+        )
+    else:
+        codec = pa.Codec(compression, compression_level) if compression else None
+        writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression=codec))
+
+    try:
+        async for batch in batches:
+            writer.write_batch(batch)
+            yield drain()
+    finally:
+        writer.close()
+    yield drain()
@@ -0,0 +1,351 @@
+"""
+Agronomic indicators computed over cached history, optionally extended with
+the forecast.
+
+Each indicator turns per-day input arrays into one value per day with numpy,
+the cumulative series is derived from those values. Per-day history values are
+memoized per (location, indicator, params) and the memo is extended with the
+missing days only, so repeated dashboard loads and the daily advance of the
+range cost a few days of computation instead of the whole season. Memoized
+days without data are computed again, once gap repair has cached them.
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.core import config
+from src.core import metrics
+from src.core import dao
+from src.external_services.openmeteo import WeatherClientFactory
+from src.models.history_data import DailyHistory, HourlyHistory
+from src.schemas.indicators import IndicatorResponse, IndicatorValueOut
+
+
+logger = logging.getLogger(__name__)
+
+Inputs = Dict[str, np.ndarray]
+
+
+def _growing_degree_days(inputs: Inputs, base: float, cap: float) -> np.ndarray:
+    # Averaging method with both temperatures clipped to [base, cap]
+    tmin = np.clip(inputs["temperature_2m_min"], base, cap)
+    tmax = np.clip(inputs["temperature_2m_max"], base, cap)
+    return (tmin + tmax) / 2 - base
+
+
+def _chill_hours(inputs: Inputs, low: float, high: float) -> np.ndarray:
+    t = inputs["temperature_2m"]
+    hours = np.sum((t >= low) & (t <= high), axis=1).astype(float)
+    # Days without any hourly value are unknown, not zero
+    hours[np.all(np.isnan(t), axis=1)] = np.nan
+    return hours
+
+
+def _et0(inputs: Inputs) -> np.ndarray:
+    return inputs["et0_fao_evapotranspiration"]
+
+
+def _rainfall_deficit(inputs: Inputs) -> np.ndarray:
+    return inputs["et0_fao_evapotranspiration"] - inputs["precipitation_sum"]
+
+
+INDICATORS: Dict[str, dict] = {
+    "gdd": {
+        "description": "Growing degree days, averaging method with temperatures clipped to [base, cap]",
+        "unit": "°C·d",
+        "granularity": "daily",
+        "variables": ["temperature_2m_min", "temperature_2m_max"],
+        "params": {"base": 10.0, "cap": 30.0},
+        "compute": _growing_degree_days,
+    },
+    "chill_hours": {
+        "description": "Hours with air temperature between low and high",
+        "unit": "h",
+        "granularity": "hourly",
+        "variables": ["temperature_2m"],
+        "params": {"low": 0.0, "high": 7.2},
+        "compute": _chill_hours,
+    },
+    "et0": {
+        "description": "FAO-56 reference evapotranspiration",
+        "unit": "mm",
+        "granularity": "daily",
+        "variables": ["et0_fao_evapotranspiration"],
+        "params": {},
+        "compute": _et0,
+    },
+    "rainfall_deficit": {
+        "description": "Reference evapotranspiration minus precipitation",
+        "unit": "mm",
+        "granularity": "daily",
+        "variables": ["et0_fao_evapotranspiration", "precipitation_sum"],
+        "params": {},
+        "compute": _rainfall_deficit,
+    },
+}
+
+
+# Per-day values of an indicator for consecutive days starting at `start`
+class IndicatorSeries:
+    def __init__(self, start: date, values: np.ndarray):
+        self.start = start
+        self.values = values
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=len(self.values) - 1)
+
+    def slice(self, start: date, end: date) -> np.ndarray:
+        return self.values[(start - self.start).days:(end - self.start).days + 1]
+
+
+# LRU memo of per-day history values, keyed by (lon, lat, indicator, params)
+_memo: "OrderedDict[tuple, IndicatorSeries]" = OrderedDict()
+
+
+def clear_memo():
+    _memo.clear()
+
+
+def _remember(key: tuple, series: IndicatorSeries):
+    # Trailing days without data are left out so they are retried once the archive has them
+    finite = np.flatnonzero(~np.isnan(series.values))
+    if not len(finite):
+        _memo.pop(key, None)
+        return
+    _memo[key] = IndicatorSeries(series.start, series.values[:finite[-1] + 1])
+    _memo.move_to_end(key)
+    while len(_memo) > config.INDICATOR_CACHE_SIZE:
+        _memo.popitem(last=False)
+
+
+def resolve_params(indicator: str, params: Dict[str, float]) -> Dict[str, float]:
+    defaults = INDICATORS[indicator]["params"]
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {indicator}: {', '.join(sorted(unknown))}")
+    return {**defaults, **params}
+
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _as_datetime(d: date) -> datetime:
+    # Dates are stored as datetimes by the beanie encoder
+    return datetime.combine(d, time.min)
+
+
+# Fill `inputs` rows of the given days from observations, one row per day
+def _fill(inputs: Inputs, index: Dict[date, int], observations, granularity: str):
+    for obs in observations:
+        if granularity == "daily":
+            day, hour = obs.date, None
+        else:
+            day, hour = obs.timestamp.date(), obs.timestamp.hour
+        row = index.get(day)
+        if row is None:
+            continue
+        for variable, column in inputs.items():
+            value = obs.values.get(variable)
+            if value is None:
+                continue
+            if hour is None:
+                column[row] = value
+            else:
+                column[row, hour] = value
+
+
+def _empty_inputs(spec: dict, days: int) -> Inputs:
+    shape = (days,) if spec["granularity"] == "daily" else (days, 24)
+    return {v: np.full(shape, np.nan) for v in spec["variables"]}
+
+
+async def _cached_inputs(spec: dict, coords: List[float], days: List[date]) -> Inputs:
+    inputs = _empty_inputs(spec, len(days))
+    index = {d: i for i, d in enumerate(days)}
+    start, end = _as_datetime(days[0]), _as_datetime(days[-1])
+
+    if spec["granularity"] == "daily":
+        projection = {"_id": 0, "observations.date": 1}
+        projection.update({f"observations.values.{v}": 1 for v in spec["variables"]})
+        cursor = DailyHistory.get_motor_collection().find({"location.coordinates": coords}, projection)
+        async for doc in cursor:
+            for obs in doc.get("observations", []):
+                row = index.get(obs["date"].date())
+                if row is None:
+                    continue
+                for v in spec["variables"]:
+                    value = obs.get("values", {}).get(v)
+                    if value is not None:
+                        inputs[v][row] = value
+    else:
+        projection = {"_id": 0, "observations.timestamp": 1}
+        projection.update({f"observations.values.{v}": 1 for v in spec["variables"]})
+        cursor = HourlyHistory.get_motor_collection().find(
+            {"location.coordinates": coords, "date": {"$gte": start, "$lte": end}}, projection
+        )
+        async for doc in cursor:
+            for obs in doc.get("observations", []):
+                row = index.get(obs["timestamp"].date())
+                if row is None:
+                    continue
+                for v in spec["variables"]:
+                    value = obs.get("values", {}).get(v)
+                    if value is not None:
+                        inputs[v][row, obs["timestamp"].hour] = value
+    return inputs
+
+
+# Per-day inputs of the given days, read from the cache when the location is
+# cached and fetched from the archive with one request for the days it lacks
+async def _history_inputs(spec: dict, lat: float, lon: float, cached: bool, days: List[date]) -> Inputs:
+    if cached:
+        inputs = await _cached_inputs(spec, [lon, lat], days)
+    else:
+        inputs = _empty_inputs(spec, len(days))
+
+    axes = tuple(range(1, inputs[spec["variables"][0]].ndim))
+    missing = np.zeros(len(days), dtype=bool)
+    for column in inputs.values():
+        missing |= np.all(np.isnan(column), axis=axes) if axes else np.isnan(column)
+
+    if missing.any():
+        rows = np.flatnonzero(missing)
+        first, last = days[rows[0]], days[rows[-1]]
+        provider = WeatherClientFactory.get_provider()
+        if spec["granularity"] == "daily":
+            observations = await provider.get_daily_history(lat, lon, first, last, spec["variables"])
+        else:
+            observations = await provider.get_hourly_history(lat, lon, first, last, spec["variables"])
+        index = {days[i]: i for i in rows}
+        _fill(inputs, index, observations, spec["granularity"])
+    return inputs
+
+
+async def _history_series(
+    indicator: str, params: Dict[str, float], lat: float, lon: float, cached: bool, start: date, end: date
+) -> IndicatorSeries:
+    spec = INDICATORS[indicator]
+    key = (lon, lat, indicator, tuple(sorted(params.items())))
+
+    async def compute(first: date, last: date) -> np.ndarray:
+        days = _days(first, last)
+        inputs = await _history_inputs(spec, lat, lon, cached, days)
+        return spec["compute"](inputs, **params)
+
+    memo = _memo.get(key)
+    usable = bool(memo and memo.start <= end + timedelta(days=1) and memo.end >= start - timedelta(days=1))
+    metrics.record_cache("indicators", usable)
+    if usable:
+        # Extend the memoized series with the days before and after it only
+        values = memo.values
+        series_start = memo.start
+        if start < memo.start:
+            values = np.concatenate([await compute(start, memo.start - timedelta(days=1)), values])
+            series_start = start
+        if end > memo.end:
+            values = np.concatenate([values, await compute(memo.end + timedelta(days=1), end)])
+        series = IndicatorSeries(series_start, values)
+
+        # Retry the requested memoized days without data, from the first to the last
+        first, last = max(start, memo.start), min(end, memo.end)
+        gaps = np.flatnonzero(np.isnan(series.slice(first, last)))
+        if len(gaps):
+            offset = (first - series.start).days
+            retried = await compute(first + timedelta(days=int(gaps[0])), first + timedelta(days=int(gaps[-1])))
+            series.values = series.values.copy()
+            series.values[offset + gaps[0]:offset + gaps[-1] + 1] = retried
+    else:
+        series = IndicatorSeries(start, await compute(start, end))
+
+    _remember(key, series)
+    return IndicatorSeries(start, series.slice(start, end))
+
+
+async def _forecast_series(
+    indicator: str, params: Dict[str, float], lat: float, lon: float, forecast_days: int
+) -> IndicatorSeries:
+    spec = INDICATORS[indicator]
+    today = date.today()
+    days = _days(today, today + timedelta(days=forecast_days - 1))
+    provider = WeatherClientFactory.get_provider()
+    if spec["granularity"] == "daily":
+        observations = await provider.get_daily_forecast(lat, lon, days=forecast_days)
+    else:
+        observations = await provider.get_hourly_forecast(lat, lon, days=forecast_days)
+
+    inputs = _empty_inputs(spec, len(days))
+    _fill(inputs, {d: i for i, d in enumerate(days)}, observations, spec["granularity"])
+    return IndicatorSeries(today, spec["compute"](inputs, **params))
+
+
+def _value(v: float) -> Optional[float]:
+    return None if np.isnan(v) else float(v)
+
+
+async def compute_indicator(
+    indicator: str,
+    lat: float,
+    lon: float,
+    start: date,
+    end: date,
+    params: Dict[str, float],
+    forecast_days: int = 0,
+    radius_km: float = 10.0,
+) -> IndicatorResponse:
+    params = resolve_params(indicator, params)
+
+    location = await dao.find_location_nearby(lat, lon, int(radius_km * 1000))
+    if location:
+        lon, lat = location.location["coordinates"]
+
+    # The archive ends yesterday, later days can only come from the forecast
+    yesterday = date.today() - timedelta(days=1)
+    parts: List[Tuple[IndicatorSeries, bool]] = []
+    if start <= min(end, yesterday):
+        history = await _history_series(indicator, params, lat, lon, bool(location), start, min(end, yesterday))
+        parts.append((history, False))
+    if forecast_days:
+        forecast = await _forecast_series(indicator, params, lat, lon, forecast_days)
+        first, last = max(start, forecast.start), min(end, forecast.end)
+        if first <= last:
+            parts.append((IndicatorSeries(first, forecast.slice(first, last)), True))
+
+    data = []
+    total = 0.0
+    for series, is_forecast in parts:
+        cumulative = total + np.cumsum(np.nan_to_num(series.values))
+        for i, (value, running) in enumerate(zip(series.values, cumulative)):
+            data.append(
+                IndicatorValueOut(
+                    date=series.start + timedelta(days=i),
+                    value=_value(value),
+                    cumulative=float(running),
+                    forecast=is_forecast
+                )
+            )
+        if len(cumulative):
+            total = float(cumulative[-1])
+
+    return IndicatorResponse(
+        location={"lat": lat, "lon": lon},
+        indicator=indicator,
+        unit=INDICATORS[indicator]["unit"],
+        params=params,
+        data=data,
+        total=total,
+        source="cache" if location else "openmeteo"
+    )
+
+
+def list_indicators() -> List[dict]:
+    return [
+        {"name": name, "description": spec["description"], "unit": spec["unit"], "params": spec["params"]}
+        for name, spec in INDICATORS.items()
+    ]
+
@@ -1,37 +1,188 @@
-from datetime import date, timedelta, datetime, timezone
+from collections import defaultdict
+from datetime import date, time, timedelta, datetime, timezone
+import logging
+from typing import Dict, Iterable, List, Tuple
 
+from beanie import BulkWriter
+
+from src import utils
+from src.core import config
 from src.core import dao
 from src.external_services.openmeteo import WeatherClientFactory
-from src.models.history_data import HourlyHistory, HourlyObservation
-from src.models.history_data import DailyHistory, DailyObservation
+from src.models.history_data import CachedLocation, DailyHistory, HourlyHistory
+from src.schemas.history_data import HourlyObservationOut
+from src.services import rollups
+from src.services.cache_loader import archive_end
 
 
-async def update_sliding_window(lat: float, lon: float, variables: dict[str, list[str]]):
-    provider = WeatherClientFactory.get_provider()
-    today = date.today()
+logger = logging.getLogger(__name__)
+
+
+# First and last day of the sliding history window ending yesterday
+def sliding_window_bounds(today: date) -> tuple[date, date]:
     yesterday = today - timedelta(days=1)
-    oldest = today - timedelta(days=32)
-
-    # DAILY
-    daily = await provider.get_daily_history(lat, lon, yesterday, yesterday, variables["daily"])
-    if daily:
-        # Find and update the document in a single, atomic operation
-        await dao.update_sliding_window(lon, lat, oldest, yesterday, daily)
-
-    # HOURLY
-    hourly = await provider.get_hourly_history(lat, lon, yesterday, yesterday, variables["hourly"])
-    if hourly:
-        await HourlyHistory.find_many({
-            "location.coordinates": [lon, lat],
-            "date": oldest
-        }).delete()
-
-        obs = [HourlyObservation(**o.dict()) for o in hourly]
-        doc = HourlyHistory(
-            location={"type": "Point", "coordinates": [lon, lat]},
-            date=yesterday,
-            observations=obs,
-            fetched_at=datetime.now(timezone.utc),
-            source="open-meteo"
+    return yesterday - timedelta(days=config.HISTORY_WINDOW_DAYS - 1), yesterday
+
+
+# Days of the window [oldest, yesterday] that are not in `present`
+def missing_days(present: Iterable[date], oldest: date, yesterday: date) -> List[date]:
+    present = set(present)
+    days = (oldest + timedelta(days=i) for i in range((yesterday - oldest).days + 1))
+    return [day for day in days if day not in present]
+
+
+# Upserts the hourly observations of a location, one document per day, so that
+# reruns replace a day instead of duplicating it
+async def upsert_hourly_days(lon: float, lat: float, hourly: List[HourlyObservationOut], bulk_writer: BulkWriter):
+    geo = {"type": "Point", "coordinates": [lon, lat]}
+    by_day = {}
+    for obs in hourly:
+        by_day.setdefault(obs.timestamp.date(), []).append(obs.model_dump())
+
+    for day, observations in by_day.items():
+        await HourlyHistory.find(
+            HourlyHistory.location == geo,
+            HourlyHistory.date == day
+        ).update_many(
+            {
+                "$set": {
+                    "observations": observations,
+                    "fetched_at": datetime.now(timezone.utc),
+                    "source": "open-meteo"
+                },
+                "$setOnInsert": {"type": "historical", "granularity": "hourly", "location": geo, "date": day}
+            },
+            upsert=True,
+            bulk_writer=bulk_writer
         )
-        await doc.insert()
+
+
+# Moves the sliding window of every cached location one day forward.
+# Locations are fetched in batches with one archive request per batch and all
+# updates of a run are sent as one bulk write per collection.
+async def update_sliding_windows(variables: dict[str, list[str]]):
+    provider = WeatherClientFactory.get_provider()
+    oldest, yesterday = sliding_window_bounds(date.today())
+
+    locations = await CachedLocation.find_all().to_list()
+    daily_writer = BulkWriter()
+    hourly_writer = BulkWriter()
+    touched = {}
+    for batch in utils.chunked(locations, config.HISTORY_BATCH_SIZE):
+        coords = [(loc.location["coordinates"][1], loc.location["coordinates"][0]) for loc in batch]
+        try:
+            daily = await provider.get_daily_history_batch(coords, yesterday, yesterday, variables["daily"])
+            hourly = await provider.get_hourly_history_batch(coords, yesterday, yesterday, variables["hourly"])
+        except Exception as e:
+            logger.warning("Could not fetch history of %s for %d locations: %s", yesterday, len(coords), e)
+            continue
+
+        for (lat, lon), daily_obs, hourly_obs in zip(coords, daily, hourly):
+            if daily_obs:
+                await dao.update_sliding_window(lon, lat, oldest, yesterday, daily_obs, bulk_writer=daily_writer)
+            if hourly_obs:
+                await upsert_hourly_days(lon, lat, hourly_obs, hourly_writer)
+                touched[(lon, lat)] = {obs.timestamp.date() for obs in hourly_obs}
+
+    # Drop the hourly days that fell out of the window, for all locations at once
+    await HourlyHistory.find(HourlyHistory.date < oldest).delete(bulk_writer=hourly_writer)
+
+    await daily_writer.commit()
+    await hourly_writer.commit()
+    await rollups.update_rollups(touched)
+    logger.info("Sliding window of %d locations updated to %s", len(locations), yesterday)
+
+
+# Finds the days of the current window missing from the daily and hourly history
+# of every cached location, with one aggregation per collection.
+# Returns {(lon, lat): {"daily": [...], "hourly": [...]}} for locations with gaps.
+async def find_history_gaps(oldest: date, newest: date) -> Dict[Tuple[float, float], Dict[str, List[date]]]:
+    start, end = datetime.combine(oldest, time.min), datetime.combine(newest, time.min)
+
+    hourly_coverage = await HourlyHistory.aggregate([
+        {"$match": {"date": {"$gte": start, "$lte": end}}},
+        {"$group": {"_id": "$location.coordinates", "dates": {"$addToSet": "$date"}}}
+    ]).to_list()
+    daily_coverage = await DailyHistory.aggregate([
+        {"$unwind": "$observations"},
+        {"$match": {"observations.date": {"$gte": start, "$lte": end}}},
+        {"$group": {"_id": "$location.coordinates", "dates": {"$addToSet": "$observations.date"}}}
+    ]).to_list()
+
+    hourly_present = {tuple(c["_id"]): [d.date() for d in c["dates"]] for c in hourly_coverage}
+    daily_present = {tuple(c["_id"]): [d.date() for d in c["dates"]] for c in daily_coverage}
+
+    gaps = {}
+    async for location in CachedLocation.find_all():
+        key = tuple(location.location["coordinates"])
+        missing = {
+            "daily": missing_days(daily_present.get(key, []), oldest, newest),
+            "hourly": missing_days(hourly_present.get(key, []), oldest, newest),
+        }
+        if missing["daily"] or missing["hourly"]:
+            gaps[key] = missing
+    return gaps
+
+
+def _has_values(obs) -> bool:
+    # The archive returns nulls for days it has no data for yet
+    return any(v is not None for v in obs.values.values())
+
+
+# Detects holes in the sliding window of the cached locations (e.g. when the
+# service was down during the nightly update) and refills them.
+# The checked window ends where the archive does, like the initial fetch, so
+# days the archive cannot serve yet are not reported as gaps.
+# Locations missing the same span of days share batched archive requests.
+async def repair_history_gaps(variables: dict[str, list[str]]) -> dict:
+    provider = WeatherClientFactory.get_provider()
+    today = date.today()
+    oldest, _ = sliding_window_bounds(today)
+    end = archive_end(today)
+    gaps = await find_history_gaps(oldest, end)
+
+    report = {
+        "window": {"start": oldest.isoformat(), "end": end.isoformat()},
+        "locations_with_gaps": len(gaps),
+        "daily_gaps_found": sum(len(m["daily"]) for m in gaps.values()),
+        "hourly_gaps_found": sum(len(m["hourly"]) for m in gaps.values()),
+        "daily_gaps_filled": 0,
+        "hourly_gaps_filled": 0,
+    }
+
+    by_span = defaultdict(list)
+    for key, missing in gaps.items():
+        days = missing["daily"] + missing["hourly"]
+        by_span[(min(days), max(days))].append(key)
+
+    daily_writer = BulkWriter()
+    hourly_writer = BulkWriter()
+    touched = {}
+    for (start, end), keys in by_span.items():
+        for batch in utils.chunked(keys, config.HISTORY_BATCH_SIZE):
+            coords = [(lat, lon) for lon, lat in batch]
+            try:
+                daily = await provider.get_daily_history_batch(coords, start, end, variables["daily"])
+                hourly = await provider.get_hourly_history_batch(coords, start, end, variables["hourly"])
+            except Exception as e:
+                logger.warning("Could not fetch history %s - %s for %d locations: %s", start, end, len(coords), e)
+                continue
+
+            for (lat, lon), daily_obs, hourly_obs in zip(coords, daily, hourly):
+                missing = gaps[(lon, lat)]
+                daily_fill = [o for o in daily_obs if o.date in missing["daily"] and _has_values(o)]
+                hourly_fill = [o for o in hourly_obs if o.timestamp.date() in missing["hourly"] and _has_values(o)]
+
+                if daily_fill:
+                    await dao.fill_daily_history(lon, lat, daily_fill, bulk_writer=daily_writer)
+                    report["daily_gaps_filled"] += len(daily_fill)
+                if hourly_fill:
+                    await upsert_hourly_days(lon, lat, hourly_fill, hourly_writer)
+                    touched[(lon, lat)] = {o.timestamp.date() for o in hourly_fill}
+                    report["hourly_gaps_filled"] += len(touched[(lon, lat)])
+
+    await daily_writer.commit()
+    await hourly_writer.commit()
+    await rollups.update_rollups(touched)
+    logger.info("History gap repair: %s", report)
+    return report
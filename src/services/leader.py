@@ -0,0 +1,87 @@
+"""
+Leader election between the instances of the service through a MongoDB lease.
+
+Every instance periodically tries to take or renew the lease document of a
+role with one atomic find_one_and_update: it succeeds when the lease is free,
+expired or already held by the instance. Two instances racing for a missing
+lease both upsert it and the unique index on the role name rejects one. The
+holder considers itself leader until the expiry it wrote, so a leader that
+cannot renew in time steps down before another instance can take over,
+provided the clocks of the instances agree to within a fraction of the TTL.
+"""
+
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import uuid4
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from src.core import config
+from src.models.leader import SchedulerLease
+
+
+logger = logging.getLogger(__name__)
+
+
+def default_instance_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:8]}"
+
+
+class LeaderElection:
+
+    def __init__(self, name: str, instance_id: Optional[str] = None, ttl_seconds: Optional[int] = None):
+        self.name = name
+        self.instance_id = instance_id or default_instance_id()
+        self.ttl = timedelta(seconds=ttl_seconds or config.LEADER_LEASE_SECONDS)
+        self._expires_at: Optional[datetime] = None
+
+    def is_leader_at(self, now: datetime) -> bool:
+        return self._expires_at is not None and now < self._expires_at
+
+    @property
+    def is_leader(self) -> bool:
+        return self.is_leader_at(datetime.now(timezone.utc))
+
+    # Takes the lease if it is free or expired, renews it if held, returns whether this instance leads
+    async def acquire_or_renew(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now(timezone.utc)
+        expires_at = now + self.ttl
+        try:
+            lease = await SchedulerLease.get_motor_collection().find_one_and_update(
+                {"name": self.name, "$or": [{"holder": self.instance_id}, {"expires_at": {"$lt": now}}]},
+                {
+                    "$set": {"holder": self.instance_id, "expires_at": expires_at, "renewed_at": now},
+                    "$setOnInsert": {"name": self.name},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            lease = None
+        except Exception as e:
+            # Without a renewal the lease lapses on its own, followers take over then
+            logger.exception(f"❌ Could not renew the {self.name} lease: {e}")
+            return self.is_leader_at(now)
+
+        if lease and lease["holder"] == self.instance_id:
+            if not self.is_leader_at(now):
+                logger.info("Instance %s is now the %s leader", self.instance_id, self.name)
+            self._expires_at = expires_at
+            return True
+
+        if self._expires_at is not None:
+            logger.warning("Instance %s lost the %s lease", self.instance_id, self.name)
+        self._expires_at = None
+        return False
+
+    # Gives the lease up so another instance can take over without waiting for it to expire
+    async def release(self):
+        self._expires_at = None
+        await SchedulerLease.get_motor_collection().update_one(
+            {"name": self.name, "holder": self.instance_id},
+            {"$set": {"expires_at": datetime.fromtimestamp(0, timezone.utc)}}
+        )
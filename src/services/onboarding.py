@@ -0,0 +1,166 @@
+"""
+Background onboarding of newly registered cached locations.
+
+Registration requests only store an OnboardingJob and return its id. The job
+then inserts the locations, fetches their initial history in batches of
+HISTORY_BATCH_SIZE locations per Open-Meteo request and caches it, with at
+most ONBOARDING_CONCURRENCY batches in flight. Per-location results are saved
+on the job after every batch so clients can poll its progress.
+
+Jobs run in the process that accepted them. Jobs left pending or running by a
+stopped instance, not saved for ONBOARDING_STALE_SECONDS, are resumed by the
+scheduler leader when it takes over: locations registered but not yet cached
+are rolled back and onboarded again, finished results are kept.
+"""
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import List
+
+from src import utils
+from src.core import config
+from src.core import dao
+from src.core.spatial_index import location_index
+from src.external_services.openmeteo import WeatherClientFactory
+from src.models.history_data import CachedLocation, DailyHistory, HistoryRollup, HourlyHistory, get_utc_now
+from src.models.onboarding import OnboardingJob, OnboardingResult, OnboardingResultStatus, OnboardingStatus
+from src.schemas.history_data import CachedLocationIn
+from src.services.cache_loader import cache_history, initial_history_bounds
+
+
+logger = logging.getLogger(__name__)
+
+
+async def create_job(locations: List[CachedLocationIn], unique: bool = False) -> OnboardingJob:
+    job = OnboardingJob(
+        unique=unique,
+        results=[OnboardingResult(name=loc.name, lat=loc.lat, lon=loc.lon) for loc in locations]
+    )
+    return await job.insert()
+
+
+async def _save(job: OnboardingJob):
+    job.updated_at = get_utc_now()
+    await job.save()
+
+
+# Removes a location whose history could not be cached
+async def _rollback(lat: float, lon: float):
+    geo = {"type": "Point", "coordinates": [lon, lat]}
+    await HourlyHistory.find(HourlyHistory.location == geo).delete()
+    await DailyHistory.find(DailyHistory.location == geo).delete()
+    await HistoryRollup.find(HistoryRollup.location == geo).delete()
+    await CachedLocation.find(CachedLocation.location == geo).delete()
+
+
+# Inserts the locations of the job, skipping the already cached ones, and returns
+# the indexes of the inserted ones. Done one location at a time so that duplicates
+# within the same request are skipped too. Locations a resumed job registered but
+# did not cache are rolled back first.
+async def _register(job: OnboardingJob) -> List[int]:
+    pending = []
+    for i, result in enumerate(job.results):
+        if result.status != OnboardingResultStatus.PENDING:
+            continue
+        if result.location_id:
+            await _rollback(result.lat, result.lon)
+            location_index.remove(result.location_id)
+            result.location_id = None
+
+        geo = {"type": "Point", "coordinates": [result.lon, result.lat]}
+        if job.unique:
+            existing = await dao.find_location_nearby(result.lat, result.lon, config.LOCATION_RADIUS_METERS)
+        else:
+            existing = await CachedLocation.find_one(CachedLocation.location == geo)
+
+        if existing:
+            result.status = OnboardingResultStatus.SKIPPED
+            result.location_id = str(existing.id)
+            continue
+
+        doc = await CachedLocation(name=result.name, location=geo).insert()
+        location_index.add(str(doc.id), result.lat, result.lon)
+        result.location_id = str(doc.id)
+        pending.append(i)
+    return pending
+
+
+# Results are looked up by index on every access since saving the job replaces them
+async def _onboard_batch(job: OnboardingJob, batch: List[int], semaphore: asyncio.Semaphore):
+    async with semaphore:
+        start, end = initial_history_bounds()
+        provider = WeatherClientFactory.get_provider()
+        coords = [(job.results[i].lat, job.results[i].lon) for i in batch]
+        variables = config.OM_CACHE_VARIABLES
+
+        try:
+            daily = await provider.get_daily_history_batch(coords, start, end, variables["daily"])
+            hourly = await provider.get_hourly_history_batch(coords, start, end, variables["hourly"])
+        except Exception as e:
+            logger.exception(f"❌ Failed to fetch history for {len(batch)} locations: {e}")
+            daily = hourly = None
+
+        for n, i in enumerate(batch):
+            lat, lon = coords[n]
+            try:
+                if daily is None:
+                    raise RuntimeError("Could not fetch history from Open-Meteo")
+                await cache_history(lat, lon, start, end, daily[n], hourly[n])
+                job.results[i].status = OnboardingResultStatus.CACHED
+            except Exception as e:
+                logger.exception(f"❌ Failed to cache location {lat},{lon}: {e}")
+                await _rollback(lat, lon)
+                location_index.remove(job.results[i].location_id)
+                job.results[i].status = OnboardingResultStatus.FAILED
+                job.results[i].location_id = None
+                job.results[i].error = str(e)
+
+        await _save(job)
+
+
+async def run_job(job_id):
+    job = await OnboardingJob.get(job_id)
+    if not job:
+        logger.warning(f"Onboarding job {job_id} not found")
+        return
+
+    job.status = OnboardingStatus.RUNNING
+    job.started_at = get_utc_now()
+    await _save(job)
+
+    try:
+        pending = await _register(job)
+        await _save(job)
+
+        semaphore = asyncio.Semaphore(config.ONBOARDING_CONCURRENCY)
+        await asyncio.gather(*(
+            _onboard_batch(job, batch, semaphore)
+            for batch in utils.chunked(pending, config.HISTORY_BATCH_SIZE)
+        ))
+        job.status = OnboardingStatus.COMPLETED
+    except Exception as e:
+        logger.exception(f"❌ Onboarding job {job_id} failed: {e}")
+        job.status = OnboardingStatus.FAILED
+
+    job.finished_at = get_utc_now()
+    await _save(job)
+    logger.info(
+        "Onboarding job %s %s: %d locations", job_id, job.status.value, len(job.results)
+    )
+
+
+# Runs again the jobs of stopped instances, run by the scheduler leader on takeover
+async def resume_stale_jobs():
+    cutoff = get_utc_now() - timedelta(seconds=config.ONBOARDING_STALE_SECONDS)
+    stale = {
+        "status": {"$in": [OnboardingStatus.PENDING.value, OnboardingStatus.RUNNING.value]},
+        "updated_at": {"$lt": cutoff},
+    }
+    collection = OnboardingJob.get_motor_collection()
+    for doc in await collection.find(stale, {"_id": 1}).to_list(None):
+        # Claimed first so a job is resumed once, even with a leader change meanwhile
+        claimed = await collection.update_one({**stale, "_id": doc["_id"]}, {"$set": {"updated_at": get_utc_now()}})
+        if claimed.modified_count:
+            logger.warning("Resuming onboarding job %s left unfinished by a stopped instance", doc["_id"])
+            await run_job(doc["_id"])
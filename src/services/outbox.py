@@ -0,0 +1,210 @@
+"""
+Durable outbox of the observations pushed to Farm Calendar.
+
+Senders write every observation to the outbox, keyed by what it observes
+(parcel, kind, time and UAV model), and return without waiting for Farm
+Calendar. Each message carries a hash of the observed status: an observation
+whose status did not change since it was last queued is suppressed, a changed
+one is queued again and delivered as a new observation, or as an update of
+the earlier one when Farm Calendar gave its id. The drainer, a leader-only
+scheduler job, delivers due messages in batches of OUTBOX_BATCH_SIZE. Failed
+messages are retried with exponential backoff from OUTBOX_RETRY_BASE_SECONDS
+up to an hour and dead-lettered after OUTBOX_MAX_ATTEMPTS attempts, so an
+outage of Farm Calendar or the Gatekeeper delays observations instead of
+losing them. Dead-lettering clears the hash of a message, the next time the
+observation is sent it is queued again rather than suppressed.
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from beanie import BulkWriter
+
+from src.core import config
+from src.core import metrics
+from src.models.outbox import OutboxMessage, OutboxStatus
+
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two delivery attempts of a message
+RETRY_MAX_SECONDS = 3600
+
+# Delivers messages ({"key", "payload", "content_hash", "remote_id"}), returns the
+# errors of the undelivered ones and the Farm Calendar ids of the delivered ones by key
+Deliver = Callable[[List[dict]], Awaitable[Tuple[Dict[str, str], Dict[str, str]]]]
+
+_stats = {
+    "enqueued": 0,
+    "changed": 0,
+    "suppressed": 0,
+    "delivered": 0,
+    "failed": 0,
+    "dead_lettered": 0,
+    "last_drain_at": None,
+    "last_drain_s": 0.0,
+    "last_drain_delivered": 0,
+}
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(config.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+# Writes (key, payload, content_hash) messages to the outbox. Messages already
+# queued or delivered with the same hash are suppressed, changed and
+# dead-lettered ones are queued again.
+async def enqueue(messages: List[Tuple[str, dict, str]]) -> Dict[str, int]:
+    report = {"enqueued": 0, "changed": 0, "suppressed": 0}
+    if not messages:
+        return report
+
+    cursor = OutboxMessage.get_motor_collection().find(
+        {"key": {"$in": [key for key, _, _ in messages]}}, {"_id": 0, "key": 1, "content_hash": 1}
+    )
+    known = {doc["key"]: doc.get("content_hash") async for doc in cursor}
+
+    now = datetime.now(timezone.utc)
+    bulk_writer = BulkWriter()
+    for key, payload, content_hash in messages:
+        if key not in known:
+            await OutboxMessage.find(OutboxMessage.key == key).update_many(
+                {
+                    "$setOnInsert": {
+                        "key": key,
+                        "payload": payload,
+                        "content_hash": content_hash,
+                        "status": OutboxStatus.PENDING.value,
+                        "attempts": 0,
+                        "next_attempt_at": now,
+                        "created_at": now,
+                    }
+                },
+                upsert=True,
+                bulk_writer=bulk_writer
+            )
+            known[key] = content_hash
+            report["enqueued"] += 1
+        elif known[key] == content_hash:
+            report["suppressed"] += 1
+        else:
+            await OutboxMessage.find(OutboxMessage.key == key).update_many(
+                {
+                    "$set": {
+                        "payload": payload,
+                        "content_hash": content_hash,
+                        "status": OutboxStatus.PENDING.value,
+                        "attempts": 0,
+                        "next_attempt_at": now,
+                        "last_error": None,
+                        "delivered_at": None,
+                    }
+                },
+                bulk_writer=bulk_writer
+            )
+            known[key] = content_hash
+            report["changed"] += 1
+    await bulk_writer.commit()
+
+    for counter, count in report.items():
+        _stats[counter] += count
+        metrics.FARMCALENDAR_OBSERVATIONS.labels(counter).inc(count)
+    return report
+
+
+async def _record(batch: List[dict], errors: Dict[str, str], remote_ids: Dict[str, str],
+                  now: datetime) -> Tuple[int, int]:
+    delivered = 0
+    dead = 0
+    bulk_writer = BulkWriter()
+    for message in batch:
+        error = errors.get(message["key"])
+        if error is None:
+            update = {"status": OutboxStatus.DELIVERED.value, "delivered_at": now, "last_error": None}
+            if remote_ids.get(message["key"]):
+                update["remote_id"] = remote_ids[message["key"]]
+            delivered += 1
+        else:
+            attempts = message.get("attempts", 0) + 1
+            update = {"attempts": attempts, "last_error": error}
+            if attempts >= config.OUTBOX_MAX_ATTEMPTS:
+                # Without a hash the next send of the observation is not suppressed
+                update["status"] = OutboxStatus.DEAD.value
+                update["content_hash"] = None
+                dead += 1
+                logger.error(f"❌ Observation {message['key']} dead-lettered after {attempts} attempts: {error}")
+            else:
+                update["next_attempt_at"] = now + retry_delay(attempts)
+        await OutboxMessage.find(OutboxMessage.key == message["key"]).update_many(
+            {"$set": update}, bulk_writer=bulk_writer
+        )
+    await bulk_writer.commit()
+    return delivered, dead
+
+
+# Delivers due messages batch by batch until none is left or a whole batch fails
+async def drain(deliver: Deliver) -> Dict[str, int]:
+    report = {"delivered": 0, "failed": 0, "dead_lettered": 0}
+    started = time.monotonic()
+    while True:
+        now = datetime.now(timezone.utc)
+        cursor = OutboxMessage.get_motor_collection().find(
+            {"status": OutboxStatus.PENDING.value, "next_attempt_at": {"$lte": now}},
+            {"_id": 0, "key": 1, "payload": 1, "attempts": 1, "content_hash": 1, "remote_id": 1}
+        ).sort("next_attempt_at", 1).limit(config.OUTBOX_BATCH_SIZE)
+        batch = await cursor.to_list(None)
+        if not batch:
+            break
+
+        errors, remote_ids = await deliver(batch)
+        delivered, dead = await _record(batch, errors, remote_ids, now)
+        report["delivered"] += delivered
+        report["failed"] += len(errors)
+        report["dead_lettered"] += dead
+        if not delivered:
+            # Farm Calendar is most likely down, the next drain tries again
+            break
+
+    elapsed = time.monotonic() - started
+    for counter in ("delivered", "failed", "dead_lettered"):
+        _stats[counter] += report[counter]
+        metrics.FARMCALENDAR_OBSERVATIONS.labels(counter).inc(report[counter])
+    _stats["last_drain_at"] = datetime.now(timezone.utc)
+    _stats["last_drain_s"] = elapsed
+    _stats["last_drain_delivered"] = report["delivered"]
+    if report["delivered"] or report["failed"]:
+        logger.info("Outbox drained in %.2fs: %s", elapsed, report)
+    return report
+
+
+# Backlog of the outbox and delivery counters of this process
+async def outbox_stats() -> dict:
+    collection = OutboxMessage.get_motor_collection()
+    pending = await collection.count_documents({"status": OutboxStatus.PENDING.value})
+    dead = await collection.count_documents({"status": OutboxStatus.DEAD.value})
+    oldest = await collection.find_one(
+        {"status": OutboxStatus.PENDING.value}, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)]
+    )
+    oldest_age = 0.0
+    if oldest:
+        created_at = oldest["created_at"]
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        oldest_age = (datetime.now(timezone.utc) - created_at).total_seconds()
+
+    return {
+        "pending": pending,
+        "dead": dead,
+        "oldest_pending_age_s": round(oldest_age, 3),
+        "enqueued": _stats["enqueued"],
+        "changed": _stats["changed"],
+        "suppressed": _stats["suppressed"],
+        "delivered": _stats["delivered"],
+        "failed": _stats["failed"],
+        "dead_lettered": _stats["dead_lettered"],
+        "last_drain_at": _stats["last_drain_at"],
+        "last_drain_per_s": round(_stats["last_drain_delivered"] / _stats["last_drain_s"], 3)
+        if _stats["last_drain_s"] else 0.0,
+    }
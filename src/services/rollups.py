@@ -0,0 +1,189 @@
+"""
+Pre-aggregated daily, weekly and monthly summaries of the cached hourly history.
+
+Daily rollups are recomputed from the hourly documents of the days that were
+written, weekly and monthly rollups are recomputed from the daily rollups of
+their period. Every update replaces whole rollups, so rerunning it for the
+same days is harmless. Rollups are not trimmed with the sliding window, which
+lets long-range queries read a few hundred summaries instead of raw hours.
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from beanie import BulkWriter
+
+from src.models.history_data import HistoryRollup, HourlyHistory
+from src.schemas.history_data import HourlyObservationOut, RollupObservationOut, RollupResolution
+
+
+logger = logging.getLogger(__name__)
+
+Stats = Dict[str, Dict[str, Optional[float]]]
+
+
+# First and last day of the period of the given resolution containing `day`
+def period_bounds(day: date, resolution: RollupResolution) -> Tuple[date, date]:
+    if resolution == RollupResolution.WEEKLY:
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if resolution == RollupResolution.MONTHLY:
+        start = day.replace(day=1)
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        return start, next_month - timedelta(days=1)
+    return day, day
+
+
+def _finalize(acc: Dict[str, list]) -> Stats:
+    stats = {}
+    for variable, (vmin, vmax, vsum, count) in acc.items():
+        stats[variable] = {
+            "min": vmin,
+            "max": vmax,
+            "mean": vsum / count if count else None,
+            "sum": vsum if count else None,
+            "count": count,
+        }
+    return stats
+
+
+# min/max/mean/sum/count of every variable over a list of observation values
+def summarize(values: Iterable[Dict[str, Optional[float]]]) -> Stats:
+    acc: Dict[str, list] = {}
+    for obs in values:
+        for variable, value in obs.items():
+            entry = acc.setdefault(variable, [None, None, 0.0, 0])
+            if value is None:
+                continue
+            entry[0] = value if entry[0] is None else min(entry[0], value)
+            entry[1] = value if entry[1] is None else max(entry[1], value)
+            entry[2] += value
+            entry[3] += 1
+    return _finalize(acc)
+
+
+# Combine summaries of consecutive periods into the summary of the whole span
+def merge(summaries: Iterable[Stats]) -> Stats:
+    acc: Dict[str, list] = {}
+    for stats in summaries:
+        for variable, s in stats.items():
+            entry = acc.setdefault(variable, [None, None, 0.0, 0])
+            if not s.get("count"):
+                continue
+            entry[0] = s["min"] if entry[0] is None else min(entry[0], s["min"])
+            entry[1] = s["max"] if entry[1] is None else max(entry[1], s["max"])
+            entry[2] += s["sum"]
+            entry[3] += s["count"]
+    return _finalize(acc)
+
+
+# Summarize hourly observations per period in memory, used when the location is not cached
+def rollup_observations(
+    observations: List[HourlyObservationOut], resolution: RollupResolution, variables: List[str]
+) -> List[RollupObservationOut]:
+    by_day: Dict[date, list] = {}
+    for obs in observations:
+        by_day.setdefault(obs.timestamp.date(), []).append({v: obs.values.get(v) for v in variables})
+
+    by_period: Dict[Tuple[date, date], list] = {}
+    for day in sorted(by_day):
+        by_period.setdefault(period_bounds(day, resolution), []).append(summarize(by_day[day]))
+
+    return [
+        RollupObservationOut(period_start=start, period_end=end, values=merge(days))
+        for (start, end), days in by_period.items()
+    ]
+
+
+def _as_datetime(d: date) -> datetime:
+    # Dates are stored as datetimes by the beanie encoder
+    return datetime.combine(d, time.min)
+
+
+async def _upsert(geo: dict, resolution: RollupResolution, start: date, end: date, values: Stats,
+                  bulk_writer: BulkWriter):
+    lon, lat = geo["coordinates"]
+    await HistoryRollup.find(
+        {
+            "lon": lon,
+            "lat": lat,
+            "resolution": resolution.value,
+            "period_start": _as_datetime(start)
+        }
+    ).update_many(
+        {
+            "$set": {"period_end": end, "values": values, "updated_at": datetime.now(timezone.utc)},
+            "$setOnInsert": {
+                "location": geo,
+                "resolution": resolution.value,
+                "period_start": start,
+                "source": "open-meteo"
+            }
+        },
+        upsert=True,
+        bulk_writer=bulk_writer
+    )
+
+
+# Recompute the rollups of a location affected by new hourly data on `days`,
+# reading the hourly documents of those days and the daily rollups of their
+# weeks and months with one query each
+async def update_location_rollups(lon: float, lat: float, days: Iterable[date], bulk_writer: BulkWriter):
+    days = sorted(set(days))
+    if not days:
+        return
+    geo = {"type": "Point", "coordinates": [lon, lat]}
+
+    daily = {}
+    cursor = HourlyHistory.get_motor_collection().find(
+        {"location.coordinates": [lon, lat], "date": {"$in": [_as_datetime(d) for d in days]}},
+        {"_id": 0, "date": 1, "observations.values": 1}
+    )
+    async for doc in cursor:
+        daily[doc["date"].date()] = summarize(o.get("values", {}) for o in doc.get("observations", []))
+
+    if not daily:
+        return
+
+    periods = {
+        resolution: {period_bounds(d, resolution) for d in daily}
+        for resolution in (RollupResolution.WEEKLY, RollupResolution.MONTHLY)
+    }
+    span_start = min(start for bounds in periods.values() for start, _ in bounds)
+    span_end = max(end for bounds in periods.values() for _, end in bounds)
+
+    # Daily rollups already stored for the rest of the affected weeks and months
+    stored = {}
+    cursor = HistoryRollup.get_motor_collection().find(
+        {
+            "lon": lon,
+            "lat": lat,
+            "resolution": RollupResolution.DAILY.value,
+            "period_start": {"$gte": _as_datetime(span_start), "$lte": _as_datetime(span_end)}
+        },
+        {"_id": 0, "period_start": 1, "values": 1}
+    )
+    async for doc in cursor:
+        stored[doc["period_start"].date()] = doc["values"]
+    stored.update(daily)
+
+    for day, values in daily.items():
+        await _upsert(geo, RollupResolution.DAILY, day, day, values, bulk_writer)
+
+    for resolution, bounds in periods.items():
+        for start, end in bounds:
+            values = merge(v for d, v in stored.items() if start <= d <= end)
+            await _upsert(geo, resolution, start, end, values, bulk_writer)
+
+
+# Recompute the rollups of many locations, {(lon, lat): days}, in one bulk write
+async def update_rollups(touched: Dict[Tuple[float, float], Iterable[date]]):
+    if not touched:
+        return
+    bulk_writer = BulkWriter()
+    for (lon, lat), days in touched.items():
+        await update_location_rollups(lon, lat, days, bulk_writer)
+    await bulk_writer.commit()
+    logger.debug("History rollups updated for %d locations", len(touched))
+
@@ -0,0 +1,204 @@
+"""
+Time wheel of the recurring per-parcel push runs.
+
+Instead of one scheduler job per parcel and push kind, every recurring run is
+an entry of a single wheel. Entries are bucketed by the tick slot of their
+next run and a heap keeps the non-empty slots in order, so a tick only looks
+at the buckets that are due and costs O(due entries) however many parcels are
+scheduled. Due entries are grouped by kind and forecast grid cell, letting the
+parcels of one cell share a batch and the weather data fetched for it. Runs
+keep the staggered phase of their key; runs missed while a tick was late or
+the service was down are coalesced into a single run. Keys of entries that
+were added, changed, run or removed since the last take_changes() are tracked
+so the wheel can be persisted incrementally.
+"""
+
+import heapq
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.core import config
+from src.services.dispatcher import staggered_start
+
+
+logger = logging.getLogger(__name__)
+
+BatchKey = Tuple[str, int, int]
+
+
+class WheelEntry:
+    __slots__ = ("key", "kind", "interval", "payload", "next_run", "last_run", "slot")
+
+    def __init__(self, key: str, kind: str, interval: timedelta, payload: Any, next_run: datetime,
+                 last_run: Optional[datetime] = None):
+        self.key = key
+        self.kind = kind
+        self.interval = interval
+        self.payload = payload
+        self.next_run = next_run
+        self.last_run = last_run
+        self.slot: Optional[int] = None
+
+
+# First run of the staggered timeline of `key` that is not before `now`
+def next_staggered_run(key: str, interval: timedelta, now: datetime) -> datetime:
+    start = staggered_start(key, interval)
+    if now <= start:
+        return start
+    return start + math.ceil((now - start) / interval) * interval
+
+
+class TimeWheel:
+
+    def __init__(self, tick_seconds: Optional[int] = None, grid_degrees: Optional[float] = None):
+        self.tick_seconds = tick_seconds or config.TIME_WHEEL_TICK_SECONDS
+        self.grid_degrees = grid_degrees or config.FORECAST_GRID_DEGREES
+        self._entries: Dict[str, WheelEntry] = {}
+        self._buckets: Dict[int, Dict[str, WheelEntry]] = {}
+        self._slots: List[int] = []
+        self._dirty: Set[str] = set()
+        self._removed: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[WheelEntry]:
+        return self._entries.get(key)
+
+    def entries(self) -> List[WheelEntry]:
+        return list(self._entries.values())
+
+    def clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+        self._slots.clear()
+        self._dirty.clear()
+        self._removed.clear()
+
+    def _slot(self, when: datetime) -> int:
+        return int(when.timestamp() // self.tick_seconds)
+
+    def _place(self, entry: WheelEntry):
+        entry.slot = self._slot(entry.next_run)
+        bucket = self._buckets.get(entry.slot)
+        if bucket is None:
+            bucket = self._buckets[entry.slot] = {}
+            heapq.heappush(self._slots, entry.slot)
+        bucket[entry.key] = entry
+
+    def _unplace(self, entry: WheelEntry):
+        bucket = self._buckets.get(entry.slot)
+        if bucket is None:
+            return
+        bucket.pop(entry.key, None)
+        # The slot stays in the heap and is skipped once it comes up
+        if not bucket:
+            del self._buckets[entry.slot]
+
+    def schedule(self, key: str, kind: str, interval: timedelta, payload: Any,
+                 next_run: Optional[datetime] = None, now: Optional[datetime] = None) -> WheelEntry:
+        self.remove(key)
+        if next_run is None:
+            next_run = next_staggered_run(key, interval, now or datetime.now(timezone.utc))
+        entry = self.restore(key, kind, interval, payload, next_run)
+        self._removed.discard(key)
+        self._dirty.add(key)
+        return entry
+
+    # Adds an entry as it was persisted, without marking it as changed
+    def restore(self, key: str, kind: str, interval: timedelta, payload: Any, next_run: datetime,
+                last_run: Optional[datetime] = None) -> WheelEntry:
+        self.remove(key)
+        entry = WheelEntry(key, kind, interval, payload, next_run, last_run)
+        self._entries[key] = entry
+        self._place(entry)
+        self._removed.discard(key)
+        return entry
+
+    def remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._unplace(entry)
+            self._dirty.discard(key)
+            self._removed.add(key)
+
+    # Entries changed and keys removed since the previous call
+    def take_changes(self) -> Tuple[List[WheelEntry], List[str]]:
+        changed = [self._entries[key] for key in self._dirty]
+        removed = list(self._removed)
+        self._dirty.clear()
+        self._removed.clear()
+        return changed, removed
+
+    # Brings the wheel in line with `desired`, {key: {"kind", "interval", "payload"}}.
+    # Unchanged and payload-only changes keep their next run, interval changes
+    # move the entry to its new staggered timeline.
+    def reconcile(self, desired: Dict[str, dict], now: Optional[datetime] = None) -> Dict[str, int]:
+        now = now or datetime.now(timezone.utc)
+        report = {"added": 0, "removed": 0, "updated": 0, "unchanged": 0}
+
+        for key in self._entries.keys() - desired.keys():
+            self.remove(key)
+            report["removed"] += 1
+
+        for key, spec in desired.items():
+            entry = self._entries.get(key)
+            if entry is None:
+                self.schedule(key, spec["kind"], spec["interval"], spec["payload"], now=now)
+                report["added"] += 1
+            elif entry.interval != spec["interval"]:
+                self.schedule(key, spec["kind"], spec["interval"], spec["payload"], now=now)
+                report["updated"] += 1
+            elif entry.kind != spec["kind"] or entry.payload != spec["payload"]:
+                entry.kind = spec["kind"]
+                entry.payload = spec["payload"]
+                self._dirty.add(key)
+                report["updated"] += 1
+            else:
+                report["unchanged"] += 1
+        return report
+
+    # Entries due at `now`, each moved to its first run after `now`
+    def pop_due(self, now: Optional[datetime] = None) -> List[WheelEntry]:
+        now = now or datetime.now(timezone.utc)
+        current = self._slot(now)
+        due = []
+        while self._slots and self._slots[0] <= current:
+            slot = heapq.heappop(self._slots)
+            bucket = self._buckets.pop(slot, None)
+            if bucket:
+                due.extend(bucket.values())
+
+        for entry in due:
+            # Entries of the current slot may be a few seconds early
+            missed = max(0, (now - entry.next_run) // entry.interval)
+            if missed:
+                logger.debug("Coalescing %d missed runs of %s", missed, entry.key)
+            entry.next_run += (missed + 1) * entry.interval
+            entry.last_run = now
+            self._place(entry)
+            self._dirty.add(entry.key)
+        return due
+
+    def grid_cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.grid_degrees), math.floor(lon / self.grid_degrees)
+
+    # Due entries grouped by (kind, grid cell) of their payload's lat/lon
+    def due_batches(self, now: Optional[datetime] = None) -> Dict[BatchKey, List[WheelEntry]]:
+        batches: Dict[BatchKey, List[WheelEntry]] = {}
+        for entry in self.pop_due(now):
+            cell = self.grid_cell(entry.payload["lat"], entry.payload["lon"])
+            batches.setdefault((entry.kind, *cell), []).append(entry)
+        return batches
+
+    def next_run(self) -> Optional[datetime]:
+        while self._slots and self._slots[0] not in self._buckets:
+            heapq.heappop(self._slots)
+        if not self._slots:
+            return None
+        return min(entry.next_run for entry in self._buckets[self._slots[0]].values())
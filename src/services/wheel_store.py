@@ -0,0 +1,75 @@
+"""
+MongoDB persistence of the parcel time wheel.
+
+Every recurring push is stored as a ParcelSchedule with its next and last run,
+so a restart resumes the existing timeline instead of starting over. Loading
+reads the whole collection with a single query and saving writes only the
+entries changed since the previous save, as one bulk write. Runs that fell
+due while the service was down are found due by the first tick and, being
+coalesced by the wheel, run once.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+from beanie import BulkWriter
+from beanie.operators import In
+
+from src.models.scheduler import ParcelSchedule
+from src.services.time_wheel import TimeWheel
+
+
+logger = logging.getLogger(__name__)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Mongo hands back naive datetimes in UTC
+    return value.replace(tzinfo=timezone.utc) if value and value.tzinfo is None else value
+
+
+# Fills the wheel with the persisted schedules, returns their number
+async def load_wheel(wheel: TimeWheel) -> int:
+    count = 0
+    async for doc in ParcelSchedule.get_motor_collection().find({}, {"_id": 0, "updated_at": 0}):
+        wheel.restore(
+            doc["key"],
+            doc["kind"],
+            timedelta(seconds=doc["interval_s"]),
+            doc["payload"],
+            _as_utc(doc["next_run"]),
+            _as_utc(doc.get("last_run")),
+        )
+        count += 1
+    logger.info("Restored %d parcel schedules", count)
+    return count
+
+
+# Writes the entries changed since the last save, returns the number of upserts and deletions
+async def save_wheel(wheel: TimeWheel) -> Dict[str, int]:
+    changed, removed = wheel.take_changes()
+    if not changed and not removed:
+        return {"saved": 0, "deleted": 0}
+
+    now = datetime.now(timezone.utc)
+    bulk_writer = BulkWriter()
+    for entry in changed:
+        await ParcelSchedule.find(ParcelSchedule.key == entry.key).update_many(
+            {
+                "$set": {
+                    "kind": entry.kind,
+                    "interval_s": entry.interval.total_seconds(),
+                    "payload": entry.payload,
+                    "next_run": entry.next_run,
+                    "last_run": entry.last_run,
+                    "updated_at": now,
+                },
+                "$setOnInsert": {"key": entry.key},
+            },
+            upsert=True,
+            bulk_writer=bulk_writer
+        )
+    if removed:
+        await ParcelSchedule.find(In(ParcelSchedule.key, removed)).delete(bulk_writer=bulk_writer)
+    await bulk_writer.commit()
+    return {"saved": len(changed), "deleted": len(removed)}
@@ -17,6 +17,7 @@ from fastapi import APIRouter
 import httpx
 from beanie.operators import In
 
+from src.core import metrics
 from src.models.spray import SprayStatus
 from src.models.uav import FlightStatus, UAVModel
 
@@ -36,6 +37,11 @@ def extract_value_from_dict_path(d: dict, path: list):
             )
 
 
+# Split a list in consecutive chunks of at most `size` items
+def chunked(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
 # Convert UNIX timestamp in string in format HH:MM:SS
 # Optionally select ISO8601 format string
 def convert_timestamp_to_string(dt_timestamp, tz_offset, iso=False):
@@ -74,8 +80,8 @@ def generate_urn(*class_names, obj_id):
     return f'{urn_prefix}:{obj_id}'
 
 
-async def http_get(url: str) -> dict:
-    async with httpx.AsyncClient() as client:
+async def http_get(url: str, provider: str = "openweathermap") -> dict:
+    async with httpx.AsyncClient(event_hooks=metrics.http_event_hooks(provider)) as client:
         r = await client.get(url)
         r.raise_for_status()
         return r.json()
@@ -0,0 +1,63 @@
+import time
+from unittest.mock import patch
+
+import jwt
+import pytest
+
+from src.api import deps
+from src.core import config
+
+
+def make_token(sub="test_user", expires_in=3600):
+    return jwt.encode({"sub": sub, "exp": int(time.time()) + expires_in}, config.KEY, algorithm=config.ALGORITHM)
+
+
+class TestVerifiedTokenCache:
+    """
+    Tests for authenticate_request reusing the verification of tokens it has seen.
+    """
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        deps.clear_verified_tokens()
+        yield
+        deps.clear_verified_tokens()
+
+    @pytest.mark.anyio
+    async def test_token_is_verified_once(self, async_client):
+        headers = {"Authorization": f"Bearer {make_token()}"}
+        with patch("src.api.deps.jwt.decode", wraps=jwt.decode) as decode:
+            for _ in range(5):
+                response = await async_client.get("/api/v1/auth/test", headers=headers)
+                assert response.status_code == 200
+                assert response.json()["sub"] == "test_user"
+        assert decode.call_count == 1
+
+    @pytest.mark.anyio
+    async def test_invalid_token_is_not_cached(self, async_client):
+        token = jwt.encode({"sub": "x", "exp": int(time.time()) + 60}, "other-key", algorithm=config.ALGORITHM)
+        for _ in range(2):
+            response = await async_client.get("/api/v1/auth/test", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 403
+        assert not deps._verified
+
+    @pytest.mark.anyio
+    async def test_cached_token_expires(self, async_client):
+        token = make_token(expires_in=60)
+        headers = {"Authorization": f"Bearer {token}"}
+        assert (await async_client.get("/api/v1/auth/test", headers=headers)).status_code == 200
+
+        with patch("src.api.deps.time.time", return_value=time.time() + 61):
+            response = await async_client.get("/api/v1/auth/test", headers=headers)
+        assert response.status_code == 403
+
+    def test_cache_is_bounded(self):
+        with patch.object(config, "AUTH_CACHE_SIZE", 10):
+            tokens = [make_token(f"user-{i}") for i in range(25)]
+            for token in tokens:
+                deps._verify(token)
+        assert len(deps._verified) == 10
+        # Least recently used first
+        assert deps._token_hash(tokens[-1]) in deps._verified
+        assert deps._token_hash(tokens[0]) not in deps._verified
+
@@ -0,0 +1,87 @@
+import json
+from datetime import datetime, timedelta
+from typing import List
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.api.responses import model_response
+from src.models.point import Point
+from src.models.prediction import Prediction
+from src.schemas.history_data import HourlyObservationOut, HourlyResponse
+from src.schemas.prediction import PredictionOut
+
+
+BASE_PARAMS = {"lat": 38.25, "lon": 21.74}
+
+
+def hourly_observations(days, variables=10):
+    start = datetime(2025, 6, 1)
+    return [
+        HourlyObservationOut.model_construct(
+            timestamp=start + timedelta(hours=i),
+            # Open-Meteo returns whole numbers as ints
+            values={f"variable_{v}": (i if v == 0 else i * 0.1 + v) for v in range(variables)} | {"missing": None},
+        )
+        for i in range(days * 24)
+    ]
+
+
+# Body FastAPI builds for an endpoint returning `content` with `response_model`
+async def fastapi_body(response_model, content) -> bytes:
+    field = create_response_field(name="response", type_=response_model)
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+class TestForecastRoutes:
+    """
+    Tests for /api/v1/forecast/ routes returning trusted models through model_response.
+    """
+
+    @pytest.mark.anyio
+    async def test_hourly_forecast_matches_validated_response(self, async_client):
+        observations = hourly_observations(days=2)
+        provider = AsyncMock()
+        provider.get_hourly_forecast.return_value = observations
+
+        with patch("src.api.api_v1.endpoints.forecast.WeatherClientFactory.get_provider", return_value=provider):
+            response = await async_client.get("/api/v1/forecast/hourly/", params={**BASE_PARAMS, "days": 2})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        expected = await fastapi_body(
+            HourlyResponse, HourlyResponse(location=BASE_PARAMS, data=observations, source="open-meteo")
+        )
+        assert response.json() == json.loads(expected)
+        assert response.json()["data"][1]["values"]["variable_0"] == 1.0
+
+    @pytest.mark.anyio
+    async def test_forecast5_narrows_documents(self, async_client, openweathermap_srv, auth_headers):
+        point = Point(type="station", location={"type": "Point", "coordinates": [21.74, 38.25]})
+        prediction = Prediction(
+            value=21.5, timestamp=datetime(2025, 6, 1, 12), source="openweathermaps", spatial_entity=point,
+            data_type="weather", measurement_type="ambient_temperature"
+        )
+        openweathermap_srv.get_weather_forecast5days = AsyncMock(return_value=[prediction])
+
+        response = await async_client.get("/api/data/forecast5/", params=BASE_PARAMS, headers=auth_headers)
+
+        assert response.status_code == 200
+        expected = await fastapi_body(List[PredictionOut], [prediction])
+        assert response.json() == json.loads(expected)
+        assert "created_at" not in response.json()[0]
+
+
+@pytest.mark.anyio
+async def test_16_day_hourly_body_matches_response_model():
+    observations = hourly_observations(days=16)
+    default = await fastapi_body(
+        HourlyResponse, HourlyResponse(location=BASE_PARAMS, data=observations, source="open-meteo")
+    )
+    fast = model_response(
+        HourlyResponse.model_construct(location=BASE_PARAMS, data=observations, source="open-meteo")
+    ).body
+    assert json.loads(fast) == json.loads(default)
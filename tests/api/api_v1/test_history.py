@@ -1,7 +1,17 @@
+import io
+import json
 import pytest
 from datetime import date, datetime
 from unittest.mock import AsyncMock, patch
 
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.core.spatial_index import location_index
+from src.models.history_data import CachedLocation, DailyHistory, DailyObservation, \
+    HistoryRollup, HourlyHistory, HourlyObservation
+from src.schemas.history_data import DailyObservationOut, HourlyObservationOut
+
 
 BASE_QUERY = {
     "lat": 40.7128,
@@ -16,12 +26,18 @@ class TestHistoryRoutes:
     """
     Tests for /api/v1/history/ routes.
 
-    Both routes use MongoDB $near geospatial queries which mongomock does not
-    support! We test the cache miss path only  `find_one` is patched to return
-    None, triggering the Open-Meteo fallback. The cache hit path (reading from
-    DB) requires a real MongoDB instance and is intentionally skipped.
+    The cache miss path patches `find_one` to return None, triggering the
+    Open-Meteo fallback. The cache hit path finds the nearest cached location
+    in the in-memory spatial index and reads its history from mongomock.
     """
 
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        location_index.clear()
+        await HourlyHistory.find_all().delete()
+        await DailyHistory.find_all().delete()
+
     @pytest.fixture
     def mock_hourly_observation(self):
         """Single hourly observation — reusable unit of hourly data."""
@@ -110,12 +126,45 @@ class TestHistoryRoutes:
         )
         assert response.status_code == 403
 
-    @pytest.mark.skip(
-        reason="Cache hit path uses $near geospatial query via find_one and "
-               "find_many — not supported by mongomock. Would require a real MongoDB."
-    )
-    async def test_get_hourly_history_cache_hit_returns_db_data(self):
-        pass
+    @pytest.mark.anyio
+    async def test_get_hourly_history_cache_hit_returns_db_data(self, async_client, auth_headers):
+        # Cached location ~500 m away from the requested point
+        cached_lat, cached_lon = BASE_QUERY["lat"] + 0.005, BASE_QUERY["lon"]
+        location_index.add("cached", cached_lat, cached_lon)
+        await HourlyHistory(
+            location={"type": "Point", "coordinates": [cached_lon, cached_lat]},
+            date=date(2024, 1, 1),
+            observations=[HourlyObservation(timestamp=datetime(2024, 1, 1, 12), values={"temperature_2m": 20.0})],
+            fetched_at=datetime.now(),
+        ).insert()
+
+        response = await async_client.post("/api/v1/history/hourly/", json=BASE_QUERY, headers=auth_headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["source"] == "open-meteo"
+        assert data["location"] == {"lat": cached_lat, "lon": cached_lon}
+        assert data["data"] == [{"timestamp": "2024-01-01T12:00:00", "values": {"temperature_2m": 20.0}}]
+
+    @pytest.mark.anyio
+    async def test_get_hourly_history_finds_location_cached_by_another_process(self, async_client, auth_headers):
+        # Cached by another worker, so only in MongoDB and not yet in this process's index
+        cached_lat, cached_lon = BASE_QUERY["lat"] + 0.005, BASE_QUERY["lon"]
+        await CachedLocation(
+            name="elsewhere", location={"type": "Point", "coordinates": [cached_lon, cached_lat]}
+        ).insert()
+        await HourlyHistory(
+            location={"type": "Point", "coordinates": [cached_lon, cached_lat]},
+            date=date(2024, 1, 1),
+            observations=[HourlyObservation(timestamp=datetime(2024, 1, 1, 12), values={"temperature_2m": 20.0})],
+            fetched_at=datetime.now(),
+        ).insert()
+
+        response = await async_client.post("/api/v1/history/hourly/", json=BASE_QUERY, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()["location"] == {"lat": cached_lat, "lon": cached_lon}
+        await CachedLocation.find_all().delete()
 
     @pytest.mark.anyio
     async def test_get_daily_history_cache_miss_fetches_from_openmeteo(
@@ -160,9 +209,402 @@ class TestHistoryRoutes:
         )
         assert response.status_code == 403
 
-    @pytest.mark.skip(
-        reason="Cache hit path uses $near geospatial query via find_one and "
-               "find_many — not supported by mongomock. Would require a real MongoDB."
-    )
-    async def test_get_daily_history_cache_hit_returns_db_data(self):
-        pass
\ No newline at end of file
+    @pytest.mark.anyio
+    async def test_get_daily_history_cache_hit_returns_db_data(self, async_client, auth_headers):
+        location_index.add("cached", BASE_QUERY["lat"], BASE_QUERY["lon"])
+        await DailyHistory(
+            location={"type": "Point", "coordinates": [BASE_QUERY["lon"], BASE_QUERY["lat"]]},
+            date_range={"start": date(2024, 1, 1), "end": date(2024, 1, 3)},
+            observations=[
+                DailyObservation(date=date(2024, 1, d), values={"temperature_2m": float(d)}) for d in (1, 2, 3)
+            ],
+            fetched_at=datetime.now(),
+        ).insert()
+
+        response = await async_client.post("/api/v1/history/daily/", json=BASE_QUERY, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert [obs["date"] for obs in response.json()["data"]] == ["2024-01-01", "2024-01-02"]
+
+    @pytest.mark.anyio
+    async def test_location_outside_radius_falls_back_to_openmeteo(self, async_client, auth_headers):
+        # ~55 km north of the requested point
+        location_index.add("far", BASE_QUERY["lat"] + 0.5, BASE_QUERY["lon"])
+        mock_provider = AsyncMock()
+        mock_provider.get_daily_history.return_value = []
+
+        with patch(
+            "src.api.api_v1.endpoints.history.WeatherClientFactory.get_provider",
+            return_value=mock_provider
+        ):
+            response = await async_client.post("/api/v1/history/daily/", json=BASE_QUERY, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json()["source"] == "openmeteo"
+
+class TestHistoryStreaming:
+    """
+    Tests for the NDJSON/CSV streaming modes of /api/v1/history/ routes.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        location_index.clear()
+        await HourlyHistory.find_all().delete()
+
+    @pytest.fixture
+    def mock_provider(self):
+        provider = AsyncMock()
+        provider.get_hourly_history.return_value = [
+            HourlyObservationOut(timestamp=datetime(2024, 1, 1, h), values={"temperature_2m": 10.0 + h})
+            for h in range(3)
+        ]
+        provider.get_daily_history.return_value = [
+            DailyObservationOut(date=date(2024, 1, 1), values={"temperature_2m": None})
+        ]
+        return provider
+
+    async def _post(self, async_client, auth_headers, mock_provider, url, **kwargs):
+        with patch(
+            f"src.api.api_v1.endpoints.history.{'Hourly' if 'hourly' in url else 'Daily'}History.find_one",
+            new_callable=AsyncMock,
+            return_value=None
+        ), patch(
+            "src.api.api_v1.endpoints.history.WeatherClientFactory.get_provider",
+            return_value=mock_provider
+        ):
+            return await async_client.post(url, json=BASE_QUERY, **kwargs)
+
+    @pytest.mark.anyio
+    async def test_hourly_history_ndjson_via_query_param(self, async_client, auth_headers, mock_provider):
+        response = await self._post(
+            async_client, auth_headers, mock_provider,
+            "/api/v1/history/hourly/", params={"format": "ndjson"}, headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert response.headers["x-data-source"] == "openmeteo"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 3
+        assert rows[0] == {"timestamp": "2024-01-01T00:00:00", "values": {"temperature_2m": 10.0}}
+
+    @pytest.mark.anyio
+    async def test_hourly_history_csv_via_accept_header(self, async_client, auth_headers, mock_provider):
+        response = await self._post(
+            async_client, auth_headers, mock_provider,
+            "/api/v1/history/hourly/", headers={**auth_headers, "Accept": "text/csv"}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert lines[0] == "timestamp,temperature_2m"
+        assert lines[1] == "2024-01-01T00:00:00,10.0"
+        assert len(lines) == 4
+
+    @pytest.mark.anyio
+    async def test_daily_history_csv_writes_missing_values_as_empty(self, async_client, auth_headers, mock_provider):
+        response = await self._post(
+            async_client, auth_headers, mock_provider,
+            "/api/v1/history/daily/", params={"format": "csv"}, headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        assert response.text.splitlines() == ["date,temperature_2m", "2024-01-01,"]
+
+    @pytest.mark.anyio
+    async def test_hourly_history_ndjson_streams_cached_docs_sorted(self, async_client, auth_headers):
+        geo = {"type": "Point", "coordinates": [BASE_QUERY["lon"], BASE_QUERY["lat"]]}
+        query = {**BASE_QUERY, "end": "2024-01-03"}
+        # Insert days out of order to check the cursor is sorted by date
+        for day in (2, 1):
+            await HourlyHistory(
+                location=geo,
+                date=date(2024, 1, day),
+                observations=[
+                    HourlyObservation(timestamp=datetime(2024, 1, day, h), values={"temperature_2m": float(h)})
+                    for h in (1, 0)
+                ],
+                fetched_at=datetime(2024, 1, 3),
+            ).insert()
+
+        location_index.add("cached", BASE_QUERY["lat"], BASE_QUERY["lon"])
+        response = await async_client.post(
+            "/api/v1/history/hourly/", json=query, params={"format": "ndjson"}, headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        timestamps = [json.loads(line)["timestamp"] for line in response.text.splitlines()]
+        assert timestamps == [
+            "2024-01-01T00:00:00", "2024-01-01T01:00:00",
+            "2024-01-02T00:00:00", "2024-01-02T01:00:00",
+        ]
+
+
+class TestHistoryConditionalRequests:
+    """
+    Tests for ETags of cached history derived from the version of its documents.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def cached_history(self, app):
+        geo = {"type": "Point", "coordinates": [BASE_QUERY["lon"], BASE_QUERY["lat"]]}
+        location_index.add("cached", BASE_QUERY["lat"], BASE_QUERY["lon"])
+        for day in (1, 2):
+            await HourlyHistory(
+                location=geo,
+                date=date(2024, 1, day),
+                observations=[HourlyObservation(timestamp=datetime(2024, 1, day, 6), values={"temperature_2m": 5.0})],
+                fetched_at=datetime(2024, 1, 3),
+            ).insert()
+        yield
+        location_index.clear()
+        await HourlyHistory.find_all().delete()
+
+    async def _post(self, async_client, auth_headers, etag=None, query=BASE_QUERY, **kwargs):
+        headers = {**auth_headers, "If-None-Match": etag} if etag else auth_headers
+        return await async_client.post("/api/v1/history/hourly/", json=query, headers=headers, **kwargs)
+
+    @pytest.mark.anyio
+    async def test_unchanged_history_is_not_read_again(self, async_client, auth_headers):
+        first = await self._post(async_client, auth_headers)
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+
+        with patch("src.api.api_v1.endpoints.history.model_response") as model_response:
+            second = await self._post(async_client, auth_headers, etag)
+        assert second.status_code == 304
+        assert second.content == b""
+        model_response.assert_not_called()
+
+    @pytest.mark.anyio
+    async def test_refetched_day_changes_the_etag(self, async_client, auth_headers):
+        etag = (await self._post(async_client, auth_headers)).headers["etag"]
+
+        doc = await HourlyHistory.find_one(HourlyHistory.date == date(2024, 1, 2))
+        doc.fetched_at = datetime(2024, 1, 4)
+        await doc.save()
+
+        response = await self._post(async_client, auth_headers, etag)
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    @pytest.mark.anyio
+    async def test_etag_depends_on_query_and_format(self, async_client, auth_headers):
+        json_etag = (await self._post(async_client, auth_headers)).headers["etag"]
+        other_variables = await self._post(
+            async_client, auth_headers, json_etag, query={**BASE_QUERY, "variables": ["precipitation"]}
+        )
+        assert other_variables.status_code == 200
+
+        ndjson = await self._post(async_client, auth_headers, json_etag, params={"format": "ndjson"})
+        assert ndjson.status_code == 200
+        assert ndjson.headers["etag"] != json_etag
+
+        again = await self._post(async_client, auth_headers, ndjson.headers["etag"], params={"format": "ndjson"})
+        assert again.status_code == 304
+
+
+class TestHistoryExport:
+    """
+    Tests for the Arrow/Parquet /api/v1/history/export/ route.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        await CachedLocation.find_all().delete()
+        await HourlyHistory.find_all().delete()
+        await DailyHistory.find_all().delete()
+
+    async def _insert_location(self, lat, lon):
+        geo = {"type": "Point", "coordinates": [lon, lat]}
+        location = await CachedLocation(name="Parcel", location=geo).insert()
+        for day in (1, 2):
+            await HourlyHistory(
+                location=geo,
+                date=date(2024, 1, day),
+                observations=[
+                    HourlyObservation(
+                        timestamp=datetime(2024, 1, day, h),
+                        values={"temperature_2m": float(h), "rain": 0.0}
+                    )
+                    for h in range(24)
+                ],
+                fetched_at=datetime(2024, 1, 3),
+            ).insert()
+        await DailyHistory(
+            location=geo,
+            date_range={"start": date(2024, 1, 1), "end": date(2024, 1, 2)},
+            observations=[
+                DailyObservation(date=date(2024, 1, day), values={"rain_sum": float(day)})
+                for day in (2, 1)
+            ],
+            fetched_at=datetime(2024, 1, 3),
+        ).insert()
+        return location
+
+    @pytest.mark.anyio
+    async def test_export_arrow_stream_for_all_locations(self, async_client, auth_headers):
+        await self._insert_location(40.0, 20.0)
+        await self._insert_location(41.0, 21.0)
+
+        response = await async_client.post(
+            "/api/v1/history/export/",
+            json={"start": "2024-01-01", "end": "2024-01-01", "variables": ["temperature_2m"], "compression": "zstd"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+        table = pa.ipc.open_stream(response.content).read_all()
+        assert table.column_names == ["location_id", "lat", "lon", "timestamp", "temperature_2m"]
+        assert table.num_rows == 48
+        assert table.column("temperature_2m").to_pylist()[:3] == [0.0, 1.0, 2.0]
+
+    @pytest.mark.anyio
+    async def test_export_parquet_daily_for_selected_location(self, async_client, auth_headers):
+        location = await self._insert_location(40.0, 20.0)
+        await self._insert_location(41.0, 21.0)
+
+        response = await async_client.post(
+            "/api/v1/history/export/",
+            json={
+                "location_ids": [str(location.id)],
+                "start": "2024-01-01",
+                "end": "2024-01-02",
+                "granularity": "daily",
+                "variables": ["rain_sum"],
+                "format": "parquet",
+            },
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        table = pq.read_table(io.BytesIO(response.content), use_threads=False)
+        assert table.column("location_id").to_pylist() == [str(location.id)] * 2
+        assert table.column("date").to_pylist() == [date(2024, 1, 1), date(2024, 1, 2)]
+        assert table.column("rain_sum").to_pylist() == [1.0, 2.0]
+
+    @pytest.mark.anyio
+    async def test_export_rejects_unsupported_compression(self, async_client, auth_headers):
+        response = await async_client.post(
+            "/api/v1/history/export/",
+            json={"start": "2024-01-01", "end": "2024-01-02", "compression": "snappy"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 422
+
+    @pytest.mark.anyio
+    @pytest.mark.parametrize("options", [
+        {"format": "parquet", "compression_level": 3},
+        {"format": "parquet", "compression": "snappy", "compression_level": 3},
+        {"format": "parquet", "compression": "none", "compression_level": 3},
+        {"format": "parquet", "compression": "gzip", "compression_level": 30},
+        {"format": "arrow", "compression_level": 3},
+    ])
+    async def test_export_rejects_invalid_compression_level(self, async_client, auth_headers, options):
+        await self._insert_location(40.0, 20.0)
+        response = await async_client.post(
+            "/api/v1/history/export/",
+            json={"start": "2024-01-01", "end": "2024-01-02", **options},
+            headers=auth_headers,
+        )
+        assert response.status_code == 422
+        assert "compression" in response.json()["detail"].lower()
+
+    @pytest.mark.anyio
+    async def test_export_parquet_with_compression_level(self, async_client, auth_headers):
+        await self._insert_location(40.0, 20.0)
+        response = await async_client.post(
+            "/api/v1/history/export/",
+            json={"start": "2024-01-01", "end": "2024-01-01", "format": "parquet", "compression": "zstd",
+                  "compression_level": 9, "variables": ["temperature_2m"]},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        assert pq.read_table(io.BytesIO(response.content), use_threads=False).num_rows == 24
+
+    @pytest.mark.anyio
+    async def test_export_returns_404_for_unknown_location(self, async_client, auth_headers):
+        response = await async_client.post(
+            "/api/v1/history/export/",
+            json={"location_ids": ["5f9f1b9b9c9d440000000000"], "start": "2024-01-01", "end": "2024-01-02"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 404
+
+
+class TestHistoryRollup:
+    """
+    Tests for POST /api/v1/history/rollup/.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        location_index.clear()
+        await HistoryRollup.find_all().delete()
+
+    @pytest.mark.anyio
+    async def test_cache_hit_returns_stored_rollups(self, async_client, auth_headers):
+        location = {"type": "Point", "coordinates": [BASE_QUERY["lon"], BASE_QUERY["lat"]]}
+        stats = {"min": 1.0, "max": 3.0, "mean": 2.0, "sum": 4.0, "count": 2}
+        docs = [
+            HistoryRollup(location=location, resolution=resolution, period_start=start, period_end=end,
+                          values={"temperature_2m": stats, "rain": stats})
+            for resolution, start, end in [
+                ("weekly", date(2023, 12, 25), date(2023, 12, 31)),
+                ("weekly", date(2024, 1, 1), date(2024, 1, 7)),
+                ("weekly", date(2024, 1, 8), date(2024, 1, 14)),
+                ("monthly", date(2024, 1, 1), date(2024, 1, 31)),
+            ]
+        ]
+        for doc in docs:
+            await doc.insert()
+
+        location_index.add("cached", BASE_QUERY["lat"], BASE_QUERY["lon"])
+        response = await async_client.post(
+            "/api/v1/history/rollup/",
+            json={**BASE_QUERY, "start": "2024-01-01", "end": "2024-01-10", "resolution": "weekly"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["resolution"] == "weekly"
+        assert [r["period_start"] for r in data["data"]] == ["2024-01-01", "2024-01-08"]
+        assert data["data"][0]["values"] == {"temperature_2m": stats}
+
+    @pytest.mark.anyio
+    async def test_cache_miss_summarizes_openmeteo_hours(self, async_client, auth_headers):
+        mock_provider = AsyncMock()
+        mock_provider.get_hourly_history.return_value = [
+            HourlyObservationOut(timestamp=datetime(2024, 1, d, h), values={"temperature_2m": float(h)})
+            for d in (1, 2) for h in (0, 12)
+        ]
+
+        with patch(
+            "src.api.api_v1.endpoints.history.HistoryRollup.find_one",
+            new_callable=AsyncMock,
+            return_value=None
+        ), patch(
+            "src.api.api_v1.endpoints.history.WeatherClientFactory.get_provider",
+            return_value=mock_provider
+        ):
+            response = await async_client.post(
+                "/api/v1/history/rollup/",
+                json={**BASE_QUERY, "resolution": "monthly"},
+                headers=auth_headers,
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["source"] == "openmeteo"
+        assert data["data"] == [{
+            "period_start": "2024-01-01",
+            "period_end": "2024-01-31",
+            "values": {"temperature_2m": {"min": 0.0, "max": 12.0, "mean": 6.0, "sum": 24.0, "count": 4}}
+        }]
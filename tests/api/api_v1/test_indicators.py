@@ -0,0 +1,65 @@
+import pytest
+from datetime import date
+from unittest.mock import AsyncMock, patch
+
+from src.schemas.history_data import DailyObservationOut
+from src.services import indicators
+
+
+QUERY = {"lat": 38.25, "lon": 21.74, "start": "2024-03-01", "end": "2024-03-02"}
+
+
+class TestIndicatorRoutes:
+    """
+    Tests for /api/v1/indicators/ routes.
+    """
+
+    @pytest.fixture(autouse=True)
+    def clear_memo(self):
+        indicators.clear_memo()
+        yield
+        indicators.clear_memo()
+
+    @pytest.mark.anyio
+    async def test_list_indicators(self, async_client, auth_headers):
+        response = await async_client.get("/api/v1/indicators/", headers=auth_headers)
+
+        assert response.status_code == 200
+        names = [i["name"] for i in response.json()]
+        assert names == ["gdd", "chill_hours", "et0", "rainfall_deficit"]
+
+    @pytest.mark.anyio
+    async def test_rainfall_deficit(self, async_client, auth_headers):
+        provider = AsyncMock()
+        provider.get_daily_history.return_value = [
+            DailyObservationOut(date=date(2024, 3, d), values={"et0_fao_evapotranspiration": 3.0, "precipitation_sum": p})
+            for d, p in ((1, 1.0), (2, 5.0))
+        ]
+
+        with patch("src.services.indicators.dao.find_location_nearby", new_callable=AsyncMock, return_value=None), \
+                patch("src.services.indicators.WeatherClientFactory.get_provider", return_value=provider):
+            response = await async_client.post(
+                "/api/v1/indicators/rainfall_deficit/", json=QUERY, headers=auth_headers
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [v["value"] for v in data["data"]] == [2.0, -2.0]
+        assert data["total"] == 0.0
+
+    @pytest.mark.anyio
+    async def test_unknown_indicator(self, async_client, auth_headers):
+        response = await async_client.post("/api/v1/indicators/frost/", json=QUERY, headers=auth_headers)
+        assert response.status_code == 404
+
+    @pytest.mark.anyio
+    async def test_unknown_param(self, async_client, auth_headers):
+        response = await async_client.post(
+            "/api/v1/indicators/gdd/", json={**QUERY, "params": {"threshold": 1}}, headers=auth_headers
+        )
+        assert response.status_code == 422
+
+    @pytest.mark.anyio
+    async def test_requires_authentication(self, async_client):
+        response = await async_client.get("/api/v1/indicators/")
+        assert response.status_code == 403
@@ -1,6 +1,9 @@
 import pytest
 from unittest.mock import AsyncMock, patch
+from src.api.api_v1.endpoints.locations import DEFAULT_PAGE_SIZE
+from src.core.spatial_index import location_index
 from src.models.history_data import CachedLocation
+from src.models.onboarding import OnboardingJob
 
 MOCK_LAT = 40.7128
 MOCK_LON = -74.0060
@@ -17,12 +20,15 @@ class TestLocationRoutes:
     async def clean_db(self):
         yield
         await CachedLocation.find_all().delete()
+        await OnboardingJob.find_all().delete()
+        location_index.clear()
 
     # Inserts a real CachedLocation document into the mock DB.
     # Returns the inserted document so tests can reference its id.
     async def _insert_location(self, location:dict, name: str = "Test Location"):
         doc = CachedLocation(name=name, location=location)
         await doc.insert()
+        location_index.add(str(doc.id), location["coordinates"][1], location["coordinates"][0])
         return doc
 
     @pytest.mark.anyio
@@ -52,6 +58,88 @@ class TestLocationRoutes:
         assert "Location A" in names
         assert "Location B" in names
 
+    @pytest.mark.anyio
+    async def test_list_locations_paginates_with_cursor(
+        self, async_client, auth_headers
+    ):
+        for i in range(5):
+            await self._insert_location({"type": "Point", "coordinates": [float(i), 0.0]}, f"Location {i}")
+
+        names, cursor = [], None
+        for _ in range(3):
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = await async_client.get(
+                "/api/v1/locations/locations/", params=params, headers=auth_headers
+            )
+            assert response.status_code == 200
+            names += [loc["name"] for loc in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+
+        assert names == [f"Location {i}" for i in range(5)]
+        assert cursor is None
+
+    @pytest.mark.anyio
+    async def test_list_locations_defaults_to_one_page(self, async_client, auth_headers):
+        total = DEFAULT_PAGE_SIZE + 5
+        await CachedLocation.insert_many([
+            CachedLocation(name=f"Location {i}", location={"type": "Point", "coordinates": [0.0, 0.0]})
+            for i in range(total)
+        ])
+
+        response = await async_client.get("/api/v1/locations/locations/", headers=auth_headers)
+        assert response.status_code == 200
+        assert len(response.json()) == DEFAULT_PAGE_SIZE
+        assert response.headers["X-Next-Cursor"] == response.json()[-1]["id"]
+
+        response = await async_client.get(
+            "/api/v1/locations/locations/", params={"cursor": response.headers["X-Next-Cursor"]},
+            headers=auth_headers
+        )
+        assert len(response.json()) == 5
+        assert "X-Next-Cursor" not in response.headers
+
+    @pytest.mark.anyio
+    async def test_list_locations_filters_and_projects(
+        self, async_client, auth_headers
+    ):
+        await self._insert_location({"type": "Point", "coordinates": [21.74, 38.25]}, "Farm Patras")
+        await self._insert_location({"type": "Point", "coordinates": [21.80, 38.30]}, "Vineyard")
+        await self._insert_location({"type": "Point", "coordinates": [23.72, 37.98]}, "Farm Athens")
+
+        response = await async_client.get(
+            "/api/v1/locations/locations/",
+            params={"bbox": "21.5,38.0,22.0,38.5", "name_prefix": "Farm", "fields": "name,lat"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.json() == [{"name": "Farm Patras", "lat": 38.25}]
+
+    @pytest.mark.anyio
+    async def test_list_locations_bbox_across_antimeridian(
+        self, async_client, auth_headers
+    ):
+        await self._insert_location({"type": "Point", "coordinates": [179.5, 0.0]}, "East")
+        await self._insert_location({"type": "Point", "coordinates": [-179.5, 0.0]}, "West")
+        await self._insert_location({"type": "Point", "coordinates": [0.0, 0.0]}, "Greenwich")
+
+        response = await async_client.get(
+            "/api/v1/locations/locations/",
+            params={"bbox": "179,-1,-179,1", "fields": "name"},
+            headers=auth_headers,
+        )
+
+        assert response.json() == [{"name": "East"}, {"name": "West"}]
+
+    @pytest.mark.anyio
+    async def test_list_locations_rejects_unknown_fields(
+        self, async_client, auth_headers
+    ):
+        response = await async_client.get(
+            "/api/v1/locations/locations/", params={"fields": "name,password"}, headers=auth_headers
+        )
+        assert response.status_code == 422
+
     @pytest.mark.anyio
     async def test_list_locations_returns_403_without_auth(self, async_client):
         response = await async_client.get("/api/v1/locations/locations/")
@@ -98,24 +186,46 @@ class TestLocationRoutes:
         assert response.status_code == 403
 
 
-    @pytest.mark.skip(
-        reason="Uses MongoDB $near geospatial query — not supported by mongomock. "
-               "Requires a real MongoDB instance to test meaningfully."
-    )
-    async def test_check_location_exists_in_radius(self):
-        pass
+    @pytest.mark.anyio
+    async def test_check_location_exists_in_radius(
+        self, async_client, auth_headers, mock_location
+    ):
+        doc = await self._insert_location(mock_location)
+
+        response = await async_client.get(
+            "/api/v1/locations/locations/exists-in-radius/",
+            params={"lat": MOCK_LAT + 0.01, "lon": MOCK_LON},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        assert response.json()["id"] == str(doc.id)
+
+        response = await async_client.get(
+            "/api/v1/locations/locations/exists-in-radius/",
+            params={"lat": MOCK_LAT + 1, "lon": MOCK_LON},
+            headers=auth_headers,
+        )
+        assert response.status_code == 404
+
+    @pytest.fixture
+    def mock_provider(self):
+        # One empty history per requested location
+        provider = AsyncMock()
+        provider.get_daily_history_batch.side_effect = lambda coords, *args: [[] for _ in coords]
+        provider.get_hourly_history_batch.side_effect = lambda coords, *args: [[] for _ in coords]
+        return provider
 
     @pytest.mark.anyio
-    async def test_add_locations_returns_200_and_inserts(
-        self, async_client, auth_headers
+    async def test_add_locations_returns_202_and_inserts(
+        self, async_client, auth_headers, mock_provider
     ):
         payload = {
             "locations": [{"name": "Farm A", "lat": MOCK_LAT, "lon": MOCK_LON}]
         }
 
         with patch(
-            "src.api.api_v1.endpoints.locations.fetch_and_cache_last_month",
-            new_callable=AsyncMock
+            "src.services.onboarding.WeatherClientFactory.get_provider",
+            return_value=mock_provider
         ):
             response = await async_client.post(
                 "/api/v1/locations/locations/",
@@ -123,7 +233,8 @@ class TestLocationRoutes:
                 headers=auth_headers,
             )
 
-        assert response.status_code == 200
+        assert response.status_code == 202
+        assert response.json()["total"] == 1
         # Verify it actually landed in the DB
         docs = await CachedLocation.find_all().to_list()
         assert len(docs) == 1
@@ -131,7 +242,7 @@ class TestLocationRoutes:
 
     @pytest.mark.anyio
     async def test_add_locations_skips_existing_location(
-        self, async_client, auth_headers, mock_location
+        self, async_client, auth_headers, mock_location, mock_provider
     ):
         await self._insert_location(mock_location, "Farm A")
 
@@ -140,8 +251,8 @@ class TestLocationRoutes:
         }
 
         with patch(
-            "src.api.api_v1.endpoints.locations.fetch_and_cache_last_month",
-            new_callable=AsyncMock
+            "src.services.onboarding.WeatherClientFactory.get_provider",
+            return_value=mock_provider
         ):
             response = await async_client.post(
                 "/api/v1/locations/locations/",
@@ -149,11 +260,83 @@ class TestLocationRoutes:
                 headers=auth_headers,
             )
 
-        assert response.status_code == 200
+        assert response.status_code == 202
         # Still only one document — duplicate was skipped
         docs = await CachedLocation.find_all().to_list()
         assert len(docs) == 1
 
+    @pytest.mark.anyio
+    async def test_onboarding_job_reports_per_location_results(
+        self, async_client, auth_headers, mock_location, mock_provider
+    ):
+        existing = await self._insert_location(mock_location, "Farm A")
+        payload = {
+            "locations": [
+                {"name": "Farm A", "lat": MOCK_LAT, "lon": MOCK_LON},
+                {"name": "Farm B", "lat": 38.25, "lon": 21.74},
+                {"name": "Farm C", "lat": 38.5, "lon": 22.0},
+            ]
+        }
+
+        with patch(
+            "src.services.onboarding.WeatherClientFactory.get_provider",
+            return_value=mock_provider
+        ):
+            response = await async_client.post(
+                "/api/v1/locations/locations/",
+                json=payload,
+                headers=auth_headers,
+            )
+        job_id = response.json()["job_id"]
+
+        response = await async_client.get(f"/api/v1/locations/locations/jobs/{job_id}/", headers=auth_headers)
+
+        assert response.status_code == 200
+        job = response.json()
+        assert job["status"] == "completed"
+        assert job["counts"] == {"pending": 0, "cached": 2, "skipped": 1, "failed": 0}
+        assert [r["status"] for r in job["results"]] == ["skipped", "cached", "cached"]
+        assert job["results"][0]["location_id"] == str(existing.id)
+        # New locations are fetched together in a single batched request
+        mock_provider.get_daily_history_batch.assert_called_once()
+        assert mock_provider.get_daily_history_batch.call_args.args[0] == [(38.25, 21.74), (38.5, 22.0)]
+
+    @pytest.mark.anyio
+    async def test_onboarding_job_rolls_back_failed_batch(
+        self, async_client, auth_headers, mock_provider
+    ):
+        mock_provider.get_daily_history_batch.side_effect = Exception("Open-Meteo down")
+        payload = {
+            "locations": [{"name": "Farm A", "lat": MOCK_LAT, "lon": MOCK_LON}]
+        }
+
+        with patch(
+            "src.services.onboarding.WeatherClientFactory.get_provider",
+            return_value=mock_provider
+        ):
+            response = await async_client.post(
+                "/api/v1/locations/locations/",
+                json=payload,
+                headers=auth_headers,
+            )
+        job_id = response.json()["job_id"]
+
+        response = await async_client.get(f"/api/v1/locations/locations/jobs/{job_id}/", headers=auth_headers)
+
+        job = response.json()
+        assert job["results"][0]["status"] == "failed"
+        assert job["results"][0]["location_id"] is None
+        assert await CachedLocation.find_all().count() == 0
+
+    @pytest.mark.anyio
+    async def test_get_onboarding_job_returns_404_when_not_found(
+        self, async_client, auth_headers
+    ):
+        response = await async_client.get(
+            "/api/v1/locations/locations/jobs/64b7f0c2e4b0a1a2b3c4d5e6/", headers=auth_headers
+        )
+        assert response.status_code == 404
+
     @pytest.mark.anyio
     async def test_add_locations_returns_403_without_auth(self, async_client):
         payload = {
@@ -162,12 +345,31 @@ class TestLocationRoutes:
         response = await async_client.post("/api/v1/locations/locations/", json=payload)
         assert response.status_code == 403
 
-    @pytest.mark.skip(
-        reason="Uses dao.find_location_nearby which relies on MongoDB $near "
-               "geospatial query — not supported by mongomock."
-    )
-    async def test_add_unique_locations(self):
-        pass
+    @pytest.mark.anyio
+    async def test_add_unique_locations(self, async_client, auth_headers, mock_provider):
+        await self._insert_location({"type": "Point", "coordinates": [MOCK_LON, MOCK_LAT]}, "Farm A")
+        payload = {
+            "locations": [
+                {"name": "Farm A2", "lat": MOCK_LAT + 0.001, "lon": MOCK_LON},
+                {"name": "Farm B", "lat": 38.25, "lon": 21.74},
+                # Duplicate of a location submitted in the same request
+                {"name": "Farm B2", "lat": 38.251, "lon": 21.74},
+            ]
+        }
+
+        with patch(
+            "src.services.onboarding.WeatherClientFactory.get_provider",
+            return_value=mock_provider
+        ):
+            response = await async_client.post(
+                "/api/v1/locations/locations/unique/",
+                json=payload,
+                headers=auth_headers,
+            )
+
+        assert response.status_code == 202
+        names = sorted(doc.name for doc in await CachedLocation.find_all().to_list())
+        assert names == ["Farm A", "Farm B"]
 
     @pytest.mark.anyio
     async def test_delete_location_returns_200(
@@ -175,19 +377,16 @@ class TestLocationRoutes:
     ):
         doc = await self._insert_location(mock_location)
 
-        with patch(
-            "src.api.api_v1.endpoints.locations.scheduler"
-        ) as mock_scheduler:
-            mock_scheduler.get_job.return_value = None
-            response = await async_client.delete(
-                f"/api/v1/locations/locations/{doc.id}/",
-                headers=auth_headers,
-            )
+        response = await async_client.delete(
+            f"/api/v1/locations/locations/{doc.id}/",
+            headers=auth_headers,
+        )
 
         assert response.status_code == 200
         # Verify it was actually removed from the DB
         remaining = await CachedLocation.find_all().to_list()
         assert len(remaining) == 0
+        assert str(doc.id) not in location_index
 
 
     @pytest.mark.anyio
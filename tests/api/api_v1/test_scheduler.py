@@ -0,0 +1,29 @@
+import pytest
+from unittest.mock import AsyncMock
+
+from src.services.dispatcher import dispatcher
+
+
+class TestSchedulerRoutes:
+    """
+    Tests for /api/v1/scheduler/ routes.
+    """
+
+    @pytest.mark.anyio
+    async def test_stats_report_job_classes(self, async_client, auth_headers):
+        await dispatcher.run("thi", AsyncMock())
+
+        response = await async_client.get("/api/v1/scheduler/stats/", headers=auth_headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["running"] is False
+        assert data["job_classes"]["thi"]["completed"] >= 1
+        assert data["job_classes"]["thi"]["queued"] == 0
+        assert data["parcel_runs"] == 0
+        assert data["outbox"]["pending"] == 0
+
+    @pytest.mark.anyio
+    async def test_stats_require_authentication(self, async_client):
+        response = await async_client.get("/api/v1/scheduler/stats/")
+        assert response.status_code == 403
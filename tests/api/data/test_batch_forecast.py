@@ -0,0 +1,189 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+from src.core import config
+from src.models.point import Point
+from src.models.prediction import Prediction
+from src.models.spray import SprayForecast
+from src.models.uav import FlyStatus
+from src.models.weather_data import WeatherData
+from src.services.batch_forecast import grid_center
+
+
+def owm_forecast(steps=4):
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(hours=3)
+    entries = []
+    for i in range(steps):
+        ts = start + timedelta(hours=3 * i)
+        entries.append({
+            "dt": int(ts.timestamp()),
+            "dt_txt": ts.strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {"temp": 20.0 + i, "humidity": 60},
+            "wind": {"speed": 2.0, "deg": 180},
+            "pop": 0.1,
+        })
+    return {"list": entries}
+
+
+class OpenWeatherMapStub:
+    """
+    OpenWeatherMap answering every url with the same forecast, failing for the given latitudes.
+    """
+
+    def __init__(self, failing_lats=(), delay=0.0):
+        self.failing_lats = set(failing_lats)
+        self.delay = delay
+        self.urls = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, url):
+        self.urls.append(url)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if any(f"lat={lat}&" in url for lat in self.failing_lats):
+                raise RuntimeError("OpenWeatherMap unavailable")
+            if "/weather?" in url:
+                return {"main": {"temp": 25.0, "humidity": 50}}
+            return owm_forecast()
+        finally:
+            self.in_flight -= 1
+
+
+class TestBatchForecastRoute:
+    """
+    Tests for the /api/data/batch/ route resolving many points per grid cell.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def real_dao(self, app, openweathermap_srv):
+        openweathermap_srv.setup_dao(app.dao)
+        yield
+        for model in (Point, Prediction, WeatherData, SprayForecast):
+            await model.find_all().delete()
+
+    @staticmethod
+    async def post(async_client, auth_headers, body, stub):
+        with patch("src.external_services.openweathermap.utils.http_get", new=stub):
+            return await async_client.post("/api/data/batch/", json=body, headers=auth_headers)
+
+    def test_grid_center(self):
+        assert grid_center(38.2512, 21.7433, 0.1) == (38.25, 21.75)
+        assert grid_center(38.2999, 21.7001, 0.1) == (38.25, 21.75)
+        assert grid_center(-0.01, -0.01, 0.1) == (-0.05, -0.05)
+
+    @pytest.mark.anyio
+    async def test_points_of_a_cell_share_one_fetch(self, async_client, auth_headers):
+        stub = OpenWeatherMapStub()
+        points = [
+            {"lat": 38.251, "lon": 21.741, "id": "parcel-1"},
+            {"lat": 38.262, "lon": 21.752, "id": "parcel-2"},
+            {"lat": 38.299, "lon": 21.799},
+            {"lat": 39.501, "lon": 22.001, "id": "parcel-4"},
+        ]
+
+        response = await self.post(async_client, auth_headers, {"product": "forecast", "points": points}, stub)
+
+        assert response.status_code == 200
+        body = response.json()
+        assert len(stub.urls) == 2
+        assert body["cells"] == 2 and body["cache_hits"] == 0 and body["failed"] == 0
+        assert set(body["results"]) == {"parcel-1", "parcel-2", "38.299,21.799", "parcel-4"}
+        first = body["results"]["parcel-1"]
+        assert first["grid"] == {"lat": 38.25, "lon": 21.75}
+        assert first["source"] == "openweathermap"
+        assert first["data"] == body["results"]["parcel-2"]["data"]
+        # Four forecast steps with temperature, humidity, wind speed and direction and precipitation
+        assert len(first["data"]) == 20
+        assert "created_at" not in first["data"][0]
+
+    @pytest.mark.anyio
+    async def test_cache_hits_are_read_with_one_query(self, async_client, auth_headers):
+        points = [{"lat": 38.25 + i, "lon": 21.75} for i in range(5)]
+        body = {"product": "forecast", "points": points}
+        await self.post(async_client, auth_headers, body, OpenWeatherMapStub())
+
+        stub = OpenWeatherMapStub()
+        with patch.object(Prediction, "find", wraps=Prediction.find) as find:
+            response = await self.post(async_client, auth_headers, body, stub)
+
+        assert response.json()["cache_hits"] == 5
+        assert {r["source"] for r in response.json()["results"].values()} == {"cache"}
+        assert stub.urls == []
+        assert find.call_count == 1
+
+    @pytest.mark.anyio
+    async def test_failing_cell_only_fails_its_points(self, async_client, auth_headers):
+        stub = OpenWeatherMapStub(failing_lats=[39.55])
+        points = [{"lat": 38.25, "lon": 21.75, "id": "ok"}, {"lat": 39.55, "lon": 21.75, "id": "failing"}]
+
+        response = await self.post(async_client, auth_headers, {"product": "thi", "points": points}, stub)
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["failed"] == 1
+        assert body["results"]["ok"]["data"]["thi"] > 0
+        assert body["results"]["ok"]["error"] is None
+        assert body["results"]["failing"]["data"] is None
+        assert "unavailable" in body["results"]["failing"]["error"]
+
+    @pytest.mark.anyio
+    async def test_spray_forecasts_are_cached(self, async_client, auth_headers):
+        body = {"product": "spray", "points": [{"lat": 38.25, "lon": 21.75}, {"lat": 38.35, "lon": 21.75}]}
+        first = await self.post(async_client, auth_headers, body, OpenWeatherMapStub())
+        second = await self.post(async_client, auth_headers, body, OpenWeatherMapStub())
+
+        assert first.json()["cache_hits"] == 0
+        assert second.json()["cache_hits"] == 2
+        for key, result in first.json()["results"].items():
+            cached = second.json()["results"][key]
+            assert cached["source"] == "cache"
+            assert [f["spray_conditions"] for f in cached["data"]] == [f["spray_conditions"] for f in result["data"]]
+
+    @pytest.mark.anyio
+    async def test_flight_cells_need_every_model_cached(self, async_client, auth_headers, mock_uav):
+        await mock_uav.insert()
+        body = {"product": "flight", "points": [{"lat": 38.25, "lon": 21.75}], "uavmodels": ["DJI"]}
+        try:
+            first = await self.post(async_client, auth_headers, body, OpenWeatherMapStub())
+            second = await self.post(async_client, auth_headers, body, OpenWeatherMapStub())
+            unknown = await self.post(
+                async_client, auth_headers, {**body, "uavmodels": ["DJI", "Unknown"]}, OpenWeatherMapStub()
+            )
+        finally:
+            await FlyStatus.find_all().delete()
+            await mock_uav.delete()
+
+        assert first.json()["cache_hits"] == 0
+        assert {s["uav_model"] for s in first.json()["results"]["38.25,21.75"]["data"]} == {"DJI"}
+        assert second.json()["cache_hits"] == 1
+        assert unknown.json()["cache_hits"] == 0
+        assert "Unknown" in unknown.json()["results"]["38.25,21.75"]["error"]
+
+    @pytest.mark.anyio
+    async def test_fetches_are_bounded(self, async_client, auth_headers):
+        stub = OpenWeatherMapStub(delay=0.01)
+        points = [{"lat": 30.05 + i, "lon": 20.05} for i in range(10)]
+
+        with patch.object(config, "BATCH_CONCURRENCY", 3):
+            response = await self.post(async_client, auth_headers, {"product": "forecast", "points": points}, stub)
+
+        assert response.json()["failed"] == 0
+        assert len(stub.urls) == 10
+        assert stub.peak == 3
+
+    @pytest.mark.anyio
+    async def test_rejects_too_many_points(self, async_client, auth_headers):
+        points = [{"lat": 38.25, "lon": 21.75}] * (config.BATCH_MAX_POINTS + 1)
+        response = await async_client.post("/api/data/batch/", json={"points": points}, headers=auth_headers)
+        assert response.status_code == 422
+
+    @pytest.mark.anyio
+    async def test_requires_authentication(self, async_client):
+        response = await async_client.post("/api/data/batch/", json={"points": [{"lat": 38.25, "lon": 21.75}]})
+        assert response.status_code == 403
@@ -0,0 +1,156 @@
+import gzip
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+import brotli
+import httpx
+import pytest
+import zstandard
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from src.api import compression
+from src.api.compression import CompressedCache, CompressionMiddleware, compressed_cache, negotiate_encoding
+
+
+BASE_PARAMS = {"lat": 40.7128, "lon": -74.0060}
+
+
+def linked_data(entries=200):
+    return {
+        "@context": {"@vocab": "https://w3id.org/ocsm/main-context.jsonld"},
+        "@graph": [
+            {
+                "@id": f"urn:openagri:weather:forecast:{i}",
+                "@type": "WeatherForecast",
+                "observedProperty": "urn:openagri:airTemperature",
+                "hasResult": {"numericValue": 20 + i % 7, "unit": "http://qudt.org/vocab/unit/DEG_C"},
+            }
+            for i in range(entries)
+        ],
+    }
+
+
+class TestCompression:
+    """
+    Tests for negotiated compression of the API responses.
+    """
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        compressed_cache.clear()
+        yield
+        compressed_cache.clear()
+
+    def test_negotiate_encoding(self):
+        assert negotiate_encoding("gzip, deflate, br, zstd") == "zstd"
+        assert negotiate_encoding("gzip;q=0.5, br") == "br"
+        assert negotiate_encoding("br;q=0, gzip") == "gzip"
+        assert negotiate_encoding("*") == "zstd"
+        assert negotiate_encoding("*, zstd;q=0") == "br"
+        assert negotiate_encoding("identity") is None
+        assert negotiate_encoding(None) is None
+
+    def test_compressed_cache_is_bounded(self):
+        cache = CompressedCache(size=2)
+        cache.put('"a"', "gzip", b"a")
+        cache.put('"b"', "gzip", b"b")
+        assert cache.get('"a"', "gzip") == b"a"
+        cache.put('"c"', "gzip", b"c")
+        assert cache.get('"b"', "gzip") is None
+        assert len(cache) == 2
+
+    @pytest.mark.anyio
+    @pytest.mark.parametrize("encoding, decompress", [
+        ("gzip", gzip.decompress),
+        ("br", brotli.decompress),
+        ("zstd", lambda body: zstandard.ZstdDecompressor().decompress(body)),
+    ])
+    async def test_large_linked_data_is_compressed(
+        self, app, openweathermap_srv, auth_headers, encoding, decompress
+    ):
+        openweathermap_srv.get_weather_forecast5days_ld = AsyncMock(return_value=linked_data())
+
+        # Raw transport so the body is checked as it was sent
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            request = client.build_request(
+                "GET", "/api/linkeddata/forecast5/", params=BASE_PARAMS,
+                headers={**auth_headers, "Accept-Encoding": encoding}
+            )
+            response = await client.send(request, stream=True)
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == encoding
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert int(response.headers["content-length"]) == len(body)
+        assert json.loads(decompress(body)) == linked_data()
+        assert len(body) < len(json.dumps(linked_data())) / 5
+        assert response.headers["etag"].startswith('W/"')
+
+    @pytest.mark.anyio
+    async def test_small_response_is_not_compressed(self, async_client, openweathermap_srv, auth_headers):
+        openweathermap_srv.get_weather_forecast5days_ld = AsyncMock(return_value=linked_data(entries=1))
+
+        response = await async_client.get(
+            "/api/linkeddata/forecast5/", params=BASE_PARAMS, headers={**auth_headers, "Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == linked_data(entries=1)
+
+    @pytest.mark.anyio
+    async def test_weak_etag_of_compressed_response_is_not_modified(
+        self, async_client, openweathermap_srv, auth_headers
+    ):
+        openweathermap_srv.get_weather_forecast5days_ld = AsyncMock(return_value=linked_data())
+        headers = {**auth_headers, "Accept-Encoding": "gzip"}
+
+        first = await async_client.get("/api/linkeddata/forecast5/", params=BASE_PARAMS, headers=headers)
+        second = await async_client.get(
+            "/api/linkeddata/forecast5/", params=BASE_PARAMS,
+            headers={**headers, "If-None-Match": first.headers["etag"]}
+        )
+        assert second.status_code == 304
+        assert second.content == b""
+        assert "content-encoding" not in second.headers
+
+    @pytest.mark.anyio
+    async def test_hot_response_is_compressed_once(self, async_client, openweathermap_srv, auth_headers):
+        openweathermap_srv.get_weather_forecast5days_ld = AsyncMock(return_value=linked_data())
+        encode = Mock(side_effect=compression.ENCODERS["gzip"][0])
+        headers = {**auth_headers, "Accept-Encoding": "gzip"}
+
+        with patch.dict(compression.ENCODERS, {"gzip": (encode, compression.ENCODERS["gzip"][1])}):
+            first = await async_client.get("/api/linkeddata/forecast5/", params=BASE_PARAMS, headers=headers)
+            second = await async_client.get("/api/linkeddata/forecast5/", params=BASE_PARAMS, headers=headers)
+
+        assert encode.call_count == 1
+        assert first.json() == second.json() == linked_data()
+        assert len(compressed_cache) == 1
+
+    @pytest.mark.anyio
+    async def test_streamed_response_is_compressed_on_the_fly(self):
+        rows = [json.dumps({"timestamp": i, "temperature_2m": 20.5}).encode() + b"\n" for i in range(500)]
+
+        async def lines():
+            for row in rows:
+                yield row
+
+        streaming_app = FastAPI()
+        streaming_app.add_middleware(CompressionMiddleware)
+
+        @streaming_app.get("/rows")
+        async def get_rows():
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=streaming_app), base_url="http://test"
+        ) as client:
+            response = await client.get("/rows", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.content == b"".join(rows)
+
@@ -0,0 +1,108 @@
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.api.caching import etag_matches, make_etag, remaining_ttl
+from src.core import config
+from src.models.point import GeoJSON
+from src.models.spray import SprayForecast
+
+
+BASE_PARAMS = {"lat": 40.7128, "lon": -74.0060}
+
+
+def thi_data(thi=72.5):
+    return {
+        "id": "bad6cd67-638f-42d8-82b8-d4d191174dd6",
+        "spatial_entity": {"location": {"type": "Point", "coordinates": [40.7128, -74.0060]}},
+        "thi": thi,
+    }
+
+
+class TestConditionalCaching:
+    """
+    Tests for ETag, Cache-Control and 304 handling of the data endpoints.
+    """
+
+    def test_etag_matching(self):
+        etag = make_etag(b"body")
+        assert etag.startswith('"') and etag.endswith('"')
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('"other"', etag)
+        assert not etag_matches(None, etag)
+
+    def test_remaining_ttl(self):
+        now = datetime.now()
+        assert remaining_ttl([now - timedelta(minutes=30), now], timedelta(hours=1)) in (1799, 1800)
+        assert remaining_ttl([now - timedelta(hours=2)], timedelta(hours=1)) == 0
+        assert remaining_ttl([], timedelta(hours=1)) is None
+
+    @pytest.mark.anyio
+    async def test_unchanged_response_is_not_modified(self, async_client, openweathermap_srv, auth_headers):
+        openweathermap_srv.get_thi = AsyncMock(return_value=thi_data())
+
+        first = await async_client.get("/api/data/thi/", params=BASE_PARAMS, headers=auth_headers)
+        etag = first.headers["etag"]
+        assert first.status_code == 200
+        assert first.headers["cache-control"] == f"private, max-age={config.HTTP_CACHE_MAX_AGE_SECONDS}"
+
+        second = await async_client.get(
+            "/api/data/thi/", params=BASE_PARAMS, headers={**auth_headers, "If-None-Match": etag}
+        )
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["etag"] == etag
+        assert "content-type" not in second.headers
+
+        openweathermap_srv.get_thi = AsyncMock(return_value=thi_data(thi=80.0))
+        changed = await async_client.get(
+            "/api/data/thi/", params=BASE_PARAMS, headers={**auth_headers, "If-None-Match": etag}
+        )
+        assert changed.status_code == 200
+        assert changed.json()["thi"] == 80.0
+        assert changed.headers["etag"] != etag
+
+    @pytest.mark.anyio
+    async def test_linked_data_is_not_modified(self, async_client, openweathermap_srv, auth_headers):
+        openweathermap_srv.get_weather_forecast5days_ld = AsyncMock(return_value={"@context": {}, "@graph": []})
+
+        first = await async_client.get("/api/linkeddata/forecast5/", params=BASE_PARAMS, headers=auth_headers)
+        second = await async_client.get(
+            "/api/linkeddata/forecast5/", params=BASE_PARAMS,
+            headers={**auth_headers, "If-None-Match": first.headers["etag"]}
+        )
+        assert second.status_code == 304
+
+    @pytest.mark.anyio
+    async def test_max_age_follows_cached_forecast(self, async_client, openweathermap_srv, auth_headers):
+        forecast = SprayForecast(
+            created_at=datetime.now() - timedelta(minutes=45),
+            timestamp=datetime.now() + timedelta(hours=3),
+            source="OpenWeatherMap",
+            location=GeoJSON(id=uuid.uuid4(), type="Point", coordinates=[40.7128, -74.0060]),
+            spray_conditions="optimal",
+            detailed_status={},
+        )
+        openweathermap_srv.get_spray_forecast = AsyncMock(return_value=[forecast])
+
+        with patch.object(config, "CURRENT_WEATHER_DATA_CACHE_TIME", 1):
+            response = await async_client.get("/api/data/spray-forecast/", params=BASE_PARAMS, headers=auth_headers)
+
+        assert response.status_code == 200
+        max_age = int(response.headers["cache-control"].split("max-age=")[1])
+        assert 890 <= max_age <= 900
+
+    @pytest.mark.anyio
+    async def test_errors_and_other_routes_are_left_alone(self, async_client, openweathermap_srv, auth_headers):
+        openweathermap_srv.get_thi = AsyncMock(side_effect=Exception("service error"))
+        failed = await async_client.get("/api/data/thi/", params=BASE_PARAMS, headers=auth_headers)
+        assert failed.status_code == 500
+        assert "etag" not in failed.headers
+
+        other = await async_client.get("/api/v1/scheduler/stats/", headers=auth_headers)
+        assert other.status_code == 200
+        assert "etag" not in other.headers
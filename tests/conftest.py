@@ -10,6 +10,7 @@ from unittest.mock import AsyncMock
 import jwt
 from beanie import Document, init_beanie
 from httpx import AsyncClient
+from mongomock import filtering
 from mongomock_motor import AsyncMongoMockClient
 
 import src.utils as utils
@@ -17,12 +18,39 @@ from src.api.api import data_router
 from src.api.api_v1.api import api_router
 from src.core import config
 from src.core.dao import Dao
+from src.core.spatial_index import EARTH_RADIUS_M, haversine_m
 from src.external_services.openweathermap import OpenWeatherMap
 from src.main import create_app
 from src.models.uav import UAVModel
 from src.schemas.uav import (FlightForecastListResponse,
                              FlightStatusForecastResponse)
 
+# mongomock's $in only compares the elements of an array field, MongoDB also
+# compares the whole array, as in {"location.coordinates": {"$in": [[lon, lat]]}}
+_mongomock_in = filtering._filterer_inst._operator_map["$in"]
+
+
+def _in_matching_arrays(doc_val, search_val):
+    return (isinstance(doc_val, list) and doc_val in search_val) or _mongomock_in(doc_val, search_val)
+
+
+filtering._filterer_inst._operator_map["$in"] = _in_matching_arrays
+filtering._filterer_inst._operator_map["$nin"] = lambda doc_val, search_val: not _in_matching_arrays(
+    doc_val, search_val
+)
+
+
+# $geoWithin with $centerSphere on GeoJSON points, which mongomock does not implement
+def _geo_within(doc_val, search_val):
+    (lon, lat), radians = search_val["$centerSphere"]
+    if not isinstance(doc_val, dict) or doc_val.get("type") != "Point":
+        return False
+    doc_lon, doc_lat = doc_val["coordinates"]
+    return haversine_m(lat, lon, doc_lat, doc_lon) <= radians * EARTH_RADIUS_M
+
+
+filtering._filterer_inst._operator_map["$geoWithin"] = _geo_within
+
 # Configure pytest-asyncio
 @pytest.fixture
 def anyio_backend():
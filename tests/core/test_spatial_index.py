@@ -0,0 +1,117 @@
+import random
+
+import pytest
+
+from src.core import dao
+from src.models.history_data import CachedLocation
+from src.core.spatial_index import SpatialIndex, haversine_m, location_index
+
+
+def brute_force(points, lat, lon, radius_m):
+    found = [(haversine_m(lat, lon, plat, plon), pid) for pid, (plat, plon) in points.items()]
+    return sorted(f for f in found if f[0] <= radius_m)
+
+
+def random_points(n, seed=42):
+    rng = random.Random(seed)
+    return {str(i): (rng.uniform(-89.9, 89.9), rng.uniform(-180, 180)) for i in range(n)}
+
+
+class TestSpatialIndex:
+    """
+    Tests for the grid index of cached locations.
+    """
+
+    def test_nearest_within_radius(self):
+        index = SpatialIndex(cell_degrees=0.1)
+        index.add("a", 38.25, 21.74)
+        index.add("b", 38.30, 21.74)
+
+        assert index.nearest(38.26, 21.74, 10_000) == "a"
+        assert index.nearest(38.29, 21.74, 10_000) == "b"
+        assert index.nearest(39.0, 21.74, 10_000) is None
+
+    def test_remove_and_re_add(self):
+        index = SpatialIndex(cell_degrees=0.1)
+        index.add("a", 38.25, 21.74)
+        index.add("a", 10.0, 10.0)
+        assert len(index) == 1
+        assert index.nearest(38.25, 21.74, 1000) is None
+
+        index.remove("a")
+        index.remove("missing")
+        assert len(index) == 0
+        assert "a" not in index
+
+    def test_radius_across_antimeridian_and_pole(self):
+        index = SpatialIndex(cell_degrees=0.1)
+        index.add("east", 0.0, 179.99)
+        index.add("north", 89.99, 45.0)
+
+        assert index.nearest(0.0, -179.99, 5_000) == "east"
+        assert index.nearest(89.99, -135.0, 5_000) == "north"
+
+    def test_matches_brute_force(self):
+        points = random_points(2_000)
+        index = SpatialIndex(cell_degrees=1.0)
+        for pid, (lat, lon) in points.items():
+            index.add(pid, lat, lon)
+
+        rng = random.Random(1)
+        for _ in range(50):
+            lat, lon = rng.uniform(-89, 89), rng.uniform(-180, 180)
+            assert index.within(lat, lon, 500_000) == brute_force(points, lat, lon, 500_000)
+
+
+def cached_location(lat, lon):
+    return CachedLocation(name=f"{lat},{lon}", location={"type": "Point", "coordinates": [lon, lat]})
+
+
+class TestSpatialIndexStore:
+    """
+    Tests for keeping the index in step with locations cached by other processes.
+    """
+
+    @pytest.fixture(autouse=True)
+    def clear_index(self):
+        location_index.clear()
+        yield
+        location_index.clear()
+
+    @pytest.mark.anyio
+    async def test_rebuild_replaces_entries(self, app):
+        kept = await cached_location(38.25, 21.74).insert()
+        index = SpatialIndex(cell_degrees=0.1)
+        index.add("deleted-elsewhere", 38.30, 21.74)
+
+        await index.rebuild()
+
+        assert str(kept.id) in index
+        assert "deleted-elsewhere" not in index
+        assert index.nearest(38.30, 21.74, 1000) is None
+
+    @pytest.mark.anyio
+    async def test_nearest_stored_finds_and_indexes_other_locations(self, app):
+        index = SpatialIndex(cell_degrees=0.1)
+        await index.rebuild()
+        # Created by other processes after the rebuild
+        near = await cached_location(40.001, 22.0).insert()
+        farther = await cached_location(40.004, 22.0).insert()
+        await cached_location(41.0, 22.0).insert()
+
+        assert await index.nearest_stored(40.0, 22.0, 1000) == str(near.id)
+        assert index.nearest(40.0, 22.0, 1000) == str(near.id)
+        assert str(farther.id) in index
+        assert len(index) == 2
+        assert await index.nearest_stored(45.0, 22.0, 1000) is None
+
+    @pytest.mark.anyio
+    async def test_find_location_nearby_queries_mongodb_on_miss(self, app):
+        other = await cached_location(40.0, 22.0).insert()
+
+        found = await dao.find_location_nearby(40.001, 22.0, 1000)
+
+        assert found.id == other.id
+        assert str(other.id) in location_index
+        assert await dao.find_location_nearby(45.0, 22.0, 1000) is None
+
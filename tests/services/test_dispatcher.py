@@ -0,0 +1,219 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src import scheduler as scheduler_module
+from src.models.scheduler import ParcelSchedule
+from src.services.dispatcher import STAGGER_ANCHOR, Dispatcher, stagger_offset, staggered_start
+from src.services.time_wheel import TimeWheel
+
+
+class TestStagger:
+    """
+    Tests for the deterministic per-job phase of interval jobs.
+    """
+
+    def test_offset_is_deterministic_and_within_interval(self):
+        interval = timedelta(hours=8)
+        offset = stagger_offset("thi_task_38.25_21.74", interval)
+        assert offset == stagger_offset("thi_task_38.25_21.74", interval)
+        assert timedelta(0) <= offset < interval
+        assert staggered_start("thi_task_38.25_21.74", interval) == STAGGER_ANCHOR + offset
+
+    def test_offsets_are_spread_over_interval(self):
+        interval = timedelta(hours=8)
+        hours = [stagger_offset(f"thi_task_{i}", interval) // timedelta(hours=1) for i in range(800)]
+        # Roughly 100 jobs start in each hour of the interval
+        assert all(60 < hours.count(h) < 140 for h in range(8))
+
+
+class TestDispatcher:
+    """
+    Tests for the per job class concurrency limit and its stats.
+    """
+
+    @pytest.mark.anyio
+    async def test_concurrency_is_capped_per_class(self):
+        dispatcher = Dispatcher(max_concurrency=2)
+        running, peak = 0, 0
+        release = asyncio.Event()
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+
+        tasks = [asyncio.create_task(dispatcher.run("thi", job)) for _ in range(5)]
+        other = asyncio.create_task(dispatcher.run("spray", job))
+        await asyncio.sleep(0)
+
+        stats = dispatcher.stats()
+        assert stats["thi"]["running"] == 2
+        assert stats["thi"]["queued"] == 3
+        assert stats["spray"]["running"] == 1
+
+        release.set()
+        await asyncio.gather(*tasks, other)
+        stats = dispatcher.stats()
+        assert peak == 3
+        assert stats["thi"]["completed"] == 5
+        assert stats["thi"]["queued"] == stats["thi"]["running"] == 0
+        assert stats["thi"]["max_lag_s"] >= 0
+
+    @pytest.mark.anyio
+    async def test_failures_are_counted_and_raised(self):
+        dispatcher = Dispatcher(max_concurrency=1)
+
+        with pytest.raises(RuntimeError):
+            await dispatcher.run("thi", AsyncMock(side_effect=RuntimeError("Farm Calendar down")))
+
+        assert dispatcher.stats()["thi"]["failed"] == 1
+        # The slot is released after a failure
+        await asyncio.wait_for(dispatcher.run("thi", AsyncMock()), timeout=1)
+
+
+class TestScheduleTasks:
+    """
+    Tests for the registration and batched runs of the per-parcel pushes.
+    """
+
+    @staticmethod
+    def _app(locations, uavmodels=()):
+        fc_client = SimpleNamespace(
+            fetch_locations=AsyncMock(return_value=locations),
+            send_thi=AsyncMock(),
+            send_flight_forecast=AsyncMock(),
+            send_spray_forecast=AsyncMock(),
+        )
+        return SimpleNamespace(state=SimpleNamespace(fc_client=fc_client, uavmodels=list(uavmodels)))
+
+    @pytest.fixture(autouse=True)
+    async def clean_wheel(self, app):
+        yield
+        scheduler_module.parcel_wheel.clear()
+        scheduler_module.scheduler.remove_all_jobs()
+        await ParcelSchedule.find_all().delete()
+
+    @pytest.mark.anyio
+    async def test_parcel_runs_are_staggered(self):
+        locations = [
+            {"lat": 38.0 + i / 100, "lon": 21.0, "farm_name": "Farm", "identifier": f"parcel-{i}"}
+            for i in range(50)
+        ]
+        app = self._app(locations)
+
+        with patch.object(scheduler_module.config, "PUSH_THI_TO_FARMCALENDAR", "true"):
+            await scheduler_module.schedule_tasks(app)
+
+        now = datetime.now(timezone.utc)
+        next_runs = [entry.next_run for entry in scheduler_module.parcel_wheel.entries()]
+        assert len(next_runs) == 50
+        assert all(now <= run < now + timedelta(hours=8) for run in next_runs)
+        # Not all parcels fire at the same time
+        assert len({run.replace(minute=0, second=0, microsecond=0) for run in next_runs}) > 4
+        # A single scheduler job drives all of them, next to the history crons
+        job_ids = {job.id for job in scheduler_module.scheduler.get_jobs()}
+        assert job_ids == {"parcel_wheel_tick", "update_sliding_windows", "repair_history_gaps"}
+
+    @pytest.mark.anyio
+    async def test_due_parcels_run_in_grid_cell_batches(self):
+        locations = [
+            {"lat": 38.01, "lon": 21.01, "farm_name": "Farm", "identifier": "a"},
+            {"lat": 38.02, "lon": 21.02, "farm_name": "Farm", "identifier": "b"},
+            {"lat": 39.5, "lon": 22.5, "farm_name": "Farm", "identifier": "c"},
+        ]
+        app = self._app(locations, uavmodels=["DJI"])
+        with patch.object(scheduler_module.config, "PUSH_THI_TO_FARMCALENDAR", "true"), \
+                patch.object(scheduler_module.config, "PUSH_FLIGHT_FORECAST_TO_FARMCALENDAR", "true"):
+            await scheduler_module.schedule_tasks(app)
+
+        later = datetime.now(timezone.utc) + timedelta(days=5)
+        with patch.object(scheduler_module.dispatcher, "run", wraps=scheduler_module.dispatcher.run) as run:
+            tasks = await scheduler_module.run_due_parcels(app, now=later)
+            await asyncio.gather(*tasks)
+
+        # Two cells and two kinds, four batches for six pushes
+        assert run.call_count == 4
+        batches = sorted((call.args[3], len(call.args[4])) for call in run.call_args_list)
+        assert batches == [("flight_forecast", 1), ("flight_forecast", 2), ("thi", 1), ("thi", 2)]
+        assert app.state.fc_client.send_thi.await_count == 3
+        app.state.fc_client.send_flight_forecast.assert_any_await(locations[2], ["DJI"])
+
+        # Nothing is due again right after
+        assert await scheduler_module.run_due_parcels(app, now=later) == []
+
+    @pytest.mark.anyio
+    async def test_failing_parcel_does_not_stop_its_batch(self):
+        locations = [
+            {"lat": 38.01, "lon": 21.01, "farm_name": "Farm", "identifier": "a"},
+            {"lat": 38.02, "lon": 21.02, "farm_name": "Farm", "identifier": "b"},
+        ]
+        app = self._app(locations)
+        app.state.fc_client.send_thi.side_effect = [RuntimeError("Farm Calendar down"), None]
+
+        with pytest.raises(RuntimeError, match="1 of 2 thi posts failed"):
+            await scheduler_module.post_parcel_batch(app, "thi", locations)
+
+        assert app.state.fc_client.send_thi.await_count == 2
+
+
+class TestReconcileParcels:
+    """
+    Tests for the diff-based rescheduling of parcel pushes in the time wheel.
+    """
+
+    @staticmethod
+    def _parcels(n):
+        return [
+            {"lat": round(30 + i / 1000, 3), "lon": 21.0, "farm_name": "Farm", "identifier": f"parcel-{i}"}
+            for i in range(n)
+        ]
+
+    @pytest.mark.anyio
+    async def test_reconcile_10k_parcels(self):
+        wheel = TimeWheel()
+        parcels = self._parcels(10_000)
+
+        with patch.object(scheduler_module.config, "PUSH_THI_TO_FARMCALENDAR", "true"), \
+                patch.object(scheduler_module.config, "PUSH_SPRAY_F_TO_FARMCALENDAR", "true"):
+            report = wheel.reconcile(scheduler_module.desired_parcel_jobs(parcels))
+            assert report == {"added": 20_000, "removed": 0, "updated": 0, "unchanged": 0}
+            next_runs = {entry.key: entry.next_run for entry in wheel.entries()}
+
+            # A refresh with the same parcels, fetched again, changes nothing
+            report = wheel.reconcile(scheduler_module.desired_parcel_jobs(self._parcels(10_000)))
+            assert report == {"added": 0, "removed": 0, "updated": 0, "unchanged": 20_000}
+            assert {entry.key: entry.next_run for entry in wheel.entries()} == next_runs
+
+            # One parcel renamed, one removed and one added
+            parcels = self._parcels(10_001)[1:]
+            parcels[0] = {**parcels[0], "farm_name": "Renamed farm"}
+            report = wheel.reconcile(scheduler_module.desired_parcel_jobs(parcels))
+            renamed = wheel.get(f"thi_task_{parcels[0]['lat']}_21.0")
+            assert renamed.payload["farm_name"] == "Renamed farm"
+            assert renamed.next_run == next_runs[renamed.key]
+
+            # One tick only handles the parcels that are due
+            due = wheel.pop_due(datetime.now(timezone.utc) + timedelta(minutes=1))
+
+        assert report == {"added": 2, "removed": 2, "updated": 2, "unchanged": 19_996}
+        assert len(wheel) == 20_000
+        assert len(due) < 200
+
+    @pytest.mark.anyio
+    async def test_interval_change_reschedules(self):
+        wheel = TimeWheel()
+        with patch.object(scheduler_module.config, "PUSH_THI_TO_FARMCALENDAR", "true"):
+            wheel.reconcile(scheduler_module.desired_parcel_jobs(self._parcels(1)))
+            with patch.object(scheduler_module.config, "INTERVAL_THI_TO_FARMCALENDAR", 4):
+                report = wheel.reconcile(scheduler_module.desired_parcel_jobs(self._parcels(1)))
+
+        assert report["updated"] == 1
+        entry = wheel.get("thi_task_30.0_21.0")
+        assert entry.interval == timedelta(hours=4)
+        assert entry.next_run < datetime.now(timezone.utc) + timedelta(hours=4)
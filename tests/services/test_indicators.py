@@ -0,0 +1,171 @@
+import pytest
+from datetime import date, datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+
+from src.models.history_data import CachedLocation, DailyHistory, DailyObservation
+from src.schemas.history_data import DailyObservationOut, HourlyObservationOut
+from src.services import indicators
+
+GEO = {"type": "Point", "coordinates": [21.74, 38.25]}
+START = date(2024, 3, 1)
+
+
+def daily(day, tmin, tmax):
+    return {"date": day, "values": {"temperature_2m_min": tmin, "temperature_2m_max": tmax}}
+
+
+class TestIndicatorFunctions:
+    """
+    Tests for the vectorized per-day indicator computations.
+    """
+
+    def test_growing_degree_days_are_clipped(self):
+        inputs = {
+            "temperature_2m_min": np.array([5.0, 12.0, 20.0]),
+            "temperature_2m_max": np.array([15.0, 20.0, 40.0]),
+        }
+        values = indicators.INDICATORS["gdd"]["compute"](inputs, base=10.0, cap=30.0)
+        assert values.tolist() == [2.5, 6.0, 15.0]
+
+    def test_chill_hours_count_hours_in_range(self):
+        t = np.full((2, 24), np.nan)
+        t[0, :10] = 5.0
+        t[0, 10:] = 12.0
+        values = indicators.INDICATORS["chill_hours"]["compute"]({"temperature_2m": t}, low=0.0, high=7.2)
+        assert values[0] == 10
+        assert np.isnan(values[1])
+
+    def test_unknown_params_are_rejected(self):
+        with pytest.raises(ValueError):
+            indicators.resolve_params("gdd", {"base": 5.0, "threshold": 1.0})
+
+
+class TestIndicatorEngine:
+    """
+    Tests for reading indicator inputs from the cache and the memo of per-day values.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        indicators.clear_memo()
+        yield
+        indicators.clear_memo()
+        await CachedLocation.find_all().delete()
+        await DailyHistory.find_all().delete()
+
+    async def _cache(self, days):
+        location = await CachedLocation(name="Farm", location=GEO).insert()
+        await DailyHistory(
+            location=GEO,
+            date_range={"start": days[0], "end": days[-1]},
+            observations=[DailyObservation(**daily(d, 10.0, 20.0)) for d in days],
+            fetched_at=datetime.now(),
+        ).insert()
+        return location
+
+    async def _compute(self, location, provider, end, **kwargs):
+        with patch("src.services.indicators.dao.find_location_nearby", new_callable=AsyncMock,
+                   return_value=location), \
+                patch("src.services.indicators.WeatherClientFactory.get_provider", return_value=provider):
+            return await indicators.compute_indicator("gdd", 38.25, 21.74, START, end, {}, **kwargs)
+
+    @pytest.mark.anyio
+    async def test_cached_history_needs_no_provider_call(self):
+        location = await self._cache([START + timedelta(days=i) for i in range(5)])
+        provider = AsyncMock()
+
+        result = await self._compute(location, provider, START + timedelta(days=4))
+
+        provider.get_daily_history.assert_not_called()
+        assert result.source == "cache"
+        assert [v.value for v in result.data] == [5.0] * 5
+        assert [v.cumulative for v in result.data] == [5.0, 10.0, 15.0, 20.0, 25.0]
+        assert result.total == 25.0
+
+    @pytest.mark.anyio
+    async def test_memo_is_extended_with_new_days_only(self):
+        location = await self._cache([START + timedelta(days=i) for i in range(5)])
+        provider = AsyncMock()
+        provider.get_daily_history.return_value = [
+            DailyObservationOut(**daily(START + timedelta(days=i), 10.0, 30.0)) for i in (5, 6)
+        ]
+
+        await self._compute(location, provider, START + timedelta(days=4))
+        # Cached days are served from the memo from now on
+        await DailyHistory.find_all().delete()
+        result = await self._compute(location, provider, START + timedelta(days=6))
+
+        provider.get_daily_history.assert_called_once_with(
+            38.25, 21.74, START + timedelta(days=5), START + timedelta(days=6),
+            indicators.INDICATORS["gdd"]["variables"]
+        )
+        assert [v.value for v in result.data] == [5.0] * 5 + [10.0, 10.0]
+
+        result = await self._compute(location, provider, START + timedelta(days=2))
+        assert provider.get_daily_history.call_count == 1
+        assert result.total == 15.0
+
+    @pytest.mark.anyio
+    async def test_memoized_days_without_data_are_retried(self):
+        days = [START + timedelta(days=i) for i in range(5)]
+        location = await self._cache([d for d in days if d != days[2]])
+        provider = AsyncMock()
+        provider.get_daily_history.return_value = []
+
+        result = await self._compute(location, provider, days[-1])
+        assert [v.value for v in result.data] == [5.0, 5.0, None, 5.0, 5.0]
+
+        # Gap repair caches the missing day
+        await DailyHistory(
+            location=GEO, date_range={"start": days[2], "end": days[2]},
+            observations=[DailyObservation(**daily(days[2], 10.0, 30.0))], fetched_at=datetime.now(),
+        ).insert()
+        result = await self._compute(location, provider, days[-1])
+
+        assert [v.value for v in result.data] == [5.0, 5.0, 10.0, 5.0, 5.0]
+        assert provider.get_daily_history.call_count == 1
+
+    @pytest.mark.anyio
+    async def test_forecast_extends_history(self):
+        today = date.today()
+        location = await self._cache([today - timedelta(days=i) for i in (2, 1)])
+        provider = AsyncMock()
+        provider.get_daily_forecast.return_value = [
+            DailyObservationOut(**daily(today + timedelta(days=i), 10.0, 14.0)) for i in range(2)
+        ]
+
+        with patch("src.services.indicators.dao.find_location_nearby", new_callable=AsyncMock,
+                   return_value=location), \
+                patch("src.services.indicators.WeatherClientFactory.get_provider", return_value=provider):
+            result = await indicators.compute_indicator(
+                "gdd", 38.25, 21.74, today - timedelta(days=2), today + timedelta(days=1), {}, forecast_days=2
+            )
+            clipped = await indicators.compute_indicator(
+                "gdd", 38.25, 21.74, today - timedelta(days=2), today, {}, forecast_days=2
+            )
+
+        assert [v.forecast for v in result.data] == [False, False, True, True]
+        assert [v.cumulative for v in result.data] == [5.0, 10.0, 12.0, 14.0]
+        # Forecast days past the requested end are left out
+        assert [v.date for v in clipped.data][-1] == today
+        assert clipped.total == 12.0
+
+    @pytest.mark.anyio
+    async def test_hourly_indicator_from_provider(self):
+        provider = AsyncMock()
+        provider.get_hourly_history.return_value = [
+            HourlyObservationOut(timestamp=datetime(2024, 1, 1, h), values={"temperature_2m": float(h)})
+            for h in range(24)
+        ]
+
+        with patch("src.services.indicators.dao.find_location_nearby", new_callable=AsyncMock,
+                   return_value=None), \
+                patch("src.services.indicators.WeatherClientFactory.get_provider", return_value=provider):
+            result = await indicators.compute_indicator(
+                "chill_hours", 38.25, 21.74, date(2024, 1, 1), date(2024, 1, 1), {}
+            )
+
+        assert result.source == "openmeteo"
+        assert result.data[0].value == 8.0
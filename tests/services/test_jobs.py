@@ -0,0 +1,198 @@
+import pytest
+from datetime import date, datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+from src.core import config
+from src.models.history_data import CachedLocation, DailyHistory, DailyObservation, \
+    HistoryRollup, HourlyHistory, HourlyObservation
+from src.schemas.history_data import DailyObservationOut, HourlyObservationOut
+from src.services.cache_loader import archive_end, initial_history_bounds
+from src.services.jobs import missing_days, repair_history_gaps, sliding_window_bounds, \
+    update_sliding_windows
+
+GEO = {"type": "Point", "coordinates": [-74.0060, 40.7128]}
+
+
+class TestSlidingWindow:
+    """
+    Tests for the nightly sliding window update of cached history.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        await CachedLocation.find_all().delete()
+        await DailyHistory.find_all().delete()
+        await HourlyHistory.find_all().delete()
+        await HistoryRollup.find_all().delete()
+
+    @pytest.fixture
+    def mock_provider(self):
+        _, yesterday = sliding_window_bounds(date.today())
+        provider = AsyncMock()
+        provider.get_daily_history_batch.return_value = [[
+            DailyObservationOut(date=yesterday, values={"rain_sum": 1.0})
+        ]]
+        provider.get_hourly_history_batch.return_value = [[
+            HourlyObservationOut(timestamp=datetime.combine(yesterday, datetime.min.time()), values={"rain": 1.0})
+        ]]
+        return provider
+
+    async def _insert_cached_window(self, skip=()):
+        oldest, yesterday = sliding_window_bounds(date.today())
+        # Cached window ends the day before yesterday
+        days = [oldest - timedelta(days=1) + timedelta(days=i) for i in range(config.HISTORY_WINDOW_DAYS)]
+        days = [d for d in days if d not in skip]
+        await CachedLocation(name="Farm", location=GEO).insert()
+        await DailyHistory(
+            location=GEO,
+            date_range={"start": days[0], "end": days[-1]},
+            observations=[DailyObservation(date=d, values={"rain_sum": 0.0}) for d in days],
+            fetched_at=datetime.now(),
+        ).insert()
+        for d in days:
+            await HourlyHistory(
+                location=GEO,
+                date=d,
+                observations=[HourlyObservation(timestamp=datetime.combine(d, datetime.min.time()), values={})],
+                fetched_at=datetime.now(),
+            ).insert()
+
+    async def _run(self, provider):
+        with patch("src.services.jobs.WeatherClientFactory.get_provider", return_value=provider):
+            await update_sliding_windows(config.OM_CACHE_VARIABLES)
+
+    @pytest.mark.anyio
+    async def test_window_moves_forward_by_one_day(self, mock_provider):
+        await self._insert_cached_window()
+        oldest, yesterday = sliding_window_bounds(date.today())
+
+        await self._run(mock_provider)
+
+        daily = await DailyHistory.find_one(DailyHistory.location == GEO)
+        dates = [obs.date for obs in daily.observations]
+        assert len(dates) == config.HISTORY_WINDOW_DAYS
+        assert dates[0] == oldest
+        assert dates[-1] == yesterday
+        assert daily.date_range == {"start": oldest, "end": yesterday}
+
+        hourly = await HourlyHistory.find(HourlyHistory.location == GEO).sort(+HourlyHistory.date).to_list()
+        assert len(hourly) == config.HISTORY_WINDOW_DAYS
+        assert hourly[0].date == oldest
+        assert hourly[-1].date == yesterday
+
+        rollup = await HistoryRollup.find_one(HistoryRollup.resolution == "daily")
+        assert rollup.period_start == yesterday
+        assert rollup.values["rain"]["sum"] == 1.0
+
+    @pytest.mark.anyio
+    async def test_rerun_does_not_duplicate_days(self, mock_provider):
+        await self._insert_cached_window()
+
+        await self._run(mock_provider)
+        await self._run(mock_provider)
+
+        daily = await DailyHistory.find_one(DailyHistory.location == GEO)
+        dates = [obs.date for obs in daily.observations]
+        assert len(dates) == len(set(dates)) == config.HISTORY_WINDOW_DAYS
+        assert await HourlyHistory.find(HourlyHistory.location == GEO).count() == config.HISTORY_WINDOW_DAYS
+
+
+class TestHistoryGapRepair:
+    """
+    Tests for detection and repair of holes in the sliding history window.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        await CachedLocation.find_all().delete()
+        await DailyHistory.find_all().delete()
+        await HourlyHistory.find_all().delete()
+        await HistoryRollup.find_all().delete()
+
+    @staticmethod
+    def _archive(coords, start, end, *args):
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        return days
+
+    @pytest.fixture
+    def mock_provider(self):
+        provider = AsyncMock()
+        provider.get_daily_history_batch.side_effect = lambda coords, start, end, variables: [
+            [DailyObservationOut(date=d, values={"rain_sum": 1.0}) for d in self._archive(coords, start, end)]
+            for _ in coords
+        ]
+        provider.get_hourly_history_batch.side_effect = lambda coords, start, end, variables: [
+            [
+                HourlyObservationOut(timestamp=datetime.combine(d, datetime.min.time()), values={"rain": 1.0})
+                for d in self._archive(coords, start, end)
+            ]
+            for _ in coords
+        ]
+        return provider
+
+    def test_missing_days(self):
+        present = [date(2024, 1, 1), date(2024, 1, 3)]
+        assert missing_days(present, date(2024, 1, 1), date(2024, 1, 4)) == [date(2024, 1, 2), date(2024, 1, 4)]
+
+    @pytest.mark.anyio
+    async def test_repair_fills_holes_of_all_locations(self, mock_provider):
+        oldest, _ = sliding_window_bounds(date.today())
+        end = archive_end(date.today())
+        hole = oldest + timedelta(days=10)
+        window = [oldest + timedelta(days=i) for i in range((end - oldest).days + 1)]
+        other = {"type": "Point", "coordinates": [21.0, 38.0]}
+
+        # First location misses one day, the second has no history at all
+        await CachedLocation(name="Farm", location=GEO).insert()
+        await CachedLocation(name="New", location=other).insert()
+        await DailyHistory(
+            location=GEO,
+            date_range={"start": oldest, "end": end},
+            observations=[DailyObservation(date=d, values={}) for d in window if d != hole],
+            fetched_at=datetime.now(),
+        ).insert()
+        for d in window:
+            if d != hole:
+                await HourlyHistory(location=GEO, date=d, observations=[], fetched_at=datetime.now()).insert()
+
+        with patch("src.services.jobs.WeatherClientFactory.get_provider", return_value=mock_provider):
+            report = await repair_history_gaps(config.OM_CACHE_VARIABLES)
+
+        assert report["window"]["end"] == end.isoformat()
+        assert report["locations_with_gaps"] == 2
+        assert report["daily_gaps_found"] == report["daily_gaps_filled"] == 1 + len(window)
+        assert report["hourly_gaps_found"] == report["hourly_gaps_filled"] == 1 + len(window)
+        # Locations missing different spans are fetched separately
+        assert mock_provider.get_daily_history_batch.call_count == 2
+
+        for geo in (GEO, other):
+            daily = await DailyHistory.find_one(DailyHistory.location == geo)
+            assert [obs.date for obs in daily.observations] == window
+            assert await HourlyHistory.find(HourlyHistory.location == geo).count() == len(window)
+
+        with patch("src.services.jobs.WeatherClientFactory.get_provider", return_value=mock_provider):
+            report = await repair_history_gaps(config.OM_CACHE_VARIABLES)
+        assert report["locations_with_gaps"] == 0
+
+    @pytest.mark.anyio
+    async def test_initial_fetch_has_no_gaps(self, mock_provider):
+        # A freshly cached location holds history up to the archive lag only
+        start, end = initial_history_bounds()
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        await CachedLocation(name="Farm", location=GEO).insert()
+        await DailyHistory(
+            location=GEO,
+            date_range={"start": start, "end": end},
+            observations=[DailyObservation(date=d, values={}) for d in days],
+            fetched_at=datetime.now(),
+        ).insert()
+        for d in days:
+            await HourlyHistory(location=GEO, date=d, observations=[], fetched_at=datetime.now()).insert()
+
+        with patch("src.services.jobs.WeatherClientFactory.get_provider", return_value=mock_provider):
+            report = await repair_history_gaps(config.OM_CACHE_VARIABLES)
+
+        assert report["locations_with_gaps"] == 0
+        mock_provider.get_daily_history_batch.assert_not_called()
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src import scheduler as scheduler_module
+from src.models.leader import SchedulerLease
+from src.models.scheduler import ParcelSchedule
+from src.services.leader import LeaderElection
+
+
+NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TestLeaderElection:
+    """
+    Tests for the Mongo lease electing the instance that runs the scheduled jobs.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        await SchedulerLease.find_all().delete()
+
+    @staticmethod
+    def _instances(n):
+        return [LeaderElection("scheduler", instance_id=f"instance-{i}", ttl_seconds=30) for i in range(n)]
+
+    @pytest.mark.anyio
+    async def test_single_leader_among_instances(self):
+        instances = self._instances(3)
+        runs = 0
+        # Every instance renews every 10 seconds and runs the job when leading
+        for step in range(30):
+            now = NOW + timedelta(seconds=10 * step)
+            for instance in instances:
+                if await instance.acquire_or_renew(now):
+                    runs += 1
+
+        assert runs == 30
+        assert [instance.is_leader_at(NOW + timedelta(minutes=5)) for instance in instances] == [
+            True, False, False
+        ]
+        assert await SchedulerLease.count() == 1
+
+    @pytest.mark.anyio
+    async def test_follower_takes_over_an_expired_lease(self):
+        leader, follower = self._instances(2)
+        assert await leader.acquire_or_renew(NOW)
+        assert not await follower.acquire_or_renew(NOW + timedelta(seconds=29))
+
+        # The leader stopped renewing, it steps down before the follower takes over
+        assert not leader.is_leader_at(NOW + timedelta(seconds=30))
+        assert await follower.acquire_or_renew(NOW + timedelta(seconds=31))
+        assert not await leader.acquire_or_renew(NOW + timedelta(seconds=32))
+
+    @pytest.mark.anyio
+    async def test_released_lease_is_taken_at_once(self):
+        leader, follower = self._instances(2)
+        now = datetime.now(timezone.utc)
+        assert await leader.acquire_or_renew(now)
+
+        await leader.release()
+
+        assert not leader.is_leader
+        assert await follower.acquire_or_renew(now + timedelta(seconds=1))
+
+    @pytest.mark.anyio
+    async def test_leader_keeps_lease_until_expiry_when_mongo_fails(self):
+        leader = self._instances(1)[0]
+        assert await leader.acquire_or_renew(NOW)
+
+        with patch.object(SchedulerLease, "get_motor_collection", side_effect=RuntimeError("Mongo down")):
+            assert await leader.acquire_or_renew(NOW + timedelta(seconds=10))
+            assert not await leader.acquire_or_renew(NOW + timedelta(seconds=31))
+
+
+class TestLeaderOnlyJobs:
+    """
+    Tests for running the scheduled work on the leading instance only.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        scheduler_module.parcel_wheel.clear()
+        scheduler_module.scheduler.remove_all_jobs()
+        await SchedulerLease.find_all().delete()
+        await ParcelSchedule.find_all().delete()
+
+    @pytest.mark.anyio
+    async def test_jobs_are_skipped_on_followers(self):
+        job = AsyncMock()
+        wrapped = scheduler_module.leader_only(job)
+        leader, follower = (LeaderElection("scheduler", instance_id=f"instance-{i}") for i in range(2))
+        await leader.acquire_or_renew()
+        await follower.acquire_or_renew()
+
+        for election in (leader, follower):
+            with patch.object(scheduler_module, "election", election):
+                await wrapped("arg")
+
+        job.assert_awaited_once_with("arg")
+
+    @pytest.mark.anyio
+    async def test_leader_jobs_start_on_takeover_only(self):
+        fc_client = SimpleNamespace(fetch_locations=AsyncMock(return_value=[]))
+        app = SimpleNamespace(state=SimpleNamespace(fc_client=fc_client, uavmodels=[]))
+        other = LeaderElection("scheduler", instance_id="other")
+        election = LeaderElection("scheduler", instance_id="this")
+
+        with patch.object(scheduler_module, "election", election):
+            await other.acquire_or_renew()
+            await scheduler_module.maintain_leadership(app)
+            assert scheduler_module.scheduler.get_jobs() == []
+
+            await other.release()
+            await scheduler_module.maintain_leadership(app)
+            await scheduler_module.maintain_leadership(app)
+
+        fc_client.fetch_locations.assert_awaited_once()
+        assert {job.id for job in scheduler_module.scheduler.get_jobs()} == {
+            "parcel_wheel_tick", "update_sliding_windows", "repair_history_gaps",
+            "repair_history_gaps_startup", "resume_onboarding_jobs", "refresh_locations", "refresh_machines",
+            "drain_outbox",
+        }
@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.core.spatial_index import location_index
+from src.models.history_data import CachedLocation, DailyHistory, get_utc_now
+from src.models.onboarding import OnboardingJob, OnboardingResultStatus, OnboardingStatus
+from src.schemas.history_data import CachedLocationIn
+from src.services import onboarding
+
+
+class TestResumeStaleJobs:
+    """
+    Tests for resuming onboarding jobs left unfinished by a stopped instance.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        location_index.clear()
+        await OnboardingJob.find_all().delete()
+        await CachedLocation.find_all().delete()
+        await DailyHistory.find_all().delete()
+
+    @pytest.fixture
+    def mock_provider(self):
+        provider = AsyncMock()
+        provider.get_daily_history_batch.side_effect = lambda coords, *args: [[] for _ in coords]
+        provider.get_hourly_history_batch.side_effect = lambda coords, *args: [[] for _ in coords]
+        with patch("src.services.onboarding.WeatherClientFactory.get_provider", return_value=provider):
+            yield provider
+
+    # A job whose instance stopped after registering its first location and
+    # caching part of its history
+    async def _interrupted_job(self, updated_at):
+        job = await onboarding.create_job([
+            CachedLocationIn(name="Farm A", lat=38.25, lon=21.74),
+            CachedLocationIn(name="Farm B", lat=38.5, lon=22.0),
+            CachedLocationIn(name="Farm C", lat=39.0, lon=22.5),
+        ])
+        geo = {"type": "Point", "coordinates": [21.74, 38.25]}
+        location = await CachedLocation(name="Farm A", location=geo).insert()
+        await DailyHistory(
+            location=geo, date_range={"start": date(2024, 1, 1), "end": date(2024, 1, 2)}, observations=[],
+            fetched_at=get_utc_now(),
+        ).insert()
+        job.status = OnboardingStatus.RUNNING
+        job.results[0].location_id = str(location.id)
+        job.results[2].status = OnboardingResultStatus.FAILED
+        job.updated_at = updated_at
+        await job.save()
+        return job
+
+    @pytest.mark.anyio
+    async def test_stale_job_is_resumed(self, mock_provider):
+        job = await self._interrupted_job(get_utc_now() - timedelta(hours=1))
+
+        await onboarding.resume_stale_jobs()
+
+        job = await OnboardingJob.get(job.id)
+        assert job.status == OnboardingStatus.COMPLETED
+        assert [r.status for r in job.results] == [
+            OnboardingResultStatus.CACHED, OnboardingResultStatus.CACHED, OnboardingResultStatus.FAILED
+        ]
+        # The partly cached location was rolled back and onboarded once more
+        assert await CachedLocation.find_all().count() == 2
+        assert await DailyHistory.find_all().count() == 2
+        assert mock_provider.get_daily_history_batch.call_args.args[0] == [(38.25, 21.74), (38.5, 22.0)]
+
+        # Finished jobs are not resumed again
+        await onboarding.resume_stale_jobs()
+        mock_provider.get_daily_history_batch.assert_called_once()
+
+    @pytest.mark.anyio
+    async def test_job_of_live_instance_is_left_running(self, mock_provider):
+        job = await self._interrupted_job(get_utc_now())
+
+        await onboarding.resume_stale_jobs()
+
+        assert (await OnboardingJob.get(job.id)).status == OnboardingStatus.RUNNING
+        mock_provider.get_daily_history_batch.assert_not_called()
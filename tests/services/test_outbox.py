@@ -0,0 +1,171 @@
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+from src.models.outbox import OutboxMessage, OutboxStatus
+from src.services import outbox
+
+
+def messages(n, start=0, status="OK"):
+    return [(f"key-{i}", {"title": f"observation {i}: {status}"}, status) for i in range(start, start + n)]
+
+
+class FarmCalendar:
+    """
+    Delivery callback standing in for Farm Calendar, optionally down or rejecting some keys.
+    """
+
+    def __init__(self, down=False, rejected=()):
+        self.down = down
+        self.rejected = set(rejected)
+        self.delivered = []
+        self.calls = 0
+
+    async def __call__(self, batch):
+        self.calls += 1
+        errors, remote_ids = {}, {}
+        for message in batch:
+            key = message["key"]
+            if self.down or key in self.rejected:
+                errors[key] = "Service unavailable (Farm Calendar)"
+            else:
+                self.delivered.append((key, message["payload"], message.get("remote_id")))
+                remote_ids[key] = f"urn:farmcalendar:Observation:{key}"
+        return errors, remote_ids
+
+
+class TestOutbox:
+    """
+    Tests for queueing, delivering, retrying and dead-lettering Farm Calendar observations.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        await OutboxMessage.find_all().delete()
+
+    async def _make_due(self):
+        await OutboxMessage.get_motor_collection().update_many(
+            {"status": OutboxStatus.PENDING.value}, {"$set": {"next_attempt_at": datetime.now(timezone.utc)}}
+        )
+
+    @pytest.mark.anyio
+    async def test_unchanged_messages_are_suppressed(self):
+        assert await outbox.enqueue(messages(3)) == {"enqueued": 3, "changed": 0, "suppressed": 0}
+        report = await outbox.enqueue(messages(3) + messages(2, start=3))
+
+        assert report == {"enqueued": 2, "changed": 0, "suppressed": 3}
+        assert await OutboxMessage.count() == 5
+
+    @pytest.mark.anyio
+    async def test_changed_messages_are_delivered_again(self):
+        farm_calendar = FarmCalendar()
+        await outbox.enqueue(messages(3))
+        await outbox.drain(farm_calendar)
+
+        # Next forecast run, one timestep changed its status
+        report = await outbox.enqueue(messages(1, status="NOT OK") + messages(2, start=1))
+        assert report == {"enqueued": 0, "changed": 1, "suppressed": 2}
+        message = await OutboxMessage.find_one(OutboxMessage.key == "key-0")
+        assert message.status == OutboxStatus.PENDING
+        assert message.remote_id == "urn:farmcalendar:Observation:key-0"
+
+        await outbox.drain(farm_calendar)
+        assert farm_calendar.delivered[3:] == [
+            ("key-0", {"title": "observation 0: NOT OK"}, "urn:farmcalendar:Observation:key-0")
+        ]
+        stats = await outbox.outbox_stats()
+        assert stats["suppressed"] >= 2
+        assert stats["changed"] >= 1
+
+    @pytest.mark.anyio
+    async def test_drain_delivers_in_batches(self):
+        await outbox.enqueue(messages(250))
+        farm_calendar = FarmCalendar()
+
+        with patch.object(outbox.config, "OUTBOX_BATCH_SIZE", 100):
+            report = await outbox.drain(farm_calendar)
+
+        assert report == {"delivered": 250, "failed": 0, "dead_lettered": 0}
+        assert farm_calendar.calls == 3
+        assert len({key for key, _, _ in farm_calendar.delivered}) == 250
+        assert await OutboxMessage.find(OutboxMessage.status == OutboxStatus.DELIVERED).count() == 250
+        assert await outbox.drain(farm_calendar) == {"delivered": 0, "failed": 0, "dead_lettered": 0}
+
+    @pytest.mark.anyio
+    async def test_failed_messages_back_off(self):
+        await outbox.enqueue(messages(4))
+        farm_calendar = FarmCalendar(rejected={"key-1"})
+
+        report = await outbox.drain(farm_calendar)
+
+        assert report == {"delivered": 3, "failed": 1, "dead_lettered": 0}
+        message = await OutboxMessage.find_one(OutboxMessage.key == "key-1")
+        assert message.attempts == 1
+        assert message.last_error == "Service unavailable (Farm Calendar)"
+        next_attempt_at = message.next_attempt_at.replace(tzinfo=timezone.utc)
+        assert (next_attempt_at - datetime.now(timezone.utc)).total_seconds() > 20
+        # Not due yet
+        assert (await outbox.drain(farm_calendar))["failed"] == 0
+
+    @pytest.mark.anyio
+    async def test_outage_keeps_messages_until_farm_calendar_is_back(self):
+        await outbox.enqueue(messages(150))
+        farm_calendar = FarmCalendar(down=True)
+
+        with patch.object(outbox.config, "OUTBOX_BATCH_SIZE", 100):
+            report = await outbox.drain(farm_calendar)
+            # A batch failing as a whole stops the drain instead of hammering Farm Calendar
+            assert farm_calendar.calls == 1
+            assert report["failed"] == 100
+
+            stats = await outbox.outbox_stats()
+            assert stats["pending"] == 150
+
+            farm_calendar.down = False
+            await self._make_due()
+            report = await outbox.drain(farm_calendar)
+
+        assert report["delivered"] == 150
+        assert (await outbox.outbox_stats())["pending"] == 0
+
+    @pytest.mark.anyio
+    async def test_messages_are_dead_lettered_after_max_attempts(self):
+        await outbox.enqueue(messages(2))
+        farm_calendar = FarmCalendar(rejected={"key-0"})
+
+        with patch.object(outbox.config, "OUTBOX_MAX_ATTEMPTS", 3):
+            for _ in range(5):
+                await outbox.drain(farm_calendar)
+                await self._make_due()
+
+        message = await OutboxMessage.find_one(OutboxMessage.key == "key-0")
+        assert message.status == OutboxStatus.DEAD
+        assert message.attempts == 3
+        stats = await outbox.outbox_stats()
+        assert stats["dead"] == 1
+        assert stats["pending"] == 0
+
+    @pytest.mark.anyio
+    async def test_dead_lettered_messages_are_not_suppressed(self):
+        await outbox.enqueue(messages(2))
+        farm_calendar = FarmCalendar(rejected={"key-0"})
+        with patch.object(outbox.config, "OUTBOX_MAX_ATTEMPTS", 1):
+            await outbox.drain(farm_calendar)
+
+        # Next forecast run, the status of the dead-lettered observation is unchanged
+        report = await outbox.enqueue(messages(2))
+        assert report == {"enqueued": 0, "changed": 1, "suppressed": 1}
+        message = await OutboxMessage.find_one(OutboxMessage.key == "key-0")
+        assert message.status == OutboxStatus.PENDING
+        assert message.attempts == 0
+
+        farm_calendar.rejected.clear()
+        await outbox.drain(farm_calendar)
+        assert [key for key, _, _ in farm_calendar.delivered] == ["key-1", "key-0"]
+
+    def test_retry_delay_doubles_up_to_an_hour(self):
+        with patch.object(outbox.config, "OUTBOX_RETRY_BASE_SECONDS", 30):
+            delays = [outbox.retry_delay(attempts).total_seconds() for attempts in (1, 2, 3, 10)]
+        assert delays == [30, 60, 120, 3600]
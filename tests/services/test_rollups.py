@@ -0,0 +1,133 @@
+import pytest
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from src.models.history_data import ROLLUP_KEY, HistoryRollup, HourlyHistory, HourlyObservation
+from src.schemas.history_data import HourlyObservationOut, RollupResolution
+from src.services.rollups import merge, period_bounds, rollup_observations, summarize, update_rollups
+
+GEO = {"type": "Point", "coordinates": [-74.0060, 40.7128]}
+
+
+def hours(day, temperatures):
+    return [
+        HourlyObservation(timestamp=datetime.combine(day, datetime.min.time()) + timedelta(hours=i),
+                          values={"temperature_2m": t, "rain": 0.5})
+        for i, t in enumerate(temperatures)
+    ]
+
+
+class TestRollupAggregation:
+    """
+    Tests for the in-memory summary helpers.
+    """
+
+    def test_period_bounds(self):
+        day = date(2024, 2, 14)
+        assert period_bounds(day, RollupResolution.DAILY) == (day, day)
+        assert period_bounds(day, RollupResolution.WEEKLY) == (date(2024, 2, 12), date(2024, 2, 18))
+        assert period_bounds(day, RollupResolution.MONTHLY) == (date(2024, 2, 1), date(2024, 2, 29))
+        assert period_bounds(date(2024, 12, 31), RollupResolution.MONTHLY) == (date(2024, 12, 1), date(2024, 12, 31))
+
+    def test_summarize_skips_missing_values(self):
+        stats = summarize([{"t": 1.0, "r": None}, {"t": 3.0, "r": None}])
+        assert stats["t"] == {"min": 1.0, "max": 3.0, "mean": 2.0, "sum": 4.0, "count": 2}
+        assert stats["r"] == {"min": None, "max": None, "mean": None, "sum": None, "count": 0}
+
+    def test_merge_equals_summary_of_all_values(self):
+        first, second = [{"t": 1.0}, {"t": 2.0}], [{"t": 6.0}]
+        assert merge([summarize(first), summarize(second)]) == summarize(first + second)
+
+    def test_rollup_observations_groups_by_period(self):
+        observations = [
+            HourlyObservationOut(**obs.model_dump())
+            for day in (date(2024, 1, 31), date(2024, 2, 1))
+            for obs in hours(day, [1.0, 3.0])
+        ]
+        monthly = rollup_observations(observations, RollupResolution.MONTHLY, ["temperature_2m"])
+        assert [r.period_start for r in monthly] == [date(2024, 1, 1), date(2024, 2, 1)]
+        assert list(monthly[0].values) == ["temperature_2m"]
+        assert monthly[0].values["temperature_2m"]["mean"] == 2.0
+
+
+class TestRollupUpdates:
+    """
+    Tests for the incremental rollup updates stored in MongoDB.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        await HourlyHistory.find_all().delete()
+        await HistoryRollup.find_all().delete()
+
+    async def _insert_day(self, day, temperatures):
+        await HourlyHistory(location=GEO, date=day, observations=hours(day, temperatures),
+                            fetched_at=datetime.now()).insert()
+
+    @pytest.mark.anyio
+    async def test_rollups_are_updated_incrementally(self):
+        lon, lat = GEO["coordinates"]
+        await self._insert_day(date(2024, 1, 1), [0.0, 10.0])
+        await update_rollups({(lon, lat): [date(2024, 1, 1)]})
+
+        # A later day of the same week only recomputes from the stored daily rollups
+        await self._insert_day(date(2024, 1, 2), [20.0, 30.0])
+        await update_rollups({(lon, lat): [date(2024, 1, 2)]})
+
+        assert await HistoryRollup.find(HistoryRollup.resolution == "daily").count() == 2
+        weekly = await HistoryRollup.find_one(HistoryRollup.resolution == "weekly")
+        assert (weekly.period_start, weekly.period_end) == (date(2024, 1, 1), date(2024, 1, 7))
+        assert weekly.values["temperature_2m"] == {"min": 0.0, "max": 30.0, "mean": 15.0, "sum": 60.0, "count": 4}
+        monthly = await HistoryRollup.find_one(HistoryRollup.resolution == "monthly")
+        assert monthly.values["rain"]["sum"] == 2.0
+
+    @pytest.mark.anyio
+    async def test_rerun_replaces_rollups(self):
+        lon, lat = GEO["coordinates"]
+        await self._insert_day(date(2024, 1, 1), [0.0, 10.0])
+
+        await update_rollups({(lon, lat): [date(2024, 1, 1)]})
+        await update_rollups({(lon, lat): [date(2024, 1, 1)]})
+
+        assert await HistoryRollup.find_all().count() == 3
+        weekly = await HistoryRollup.find_one(HistoryRollup.resolution == "weekly")
+        assert weekly.values["temperature_2m"]["count"] == 2
+
+    @pytest.mark.anyio
+    async def test_locations_sharing_a_coordinate_have_their_own_rollups(self):
+        lon, lat = GEO["coordinates"]
+        other = {"type": "Point", "coordinates": [lon, lat + 1.0]}
+        await self._insert_day(date(2024, 1, 1), [0.0, 10.0])
+        await HourlyHistory(location=other, date=date(2024, 1, 1), observations=hours(date(2024, 1, 1), [5.0]),
+                            fetched_at=datetime.now()).insert()
+
+        await update_rollups({(lon, lat): [date(2024, 1, 1)], (lon, lat + 1.0): [date(2024, 1, 1)]})
+
+        assert await HistoryRollup.find(HistoryRollup.lon == lon).count() == 6
+        other_daily = await HistoryRollup.find_one(HistoryRollup.lat == lat + 1.0, HistoryRollup.resolution == "daily")
+        assert other_daily.values["temperature_2m"]["count"] == 1
+
+
+class TestRollupIndexes:
+    """
+    Tests for the shape of the rollup indexes, which mongomock does not enforce
+    like MongoDB does.
+    """
+
+    def test_unique_key_has_no_array_field(self):
+        unique = [
+            index.document for index in HistoryRollup.Settings.indexes if index.document.get("unique")
+        ]
+        assert len(unique) == 1
+        fields = list(unique[0]["key"])
+        assert fields == [field for field, _ in ROLLUP_KEY]
+        # Array fields make the index multikey, unique per single lon or lat value
+        assert not any(field.startswith("location") for field in fields)
+        for field in ("lon", "lat"):
+            assert HistoryRollup.model_fields[field].annotation == Optional[float]
+
+    def test_key_follows_the_location(self):
+        rollup = HistoryRollup(location=GEO, resolution="daily", period_start=date(2024, 1, 1),
+                               period_end=date(2024, 1, 1))
+        assert [rollup.lon, rollup.lat] == GEO["coordinates"]
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+from src.services.dispatcher import staggered_start
+from src.services.time_wheel import TimeWheel, next_staggered_run
+
+
+NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TestTimeWheel:
+    """
+    Tests for the bucketing, due runs and coalescing of the time wheel.
+    """
+
+    def test_next_staggered_run_follows_the_key_phase(self):
+        interval = timedelta(hours=8)
+        run = next_staggered_run("thi_task_38.0_21.0", interval, NOW)
+        assert NOW <= run < NOW + interval
+        assert (run - staggered_start("thi_task_38.0_21.0", interval)) % interval == timedelta(0)
+
+    def test_only_due_entries_are_popped(self):
+        wheel = TimeWheel(tick_seconds=60, grid_degrees=0.1)
+        wheel.schedule("a", "thi", timedelta(hours=8), {"lat": 38.0, "lon": 21.0}, next_run=NOW)
+        wheel.schedule("b", "thi", timedelta(hours=8), {"lat": 38.0, "lon": 21.0},
+                       next_run=NOW + timedelta(hours=1))
+
+        assert wheel.pop_due(NOW - timedelta(minutes=1)) == []
+        due = wheel.pop_due(NOW)
+        assert [entry.key for entry in due] == ["a"]
+        assert wheel.get("a").next_run == NOW + timedelta(hours=8)
+        assert wheel.next_run() == NOW + timedelta(hours=1)
+
+    def test_missed_runs_are_coalesced(self):
+        wheel = TimeWheel(tick_seconds=60, grid_degrees=0.1)
+        wheel.schedule("a", "thi", timedelta(hours=1), {"lat": 38.0, "lon": 21.0}, next_run=NOW)
+
+        # Down for five and a half hours, a single run catches up
+        due = wheel.pop_due(NOW + timedelta(hours=5, minutes=30))
+        assert len(due) == 1
+        assert wheel.get("a").next_run == NOW + timedelta(hours=6)
+        assert wheel.pop_due(NOW + timedelta(hours=5, minutes=59)) == []
+
+    def test_removed_entries_are_not_run(self):
+        wheel = TimeWheel(tick_seconds=60, grid_degrees=0.1)
+        wheel.schedule("a", "thi", timedelta(hours=1), {"lat": 38.0, "lon": 21.0}, next_run=NOW)
+        wheel.schedule("b", "thi", timedelta(hours=1), {"lat": 38.0, "lon": 21.0}, next_run=NOW)
+        wheel.remove("a")
+
+        assert [entry.key for entry in wheel.pop_due(NOW)] == ["b"]
+        assert "a" not in wheel
+        assert len(wheel) == 1
+
+    def test_due_batches_group_by_kind_and_grid_cell(self):
+        wheel = TimeWheel(tick_seconds=60, grid_degrees=0.1)
+        parcels = {
+            "thi_a": ("thi", 38.01, 21.01),
+            "thi_b": ("thi", 38.09, 21.05),
+            "thi_c": ("thi", 38.11, 21.05),
+            "spray_a": ("spray_forecast", 38.01, 21.01),
+        }
+        for key, (kind, lat, lon) in parcels.items():
+            wheel.schedule(key, kind, timedelta(hours=8), {"lat": lat, "lon": lon}, next_run=NOW)
+
+        batches = wheel.due_batches(NOW)
+
+        assert sorted(sorted(e.key for e in entries) for entries in batches.values()) == [
+            ["spray_a"], ["thi_a", "thi_b"], ["thi_c"]
+        ]
+        assert {key[0] for key in batches} == {"thi", "spray_forecast"}
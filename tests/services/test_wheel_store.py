@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+from src.models.scheduler import ParcelSchedule
+from src.services.time_wheel import TimeWheel
+from src.services.wheel_store import load_wheel, save_wheel
+
+
+NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def parcel(i):
+    return {"lat": round(38 + i / 1000, 3), "lon": 21.0, "farm_name": "Farm", "identifier": f"parcel-{i}"}
+
+
+def desired(n, interval=timedelta(hours=8)):
+    return {
+        f"thi_task_{parcel(i)['lat']}_21.0": {"kind": "thi", "interval": interval, "payload": parcel(i)}
+        for i in range(n)
+    }
+
+
+class TestWheelStore:
+    """
+    Tests for persisting the parcel time wheel across restarts.
+    """
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        await ParcelSchedule.find_all().delete()
+
+    @pytest.mark.anyio
+    async def test_restart_resumes_the_timeline(self):
+        wheel = TimeWheel()
+        wheel.reconcile(desired(3), now=NOW)
+        assert await save_wheel(wheel) == {"saved": 3, "deleted": 0}
+        wheel.pop_due(NOW + timedelta(hours=8))
+        assert await save_wheel(wheel) == {"saved": 3, "deleted": 0}
+
+        restarted = TimeWheel()
+        assert await load_wheel(restarted) == 3
+        for entry in wheel.entries():
+            stored = restarted.get(entry.key)
+            assert stored.next_run == entry.next_run
+            assert stored.last_run == NOW + timedelta(hours=8)
+            assert stored.payload == entry.payload
+
+        # The same parcels fetched after the restart change nothing
+        report = restarted.reconcile(desired(3), now=NOW + timedelta(hours=9))
+        assert report == {"added": 0, "removed": 0, "updated": 0, "unchanged": 3}
+        assert await save_wheel(restarted) == {"saved": 0, "deleted": 0}
+
+    @pytest.mark.anyio
+    async def test_removed_parcels_are_deleted(self):
+        wheel = TimeWheel()
+        wheel.reconcile(desired(3), now=NOW)
+        await save_wheel(wheel)
+
+        wheel.reconcile(desired(1), now=NOW)
+        assert await save_wheel(wheel) == {"saved": 0, "deleted": 2}
+        assert await ParcelSchedule.count() == 1
+
+    @pytest.mark.anyio
+    async def test_runs_missed_while_down_are_coalesced(self):
+        wheel = TimeWheel()
+        wheel.reconcile(desired(1), now=NOW)
+        await save_wheel(wheel)
+        next_run = wheel.entries()[0].next_run
+
+        # Down for three days, the 9 missed runs become one on the first tick
+        restarted = TimeWheel()
+        await load_wheel(restarted)
+        later = NOW + timedelta(days=3)
+        assert len(restarted.pop_due(later)) == 1
+        assert restarted.pop_due(later) == []
+        assert later < restarted.entries()[0].next_run <= later + timedelta(hours=8)
+        assert (restarted.entries()[0].next_run - next_run) % timedelta(hours=8) == timedelta(0)
+
+    @pytest.mark.slow
+    @pytest.mark.anyio
+    async def test_startup_reads_all_schedules_with_one_query(self):
+        wheel = TimeWheel()
+        wheel.reconcile(desired(2_000), now=NOW)
+        collection = ParcelSchedule.get_motor_collection()
+
+        with patch.object(collection, "bulk_write", wraps=collection.bulk_write) as bulk_write:
+            await save_wheel(wheel)
+        assert bulk_write.call_count == 1
+
+        restarted = TimeWheel()
+        with patch.object(collection, "find", wraps=collection.find) as find, \
+                patch.object(collection, "find_one", wraps=collection.find_one) as find_one:
+            await load_wheel(restarted)
+
+        assert find.call_count == 1
+        assert find_one.call_count == 0
+        assert len(restarted) == 2_000
@@ -0,0 +1,260 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from src.models.outbox import OutboxMessage
+from src.openagri_services.farmcalendar_service import FarmCalendarServiceClient
+from src.services import outbox
+
+
+def parcel(i, farm):
+    return {
+        "identifier": f"parcel-{i}",
+        "location": {"lat": 38.0 + i / 100, "long": 21.0},
+        "farm": {"@id": f"urn:farmcalendar:Farm:{farm}"},
+    }
+
+
+class FarmCalendarStub:
+    """
+    In-memory Farm Calendar answering parcel and farm lookups, with ETags on farms.
+    """
+
+    def __init__(self, parcels, farms):
+        self.parcels = parcels
+        self.farms = farms
+        self.farm_requests = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/FarmParcels/"):
+            return httpx.Response(200, json={"@graph": self.parcels})
+
+        farm_uuid = path.rstrip("/").split("/")[-1]
+        self.farm_requests.append((farm_uuid, request.headers.get("If-None-Match")))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+        etag = f'"{farm_uuid}-{self.farms[farm_uuid]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, json={"@graph": [{"name": self.farms[farm_uuid]}]}, headers={"ETag": etag})
+
+
+class TestFetchLocations:
+    """
+    Tests for the farm name lookups of the Farm Calendar parcel refresh.
+    """
+
+    @staticmethod
+    def _client(stub):
+        app = SimpleNamespace(state=SimpleNamespace(access_token="token"))
+        client = FarmCalendarServiceClient(app)
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(stub))
+        return client
+
+    @pytest.mark.anyio
+    async def test_each_farm_is_fetched_once_with_bounded_concurrency(self):
+        farms = {f"farm-{i}": f"Farm {i}" for i in range(20)}
+        parcels = [parcel(i, f"farm-{i % 20}") for i in range(200)]
+        stub = FarmCalendarStub(parcels, farms)
+
+        with patch("src.openagri_services.farmcalendar_service.config.FARM_CALENDAR_CONCURRENCY", 4):
+            client = self._client(stub)
+            locations = await client.fetch_locations()
+
+        assert len(locations) == 200
+        assert locations[21]["farm_name"] == "Farm 1"
+        assert sorted(farm for farm, _ in stub.farm_requests) == sorted(farms)
+        assert stub.peak == 4
+
+        # Within the TTL the refresh needs no farm lookups at all
+        await client.fetch_locations()
+        assert len(stub.farm_requests) == 20
+
+    @pytest.mark.anyio
+    async def test_expired_farm_names_are_revalidated(self):
+        stub = FarmCalendarStub([parcel(0, "farm-a"), parcel(1, "farm-b")], {"farm-a": "A", "farm-b": "B"})
+        client = self._client(stub)
+        await client.fetch_locations()
+
+        stub.farms["farm-b"] = "B renamed"
+        with patch("src.openagri_services.farmcalendar_service.config.FARM_NAME_CACHE_SECONDS", 0):
+            locations = await client.fetch_locations()
+
+        assert [location["farm_name"] for location in locations] == ["A", "B renamed"]
+        # The second round sent the ETags, farm-a answered 304 and kept its name
+        assert sorted(stub.farm_requests[2:]) == [("farm-a", '"farm-a-A"'), ("farm-b", '"farm-b-B"')]
+
+    @pytest.mark.anyio
+    async def test_farm_without_name_falls_back(self):
+        stub = FarmCalendarStub([parcel(0, "farm-a")], {"farm-a": "A"})
+        client = self._client(stub)
+
+        async def broken(request):
+            if "/Farm/" in request.url.path:
+                return httpx.Response(200, content=b"not json")
+            return await stub(request)
+
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(broken))
+        locations = await client.fetch_locations()
+
+        assert locations[0]["farm_name"] == "Unknown Farm"
+
+
+class ObservationsStub:
+    """
+    In-memory Farm Calendar recording the observations pushed to it.
+    """
+
+    def __init__(self, failures=None):
+        # Number of times the observation with a given key fails before it is accepted
+        self.failures = dict(failures or {})
+        self.requests = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        key = request.headers.get("Idempotency-Key")
+        self.requests.append((request.method, request.url.path, key, json.loads(request.content)))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if self.failures.get(key):
+            self.failures[key] -= 1
+            return httpx.Response(500, json={"detail": "try again"})
+        return httpx.Response(201, json={"@id": f"urn:farmcalendar:Observation:{key.split(':')[0]}"})
+
+
+class TestPushObservations:
+    """
+    Tests for queueing observations and delivering them concurrently with per item retries.
+    """
+
+    LOCATION = {"lat": 38.25, "lon": 21.74, "farm_name": "Farm", "identifier": "parcel-1"}
+
+    @pytest.fixture(autouse=True)
+    async def clean_db(self, app):
+        yield
+        await OutboxMessage.find_all().delete()
+
+    @staticmethod
+    def _client(stub, spray_forecasts=()):
+        weather_app = SimpleNamespace(ensure_spray_forecast_for_location=AsyncMock(return_value=list(spray_forecasts)))
+        app = SimpleNamespace(
+            state=SimpleNamespace(access_token="token"),
+            weather_app=weather_app,
+            setup_authentication_tokens=AsyncMock(),
+        )
+        client = FarmCalendarServiceClient(app)
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(stub))
+        client.sp_activity_type = "urn:farmcalendar:FarmCalendarActivityType:spray"
+        return client
+
+    @staticmethod
+    def _forecasts(n):
+        start = datetime(2025, 6, 1)
+        return [
+            SimpleNamespace(timestamp=start + timedelta(hours=3 * i), spray_conditions="optimal",
+                            detailed_status={"wind": "ok"})
+            for i in range(n)
+        ]
+
+    @staticmethod
+    def _messages(n):
+        return [{"key": f"key-{i}", "payload": {"title": f"observation {i}"}, "content_hash": "abc"} for i in range(n)]
+
+    @pytest.mark.anyio
+    async def test_forecast_is_queued_once_and_delivered_concurrently(self):
+        stub = ObservationsStub()
+        with patch("src.openagri_services.farmcalendar_service.config.FARM_CALENDAR_CONCURRENCY", 8):
+            client = self._client(stub, self._forecasts(40))
+            await client.send_spray_forecast(self.LOCATION)
+            await client.send_spray_forecast(self.LOCATION)
+            assert stub.requests == []
+            assert await OutboxMessage.count() == 40
+
+            await outbox.drain(client.deliver_observations)
+
+        assert len(stub.requests) == 40
+        assert stub.peak == 8
+        # Every observation is sent with its own key, derived from its result id
+        assert len({key for _, _, key, _ in stub.requests}) == 40
+        assert all(key.startswith(body["hasResult"]["@id"].split(":")[-1]) for _, _, key, body in stub.requests)
+
+        # Pushing the same forecast again does not deliver it twice
+        await client.send_spray_forecast(self.LOCATION)
+        await outbox.drain(client.deliver_observations)
+        assert len(stub.requests) == 40
+
+    @pytest.mark.anyio
+    async def test_only_changed_statuses_are_pushed_again(self):
+        stub = ObservationsStub()
+        forecasts = self._forecasts(10)
+        client = self._client(stub, forecasts)
+        await client.send_spray_forecast(self.LOCATION)
+        await outbox.drain(client.deliver_observations)
+
+        forecasts[4].spray_conditions = "marginal"
+        for forecast in forecasts:
+            forecast.detailed_status = {"wind": "ok", "refreshed": True}
+        with patch("src.openagri_services.farmcalendar_service.config.FARM_CALENDAR_PATCH_CHANGED", "true"):
+            await client.send_spray_forecast(self.LOCATION)
+            await outbox.drain(client.deliver_observations)
+
+        method, path, key, body = stub.requests[-1]
+        assert len(stub.requests) == 11
+        assert body["hasResult"]["hasValue"] == "marginal"
+        # The observation created for that timestep is updated
+        assert method == "PATCH"
+        observation_uuid = body["hasResult"]["@id"].split(":")[-1]
+        assert path.endswith(f"/Observations/{observation_uuid}/")
+        first = next(request for request in stub.requests if request[3]["hasResult"]["@id"].endswith(observation_uuid))
+        assert first[0] == "POST"
+        assert key != first[2]
+
+    @pytest.mark.anyio
+    async def test_failed_item_is_retried_alone(self):
+        stub = ObservationsStub(failures={"key-3:abc": 1})
+        client = self._client(stub)
+
+        errors, remote_ids = await client.deliver_observations(self._messages(10))
+
+        assert errors == {}
+        assert len(remote_ids) == 10
+        assert len(stub.requests) == 11
+        assert [key for _, _, key, _ in stub.requests].count("key-3:abc") == 2
+
+    @pytest.mark.anyio
+    async def test_items_failing_for_good_are_reported(self):
+        stub = ObservationsStub(failures={"key-0:abc": 3})
+        client = self._client(stub)
+
+        with patch("backoff._async.asyncio.sleep", AsyncMock()):
+            errors, _ = await client.deliver_observations(self._messages(5))
+
+        assert list(errors) == ["key-0"]
+        assert len(stub.requests) == 4 + 3
+
+    @pytest.mark.anyio
+    async def test_batch_endpoint_receives_chunks(self):
+        stub = ObservationsStub()
+        with patch("src.openagri_services.farmcalendar_service.config.FARM_CALENDAR_BATCH_ENDPOINT",
+                   "/Observations/batch/"):
+            client = self._client(stub)
+            errors, _ = await client.deliver_observations(self._messages(150))
+
+        assert errors == {}
+        assert [(path.endswith("/Observations/batch/"), len(body)) for _, path, _, body in stub.requests] == [
+            (True, 100), (True, 50)
+        ]
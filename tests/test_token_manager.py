@@ -0,0 +1,186 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from src.core import config
+from src.main import create_app
+from src.openagri_services.farmcalendar_service import FarmCalendarServiceClient
+from src.openagri_services.token_manager import TokenManager, token_expiry
+
+
+def make_token(n, expires_in=3600):
+    return jwt.encode({"sub": f"login-{n}", "exp": int(time.time()) + expires_in}, "secret", algorithm="HS256")
+
+
+class GatekeeperStub:
+    """
+    Gatekeeper login handing out numbered tokens, slow enough for callers to pile up.
+    """
+
+    def __init__(self, expires_in=3600, fail=False):
+        self.expires_in = expires_in
+        self.fail = fail
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise httpx.ConnectError("gatekeeper down")
+        return make_token(self.calls, self.expires_in), f"refresh-{self.calls}"
+
+
+class TestTokenManager:
+    """
+    Tests for the single-flight, ahead of expiry renewal of the service token.
+    """
+
+    def test_token_expiry(self):
+        token = make_token(1, expires_in=100)
+        assert token_expiry(token) == pytest.approx(time.time() + 100, abs=2)
+        assert token_expiry("not-a-jwt") is None
+
+    @pytest.mark.anyio
+    async def test_concurrent_callers_share_one_login(self):
+        login = GatekeeperStub()
+        manager = TokenManager(login, refresh_margin_seconds=60)
+
+        tokens = await asyncio.gather(*(manager.get_token() for _ in range(100)))
+
+        assert login.calls == 1
+        assert set(tokens) == {manager.access_token}
+        assert manager.refresh_token == "refresh-1"
+
+    @pytest.mark.anyio
+    async def test_fresh_token_is_reused(self):
+        login = GatekeeperStub()
+        manager = TokenManager(login, refresh_margin_seconds=60)
+
+        first = await manager.get_token()
+        assert await manager.get_token() == first
+        assert login.calls == 1
+
+    @pytest.mark.anyio
+    async def test_renews_before_expiry(self):
+        # Valid for another 30 s, within the 60 s margin
+        login = GatekeeperStub(expires_in=30)
+        manager = TokenManager(login, refresh_margin_seconds=60)
+        first = await manager.get_token()
+
+        login.expires_in = 3600
+        second = await manager.get_token()
+
+        assert second != first
+        assert login.calls == 2
+        assert await manager.get_token() == second
+        assert login.calls == 2
+
+    @pytest.mark.anyio
+    async def test_invalidate_only_the_current_token(self):
+        login = GatekeeperStub()
+        manager = TokenManager(login, refresh_margin_seconds=60)
+        first = await manager.get_token()
+
+        manager.invalidate(first)
+        tokens = await asyncio.gather(*(manager.get_token() for _ in range(50)))
+        assert login.calls == 2
+        assert set(tokens) == {manager.access_token}
+
+        # Late 401s of requests sent with the replaced token do not log in again
+        manager.invalidate(first)
+        await manager.get_token()
+        assert login.calls == 2
+
+    @pytest.mark.anyio
+    async def test_failed_login_reaches_every_caller_and_is_retried(self):
+        login = GatekeeperStub(fail=True)
+        manager = TokenManager(login, refresh_margin_seconds=60)
+
+        results = await asyncio.gather(*(manager.get_token() for _ in range(10)), return_exceptions=True)
+        assert login.calls == 1
+        assert all(isinstance(r, httpx.ConnectError) for r in results)
+
+        login.fail = False
+        assert await manager.get_token() == manager.access_token
+        assert login.calls == 2
+
+    @pytest.mark.anyio
+    async def test_cancelled_caller_does_not_cancel_the_login(self):
+        login = GatekeeperStub()
+        manager = TokenManager(login, refresh_margin_seconds=60)
+
+        impatient = asyncio.create_task(manager.get_token())
+        waiting = asyncio.create_task(manager.get_token())
+        await asyncio.sleep(0)
+        impatient.cancel()
+
+        assert await waiting == manager.access_token
+        assert login.calls == 1
+
+
+class TestClientAuthentication:
+    """
+    Tests for the service clients renewing their token through the app's TokenManager.
+    """
+
+    @staticmethod
+    def _client(login, stub):
+        app = SimpleNamespace(state=SimpleNamespace())
+        app.state.token_manager = TokenManager(login, refresh_margin_seconds=60)
+        client = FarmCalendarServiceClient(app)
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(stub))
+        return client
+
+    @pytest.mark.anyio
+    async def test_rejected_token_triggers_a_single_login(self):
+        login = GatekeeperStub()
+
+        async def stub(request):
+            token = request.headers["Authorization"].removeprefix("Bearer ")
+            if jwt.decode(token, options={"verify_signature": False})["sub"] == "login-1":
+                # Gatekeeper revoked the first token
+                return httpx.Response(401)
+            return httpx.Response(200, json={"@graph": [{"model": "DJI"}]})
+
+        client = self._client(login, stub)
+        with patch("backoff._async.asyncio.sleep", AsyncMock()):
+            results = await asyncio.gather(*(client.fetch_uavs() for _ in range(50)))
+
+        assert results == [["DJI"]] * 50
+        assert login.calls == 2
+
+    @pytest.mark.anyio
+    async def test_unavailable_gatekeeper_is_a_service_error(self):
+        async def stub(request):
+            return httpx.Response(200, json={"@graph": []})
+
+        client = self._client(GatekeeperStub(fail=True), stub)
+        with pytest.raises(HTTPException) as exc_info:
+            await client.get("/AgriculturalMachines/")
+        assert exc_info.value.status_code == 503
+
+    @pytest.mark.anyio
+    async def test_route_registration_logout_invalidates_the_shared_token(self):
+        login = GatekeeperStub()
+        gk_client = AsyncMock()
+        gk_client.gk_service_directory.return_value = []
+
+        with patch.object(config, "GATEKEEPER_URL", "http://gatekeeper"):
+            app = create_app()
+        register_routes = next(
+            handler for handler in app.router.on_startup if handler.func.__name__ == "register_routes"
+        )
+        with patch("src.core.app.create_gk_jwt_tokens", login), \
+                patch("src.core.app.GatekeeperServiceClient", return_value=gk_client):
+            await register_routes()
+            gk_client.gk_logout.assert_awaited_once_with("refresh-1")
+            # The logged out token is not handed to the service clients
+            token = await app.state.token_manager.get_token()
+        assert jwt.decode(token, options={"verify_signature": False})["sub"] == "login-2"
+        assert login.calls == 2